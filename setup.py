@@ -14,6 +14,7 @@ setup(
     install_requires=[
         'argparse',
         'Pillow',
+        'numpy',
 
         # Optional for sysinfo tab
         #'psutil',
@@ -21,9 +22,6 @@ setup(
 
         # Optional for uptime tab
         #'httplib2',
-
-        # Optional for bitcoin tab
-        #'python-jsonrpc',
     ],
 
     entry_points={
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""
+Measures how fast each tab and the header are rendered and how much they send
+to the screen, using an emulated screen and stub servers instead of real ones.
+
+    python benchmark.py --output before.json
+    (make changes)
+    python benchmark.py --compare before.json
+
+The stub servers are also used by the tests of the clients the tabs use to talk
+to servers, see tests/test_clients.py.
+"""
+
+from context import Screen, ScreenContext
+from writer import PROFILES, DEFAULT_PROFILE
+from header import Header
+from httpcache import CachedResource
+
+from tabs.hello import HelloTab
+from tabs.sysinfo import SystemStats, DiskUsage
+from tabs.uptime import WebsiteUptime
+from tabs.bitcoin import Bitcoind, BitcoinPrice
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+# Seconds between frames as seen by the tabs, like in showtime.py
+FRAME_INTERVAL = 0.1
+
+# How many seconds the stub server takes to answer on paths starting with /slow
+SLOW_RESPONSE = 0.5
+
+# ETag of the ticker on paths starting with /cached
+TICKER_ETAG = '"ticker-1"'
+
+# Metrics where a lower value is better, the rest are better when higher
+LOWER_IS_BETTER = set(["bytes_per_frame", "escapes_per_frame", "sleep_per_frame",
+                       "cpu_per_frame", "first_frame_bytes", "collect_seconds"])
+
+# Metrics that depend on how busy the machine is, compared with a separate threshold
+TIMING_METRICS = set(["fps", "cpu_per_frame"])
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the websites, price sources and bitcoind the tabs talk to.
+    Some paths make it behave like a server that isn't working as it should:
+
+    /close: closes the connection after responding, without telling the client,
+            like a server dropping an idle connection
+    /slow: answers after SLOW_RESPONSE seconds
+    /broken: answers with an error
+    /denied: turns bitcoind calls down like wrong credentials do
+    /cached: the ticker has an ETag and has to be revalidated every time
+    /fresh: the ticker can be cached for a minute
+    """
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        self.server.connections += 1
+
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except ConnectionError:
+            # The client stopped waiting, eg. for a /slow answer
+            pass
+
+    def handle_one_request(self):
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+        if self.path.startswith("/close"):
+            self.close_connection = True
+
+    def do_HEAD(self):
+        self.respond(b"")
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path))
+
+        if self.path.startswith("/slow"):
+            time.sleep(SLOW_RESPONSE)
+
+        if self.path.startswith("/broken"):
+            self.send_error(500)
+            return
+
+        if "/ticker" not in self.path:
+            self.respond(b"OK")
+            return
+
+        headers = {}
+
+        if self.path.startswith("/cached"):
+            if self.headers.get("If-None-Match") == TICKER_ETAG:
+                self.server.not_modified += 1
+
+                self.send_response(304)
+                self.send_header("ETag", TICKER_ETAG)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            headers = {"ETag": TICKER_ETAG, "Cache-Control": "max-age=0"}
+        elif self.path.startswith("/fresh"):
+            headers = {"Cache-Control": "max-age=60"}
+
+        body = json.dumps({"last": "43000.10", "ask": "43000.50", "bid": "42999.80",
+                           "24h_avg": "42500.00", "high": "43500.00", "low": "42000.00",
+                           "vwap": "42750.00"})
+
+        self.respond(body.encode("utf-8"), "application/json", headers)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        self.server.requests.append((self.command, self.path))
+
+        if self.path.startswith("/denied"):
+            # bitcoind answers without a body
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if isinstance(request, list):
+            response = [self.call(call) for call in request]
+        else:
+            response = self.call(request)
+
+        self.respond(json.dumps(response).encode("utf-8"), "application/json")
+
+    def call(self, request):
+        """
+        Returns the JSON-RPC response of a bitcoind call
+        """
+        results = {"getblockcount": 800000,
+                   "getnetworkinfo": {"connections": 10, "connections_in": 4, "connections_out": 6,
+                                      "localaddresses": [{"address": "127.0.0.1"}]},
+                   "getmempoolinfo": {"size": 1234},
+                   "getbestblockhash": "00" * 32,
+                   "getblockheader": {"time": int(time.time()) - 120},
+                   "getpeerinfo": []}
+
+        if request["method"] not in results:
+            return {"id": request["id"], "result": None,
+                    "error": {"code": -32601, "message": "Method not found"}}
+
+        return {"id": request["id"], "result": results[request["method"]], "error": None}
+
+    def respond(self, body, content_type="text/plain", headers={}):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    """
+    Starts the stub server in a background thread and returns it. Its URL
+    is server.url, and it counts the connections and requests it gets.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+
+    server.url = "http://127.0.0.1:%d" % server.server_address[1]
+
+    # Connections opened to the server, (method, path) of the requests made
+    # and how many of them were answered with 304 Not Modified
+    server.connections = 0
+    server.requests = []
+    server.not_modified = 0
+
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+
+    return server
+
+def get_price_tab(urls, timeout=5):
+    """
+    Returns a BitcoinPrice tab with as many sources as there are URLs, each
+    fetched from its URL instead of the real source
+    """
+    price = BitcoinPrice()
+
+    price.price_sources = price.price_sources[:len(urls)]
+    price.resources = {}
+
+    for source, url in zip(price.price_sources, urls):
+        source["api_url"] = url
+        price.resources[source["name"]] = CachedResource(url, timeout=timeout)
+
+    return price
+
+def get_scenarios(url):
+    """
+    Returns (name, tab) tuples to benchmark, with the tabs talking to the stub server.
+    A tab of None only renders the header.
+    """
+    # The sources are raced, so keep only one to always draw the same data
+    price = get_price_tab([url + "/ticker/BitcoinAverage"])
+
+    websites = [{"name": "Stub %d" % i, "url": "%s/%d" % (url, i)} for i in range(0, 4)]
+
+    return [("Header", None),
+            ("HelloTab", HelloTab()),
+            ("SystemStats", SystemStats()),
+            ("DiskUsage", DiskUsage()),
+            ("WebsiteUptime", WebsiteUptime({"websites": websites})),
+            ("Bitcoind", Bitcoind({"host": url + "/", "username": "user", "password": "password"})),
+            ("BitcoinPrice", price)]
+
+class FrameClock:
+    def __init__(self):
+        """
+        Given to the tabs in place of time.time(), see Tab.now(), so that every run
+        sees the same times and the output doesn't depend on how fast the frames
+        are rendered
+        """
+        self.start = time.time()
+        self.frame = 0
+
+    def time(self):
+        return self.start + self.frame * FRAME_INTERVAL
+
+def collect(tab):
+    """
+    Collects the tab's data like the CollectorScheduler would.
+    Returns the wall time and CPU time it took.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    if tab is not None and tab.refresh_interval is not None:
+        tab.snapshot = tab.collect()
+
+    return time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def run_scenario(tab, frames, profile, collect_every, repeat):
+    """
+    Renders frames of a tab into an emulated screen repeat times and returns a dict
+    of metrics. The best timings of the runs are used, as the slower runs are slowed
+    down by other things running on the machine.
+    """
+    clock = FrameClock()
+
+    if tab is not None:
+        tab.now = clock.time
+
+    runs = [render_frames(tab, frames, profile, collect_every, clock) for i in range(0, repeat)]
+
+    metrics = runs[0]
+
+    metrics["fps"] = max(run["fps"] for run in runs)
+    metrics["cpu_per_frame"] = min(run["cpu_per_frame"] for run in runs)
+
+    return metrics
+
+def render_frames(tab, frames, profile, collect_every, clock):
+    """
+    Renders frames of a tab once and returns a dict of metrics
+    """
+    clock.frame = 0
+
+    ctx = ScreenContext("emulator", profile)
+    ctx.reset_lcd().set_rotation(Screen.VERTICAL)
+
+    emulator = ctx.port
+    header = Header()
+    title = tab.title if tab is not None else "Header"
+
+    def render():
+        header.render_header(ctx, 0, title, 1)
+
+        if tab is not None:
+            tab.render_tab(ctx)
+
+        ctx.present()
+
+    collect_seconds = collect(tab)[0]
+
+    # The first frame draws everything, so it's measured separately
+    before = emulator.get_stats()
+    render()
+    ctx.flush()
+    first_frame_bytes = emulator.get_stats()["bytes"] - before["bytes"]
+
+    before = emulator.get_stats()
+    collect_wall = 0.0
+    collect_cpu = 0.0
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    for frame in range(0, frames):
+        # Collection happens in the background in showtime.py, don't count it here
+        if collect_every and frame % collect_every == collect_every - 1:
+            wall, cpu = collect(tab)
+            collect_wall += wall
+            collect_cpu += cpu
+
+        clock.frame += 1
+
+        render()
+
+    ctx.flush()
+
+    wall = time.perf_counter() - wall_start - collect_wall
+    cpu = time.process_time() - cpu_start - collect_cpu
+
+    after = emulator.get_stats()
+
+    simulated = after["time"] - before["time"]
+
+    ctx.writer.close()
+
+    return {"fps": frames / wall,
+            # How many frames per second the screen itself could keep up with,
+            # None if nothing was sent
+            "device_fps": frames / simulated if simulated > 0 else None,
+            "bytes_per_frame": float(after["bytes"] - before["bytes"]) / frames,
+            "escapes_per_frame": float(after["escapes"] - before["escapes"]) / frames,
+            "sleep_per_frame": (after["sleep_time"] - before["sleep_time"]) / frames,
+            "cpu_per_frame": max(cpu, 0.0) / frames,
+            "first_frame_bytes": first_frame_bytes,
+            "collect_seconds": collect_seconds}
+
+def compare(results, baseline, threshold, time_threshold):
+    """
+    Returns (scenario, metric, old, new) tuples for metrics that got worse
+    by more than the threshold, a fraction of the old value. Timings use
+    time_threshold instead.
+    """
+    regressions = []
+
+    for name, metrics in results.items():
+        for metric, new in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+
+            # Collecting depends on the network and the system too much to compare
+            if old is None or new is None or metric == "collect_seconds":
+                continue
+
+            allowed = time_threshold if metric in TIMING_METRICS else threshold
+
+            if metric in LOWER_IS_BETTER:
+                worse = new > old * (1 + allowed) and new - old > 1e-6
+            else:
+                worse = new < old * (1 - allowed)
+
+            if worse:
+                regressions.append((name, metric, old, new))
+
+    return regressions
+
+def print_results(results):
+    print("%-14s %10s %10s %10s %10s %10s %10s %12s" % ("", "fps", "device fps", "bytes/fr",
+                                                        "escapes/fr", "sleep/fr", "cpu/fr", "first bytes"))
+
+    for name, metrics in results.items():
+        device_fps = "%.1f" % metrics["device_fps"] if metrics["device_fps"] is not None else "-"
+
+        print("%-14s %10.1f %10s %10.1f %10.1f %9.2fms %9.2fms %12d" % (
+            name, metrics["fps"], device_fps, metrics["bytes_per_frame"],
+            metrics["escapes_per_frame"], metrics["sleep_per_frame"] * 1000,
+            metrics["cpu_per_frame"] * 1000, metrics["first_frame_bytes"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rendering of the tabs")
+    parser.add_argument("--frames", "-n", help="how many frames to render per tab (default=200)",
+                        type=int, default=200)
+    parser.add_argument("--collect-every", help="collect new data every N frames, 0 to never (default=10)",
+                        type=int, default=10)
+    parser.add_argument("--profile", "-P", help="device profile used to pace the output (default=%s)" % DEFAULT_PROFILE,
+                        choices=sorted(PROFILES.keys()), default=DEFAULT_PROFILE)
+    parser.add_argument("--repeat", "-r", help="how many times to render the frames, the best timings are used (default=3)",
+                        type=int, default=3)
+    parser.add_argument("--tab", "-t", help="only benchmark the named tab, can be repeated",
+                        action="append")
+    parser.add_argument("--output", "-o", help="save the results as JSON into this file")
+    parser.add_argument("--compare", "-c", help="compare the results against a JSON file saved earlier")
+    parser.add_argument("--threshold", help="fraction a metric can get worse by before it's a regression (default=0.1)",
+                        type=float, default=0.1)
+    parser.add_argument("--time-threshold", help="same as --threshold, but for fps and CPU time (default=0.25)",
+                        type=float, default=0.25)
+    args = parser.parse_args()
+
+    url = start_stub_server().url
+
+    results = {}
+
+    for name, tab in get_scenarios(url):
+        if args.tab and name not in args.tab:
+            continue
+
+        results[name] = run_scenario(tab, args.frames, PROFILES[args.profile],
+                                     args.collect_every, args.repeat)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"profile": args.profile, "frames": args.frames, "results": results},
+                      f, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+        regressions = compare(results, baseline, args.threshold, args.time_threshold)
+
+        for name, metric, old, new in regressions:
+            print("Regression in %s %s: %.4g -> %.4g" % (name, metric, old, new))
+
+        if regressions:
+            sys.exit(1)
+
+        print("No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+class CollectorScheduler:
+    def __init__(self, tabs, max_workers=4):
+        """
+        Runs the collect() method of every tab in a thread pool once every
+        refresh_interval seconds and publishes the result as the tab's snapshot
+        """
+        self.tabs = [tab for tab in tabs if tab.refresh_interval is not None]
+        
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="collector")
+        
+        # When each tab should be collected next, using time.monotonic()
+        self.next_run = {}
+        
+        # Tabs whose collector is currently running
+        self.running = set()
+        
+        self.condition = threading.Condition()
+        self.stopped = False
+        
+        self.thread = threading.Thread(target=self.run, name="collector-scheduler", daemon=True)
+        
+        # Functions called with the tab whenever its snapshot changes
+        self.listeners = []
+        
+    def add_tab(self, tab):
+        """
+        Starts collecting data for a tab that wasn't known when the scheduler was created
+        """
+        if tab.refresh_interval is None:
+            return self
+        
+        with self.condition:
+            if tab not in self.tabs:
+                self.tabs.append(tab)
+                self.next_run[tab] = time.monotonic()
+                self.condition.notify_all()
+        
+        return self
+    
+    def remove_tab(self, tab):
+        """
+        Stops collecting data for a tab. A collector that is already running is left to finish.
+        """
+        with self.condition:
+            if tab in self.tabs:
+                self.tabs.remove(tab)
+                self.next_run.pop(tab, None)
+                self.condition.notify_all()
+        
+        return self
+        
+    def add_listener(self, listener):
+        """
+        Calls listener(tab) from a collector thread whenever a tab's snapshot changes
+        """
+        self.listeners.append(listener)
+        
+        return self
+        
+    def start(self):
+        """
+        Start collecting data in the background
+        """
+        now = time.monotonic()
+        
+        for tab in self.tabs:
+            self.next_run[tab] = now
+            
+        self.thread.start()
+        
+        return self
+    
+    def stop(self):
+        """
+        Stop collecting data. Collectors that are already running are not waited for.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            
+        self.executor.shutdown(wait=False)
+    
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                timeout = None
+                
+                for tab in self.tabs:
+                    if tab in self.running:
+                        continue
+                    
+                    if self.next_run[tab] <= now:
+                        self.running.add(tab)
+                        self.executor.submit(self.collect, tab)
+                    elif timeout is None or self.next_run[tab] - now < timeout:
+                        timeout = self.next_run[tab] - now
+                        
+                self.condition.wait(timeout)
+    
+    def collect(self, tab):
+        """
+        Runs the tab's collector and publishes the result
+        """
+        start = time.perf_counter()
+        
+        try:
+            previous = tab.snapshot
+            tab.snapshot = tab.collect()
+            
+            if tab.snapshot != previous:
+                for listener in self.listeners:
+                    listener(tab)
+        except Exception as e:
+            # Keep showing the last snapshot
+            print("Couldn't collect data for %s: %s" % (tab.title, e))
+            
+            metrics.COLLECT_FAILURES.inc(tab.title)
+        finally:
+            metrics.COLLECT_SECONDS.observe(time.perf_counter() - start, tab.title)
+            
+            with self.condition:
+                self.running.discard(tab)
+                
+                # The tab may have been removed while it was collected
+                if tab in self.tabs:
+                    self.next_run[tab] = time.monotonic() + tab.refresh_interval
+                    
+                self.condition.notify_all()
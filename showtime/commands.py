@@ -0,0 +1,43 @@
+"""
+Escape sequences understood by the ODROID-SHOW, encoded into bytes ahead of time
+so that they can be queued without any string formatting or encoding
+"""
+
+from functools import lru_cache
+
+RESET = b"\x1Bc"
+ERASE_SCREEN = b"\x1B[2J"
+
+# Sent after image data to prevent glitches when printing text again
+LINEBREAK = b"\n\r"
+
+# Indexed by the colors defined in Screen
+FG_COLORS = tuple(b"\x1B[3%dm" % color for color in range(0, 8))
+BG_COLORS = tuple(b"\x1B[4%dm" % color for color in range(0, 8))
+
+# Indexed by the rotation, 0-3
+ROTATIONS = tuple(b"\x1B[%dr" % rotation for rotation in range(0, 4))
+
+@lru_cache(maxsize=16)
+def get_text_size(size):
+    return b"\x1B[%ds" % size
+
+@lru_cache(maxsize=4096)
+def get_cursor(x, y):
+    """
+    Returns the command moving the cursor to the (x, y) position in pixels
+    """
+    return b"\x1B[%d;%dH" % (x, y)
+
+def get_image_window(x, y, x2, y2):
+    """
+    Returns the command that starts uploading an image into the given window
+    """
+    return b"\x1B[%d;%d,%d;%di" % (x, y, x2, y2)
+
+def encode(command):
+    """
+    Converts a command written as a string, with \\e standing for the escape
+    character, into bytes
+    """
+    return command.replace("\\e", "\x1B").encode("ascii")
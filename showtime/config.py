@@ -1,30 +1,58 @@
-from tabs.hello import HelloTab
-#from odroidshow.tabs.bitcoin import BitcoinPrice, Bitcoind
-from tabs.sysinfo import SystemStats, DiskUsage
-from tabs.uptime import WebsiteUptime
-
-import os
-
-# Add any tabs you want to be visible here
+# Tabs are listed by the dotted path of their class, or as a (path, settings) tuple
+# for tabs that take settings. The module of a tab is only imported once the tab
+# is shown for the first time, so tabs that aren't listed cost nothing.
+# A (path, settings, options) tuple can also override the tab's refresh_interval
+# and redraw_interval, eg. ("tabs.sysinfo.DiskUsage", {}, {"refresh_interval": 30})
+#
+# The same can be written in a TOML or JSON file given with --config, which is
+# reloaded while the program is running, see config.example.toml
 tabs = [
-         HelloTab(),
+         "tabs.hello.HelloTab",
 
          # Track a running Bitcoin node
-         #Bitcoind({"host": "http://127.0.0.1:8332",
-         #          "username": "bitcoinrpc",
-         #          # Read the password from a file
-         #          "password": "password" }),
+         #("tabs.bitcoin.Bitcoind", {"host": "http://127.0.0.1:8332",
+         #                           "username": "bitcoinrpc",
+         #                           # Read the password from a file
+         #                           "password": "password" }),
         
          # A Bitcoin price ticker
-         #BitcoinPrice(),
+         #"tabs.bitcoin.BitcoinPrice",
          
          # Displays CPU, RAM usage and uptime
-         SystemStats(),
+         "tabs.sysinfo.SystemStats",
+         
+         # Displays disk usage. Pseudo file systems such as tmpfs are left out
+         # unless listed, eg. ("tabs.sysinfo.DiskUsage", {"include_fstypes": ["tmpfs"]})
+         "tabs.sysinfo.DiskUsage",
          
-         # Displays disk usage
-         DiskUsage(),
+         # Shows the processes using the most CPU, or memory with {"sort": "rss"}
+         #("tabs.sysinfo.TopProcesses", {"count": 10}),
+         
+         # Shows values pushed by other programs, needs --push-port or --push-socket
+         #("tabs.push.PushTab", {"title": "Jobs",
+         #                       "values": [{"key": "backup.progress", "label": "Backup",
+         #                                   "show": "bar", "max": 100}]}),
          
          # Tracks website uptime
-         WebsiteUptime({"websites": [ {"name": "Google",
-                                       "url": "http://google.com"} ] })
+         ("tabs.uptime.WebsiteUptime", {"websites": [ {"name": "Google",
+                                                       "url": "http://google.com"} ] })
        ]
+
+# To show tabs on several screens from a single process, list the screens here.
+# Tabs listed on more than one screen with the same settings are created and
+# collected only once. Each screen can have:
+#
+#   port: serial port of the screen, as in the --port argument
+#   tabs: tabs shown on the screen (default: the tabs above)
+#   time: for how many seconds a tab is shown (default: the --time argument)
+#   offset: how many seconds later the first tab change happens, so that
+#           screens next to each other don't change tabs at the same time
+#   tab: which tab to start from (default: the --tab argument)
+#   rotation: rotation of the screen, 0-3 (default: 0)
+#   profile, threaded, max_fps, boot_banner: same as the arguments with the same name
+#
+#displays = [{"port": "/dev/ttyUSB0",
+#             "tabs": tabs},
+#            {"port": "/dev/ttyUSB1",
+#             "tabs": tabs,
+#             "offset": 5}]
@@ -0,0 +1,249 @@
+"""
+Config files written in TOML or JSON, as an alternative to config.py that can be
+changed while the program is running. See config.example.toml for the format.
+"""
+
+import json
+import os
+import threading
+
+from collections import namedtuple
+
+from loader import TAB_OPTIONS
+from writer import PROFILES
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Same as the tabs and displays of config.py. displays is None if the config
+# doesn't list any screens.
+Config = namedtuple("Config", ["tabs", "displays"])
+
+# Settings of a screen other than its port and tabs. They can also be set
+# at the top of the file for every screen.
+DISPLAY_SETTINGS = ("time", "offset", "tab", "rotation", "profile", "threaded", "max_fps", "boot_banner")
+
+class ConfigError(Exception):
+    pass
+
+def read_file(path):
+    """
+    Returns the contents of a TOML or JSON file, depending on its extension
+    """
+    with open(path, "rb") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+
+        if tomllib is None:
+            raise ConfigError("Reading TOML needs Python 3.11 or the tomli package, use JSON instead")
+
+        return tomllib.load(f)
+
+def check_keys(table, allowed, where):
+    """
+    Raises a ConfigError if the table has keys that aren't allowed, so that typos
+    don't go unnoticed
+    """
+    if not isinstance(table, dict):
+        raise ConfigError("%s should be a table" % where)
+
+    unknown = sorted(set(table) - set(allowed))
+
+    if unknown:
+        raise ConfigError("%s: unknown setting %s" % (where, ", ".join(unknown)))
+
+def is_number(value):
+    # TOML and JSON booleans are ints in Python
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def is_whole_number(value):
+    return is_number(value) and isinstance(value, int)
+
+def is_banner(value):
+    return isinstance(value, str) and value != "" and all(" " <= c <= "~" for c in value)
+
+def check_settings(table, where):
+    """
+    Raises a ConfigError if the screen settings of the table aren't valid
+    """
+    if "profile" in table and table["profile"] not in PROFILES:
+        raise ConfigError("%s: profile should be one of %s" % (where, ", ".join(sorted(PROFILES))))
+
+    for name in ("time", "tab"):
+        if name in table and (not is_whole_number(table[name]) or table[name] < 1):
+            raise ConfigError("%s: %s should be a whole number larger than 0" % (where, name))
+
+    if "offset" in table and (not is_whole_number(table["offset"]) or table["offset"] < 0):
+        raise ConfigError("%s: offset should be a whole number of seconds" % where)
+
+    if "rotation" in table and (not is_whole_number(table["rotation"]) or table["rotation"] not in (0, 1, 2, 3)):
+        raise ConfigError("%s: rotation should be 0-3" % where)
+
+    if "max_fps" in table and (not is_number(table["max_fps"]) or table["max_fps"] <= 0):
+        raise ConfigError("%s: max_fps should be a number larger than 0" % where)
+
+    if "boot_banner" in table and not is_banner(table["boot_banner"]):
+        raise ConfigError("%s: boot_banner should be a string of printable ASCII characters" % where)
+
+def get_tab_entry(table, where):
+    """
+    Returns a tab declared by a table of the config file in the same form as in config.py
+    """
+    check_keys(table, ("name", "class", "settings") + TAB_OPTIONS, where)
+
+    if not isinstance(table.get("class"), str):
+        raise ConfigError("%s: class should be the dotted path of the tab's class" % where)
+
+    settings = table.get("settings", {})
+
+    if not isinstance(settings, dict):
+        raise ConfigError("%s: settings should be a table" % where)
+
+    options = dict((name, table[name]) for name in TAB_OPTIONS if name in table)
+
+    for name, value in options.items():
+        if not is_number(value) or value <= 0:
+            raise ConfigError("%s: %s should be a positive number" % (where, name))
+
+    if options:
+        return (table["class"], settings, options)
+
+    return (table["class"], settings)
+
+def load_config(path):
+    """
+    Reads a config file and returns a Config. Raises a ConfigError
+    if the file can't be read or isn't valid.
+    """
+    try:
+        data = read_file(path)
+    except (OSError, ValueError) as e:
+        # Syntax errors of both TOML and JSON are ValueErrors
+        raise ConfigError("Couldn't read %s: %s" % (path, e))
+
+    check_keys(data, ("tabs", "displays") + DISPLAY_SETTINGS, path)
+    check_settings(data, path)
+
+    if not isinstance(data.get("tabs"), list) or not data["tabs"]:
+        raise ConfigError("%s: at least one tab should be listed in tabs" % path)
+
+    tabs = []
+
+    # Tabs that have a name, so that screens can refer to them
+    named_tabs = {}
+
+    for i, table in enumerate(data["tabs"]):
+        where = "tabs[%d]" % i
+        entry = get_tab_entry(table, where)
+
+        tabs.append(entry)
+
+        if "name" in table:
+            if table["name"] in named_tabs:
+                raise ConfigError("%s: there's already a tab named %s" % (where, table["name"]))
+
+            named_tabs[table["name"]] = entry
+
+    defaults = dict((name, data[name]) for name in DISPLAY_SETTINGS if name in data)
+
+    if "displays" not in data:
+        if not defaults:
+            return Config(tabs, None)
+
+        # Settings for every screen given as an argument
+        return Config(tabs, [defaults])
+
+    if not isinstance(data["displays"], list) or not data["displays"]:
+        raise ConfigError("%s: at least one screen should be listed in displays" % path)
+
+    displays = []
+
+    for i, table in enumerate(data["displays"]):
+        where = "displays[%d]" % i
+
+        check_keys(table, ("port", "tabs") + DISPLAY_SETTINGS, where)
+        check_settings(table, where)
+
+        if not isinstance(table.get("port"), str):
+            raise ConfigError("%s: port should be given" % where)
+
+        display_config = dict(defaults, **table)
+
+        if "tabs" in table:
+            if not isinstance(table["tabs"], list) or not table["tabs"]:
+                raise ConfigError("%s: tabs should list the names of the tabs shown" % where)
+
+            unknown = [name for name in table["tabs"] if name not in named_tabs]
+
+            if unknown:
+                raise ConfigError("%s: no tab named %s" % (where, ", ".join(map(str, unknown))))
+
+            display_config["tabs"] = [named_tabs[name] for name in table["tabs"]]
+
+        displays.append(display_config)
+
+    if len(set(display_config["port"] for display_config in displays)) != len(displays):
+        raise ConfigError("%s: the same port is listed more than once in displays" % path)
+
+    return Config(tabs, displays)
+
+class ConfigWatcher:
+    def __init__(self, path, on_change, interval=2):
+        """
+        Checks every interval seconds whether the config file has been modified and
+        calls on_change with the new Config if it has. A file that isn't valid is
+        reported and ignored, so the previous config stays in use until it's fixed.
+        """
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+
+        # Modification time and size of the file when it was last read
+        self.signature = self.get_signature()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="config-watcher", daemon=True)
+
+    def get_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # Editors may replace the file, so it can be missing for a moment
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            signature = self.get_signature()
+
+            if signature is None or signature == self.signature:
+                continue
+
+            self.signature = signature
+
+            try:
+                config = load_config(self.path)
+            except ConfigError as e:
+                print("Not reloading the config: %s" % e)
+                continue
+
+            print("Reloading the config from %s" % self.path)
+
+            try:
+                self.on_change(config)
+            except Exception as e:
+                print("Couldn't apply the config: %s" % e)
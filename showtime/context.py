@@ -1,14 +1,13 @@
 import time
-import subprocess
-import tempfile
 import atexit
 import os
 import sys
-import serial
 
-from PIL import Image
+import commands
 
-from utils import split_string_into_chunks
+from imaging import load_rgb565, get_dirty_rects, get_pixel_bytes
+from transport import open_transport
+from writer import SerialWriter, ThreadedSerialWriter, CostCounter, PROFILES, DEFAULT_PROFILE
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib"))
 
@@ -30,13 +29,38 @@ class Screen(object):
     
     WIDTH = 320
     HEIGHT = 240
+    
+    # Size of a character in pixels when the text size is 1
+    CHAR_WIDTH = 6
+    CHAR_HEIGHT = 8
+
+def same_cell(old, new):
+    """
+    Returns True if the cell new would look the same as old when drawn on the screen.
+    A cell is a (glyph, fg color, bg color, text size, x, y) tuple
+    """
+    if old is None:
+        return False
+    
+    if old == new:
+        return True
+    
+    # Empty cells look the same regardless of the text color or size
+    return old[0] == " " and new[0] == " " and old[2] == new[2]
 
 class ScreenContext:
-    def __init__(self, port_name):
+    def __init__(self, port_name, profile=PROFILES[DEFAULT_PROFILE], threaded=False, boot_banner=None):
         self.port_name = port_name
         self.port = None
         
-        self.buffer = ""
+        self.profile = profile
+        self.writer = None
+        
+        # Bytes the firmware sends once it has booted up, if not the ones of the profile
+        self.boot_banner = boot_banner if boot_banner is not None else profile.boot_banner
+        
+        # If True, the port is written to from a separate thread
+        self.threaded = threaded
         
         # Current text size
         self.text_size = 2
@@ -48,6 +72,37 @@ class ScreenContext:
         
         self.characters_on_line = 0
         
+        # Cursor position in pixels
+        self.cursor_x = 0
+        self.cursor_y = 0
+        
+        # Cells known to be on the screen and cells drawn during the current frame,
+        # both keyed by the (x, y) position of each CHAR_WIDTH * CHAR_HEIGHT unit
+        # the cell covers
+        self.front_cells = {}
+        self.back_cells = {}
+        
+        # Cells drawn during the current frame in the order they were drawn
+        self.pending_cells = []
+        
+        # True if the frame being drawn has to draw everything on it, eg. the first
+        # frame of a tab. Otherwise parts that are already on the screen and never
+        # change, such as labels, can be left out, see widgets.Layout.
+        self.redraw_all = True
+        
+        # Cell assumed for units missing from front_cells, None if the screen
+        # content is unknown
+        self.blank_cell = None
+        
+        # RGB565 arrays last uploaded with draw_pixels, keyed by their (x, y) position
+        self.image_regions = {}
+        
+        # State of the screen itself, None if unknown
+        self.device_fg_color = None
+        self.device_bg_color = None
+        self.device_text_size = None
+        self.device_cursor = None
+        
         self.open_port()
     
     def reset_screen(self):
@@ -67,37 +122,46 @@ class ScreenContext:
         for i in range(0, start):
             self.linebreak()
             
+        empty_line = " " * self.get_columns()
+        
         for i in range(0, rows):
-            columns = self.get_columns()
-            empty_line = ""
-            for j in range(0, columns):
-                empty_line += " "
-                
             self.write(empty_line)
     
     def open_port(self):
         """
-        Opens the serial port for writing
+        Opens the serial port, or another transport named by port_name, for writing
+        """
+        self.port = open_transport(self.port_name)
+        
+        if self.threaded:
+            self.writer = ThreadedSerialWriter(self.port, self.profile, self.port_name)
+        else:
+            self.writer = SerialWriter(self.port, self.profile, self.port_name)
+    
+    def wait_until_ready(self):
+        """
+        Waits until the screen has booted up, for at most the boot time
+        of the device profile
         """
-        self.port = serial.Serial(self.port_name, baudrate=500000)
+        self.port.wait_until_ready(self.profile.boot_time, self.boot_banner)
+        
+        return self
     
     def cleanup(self):
         """
         Closes the serial port
         """
-        self.buffer = "\ec\e[2s\e[1r\r"
-        self.sleep(0.1)
+        self.send(commands.RESET + commands.get_text_size(2) + commands.ROTATIONS[1] + b"\r")
+        self.flush().sleep(0.1)
         
+        self.writer.close()
         self.port.close()
         
     def push_to_serial(self):
         """
-        Uploads the current content of the buffer into the screen
+        Uploads everything queued in the writer into the screen
         """
-        self.buffer = self.buffer.replace("\\e", "\x1B")
-        self.port.write(bytes(self.buffer, encoding="ascii"))
-        self.port.flush()
-        self.buffer = ""
+        self.writer.flush()
         
         return self
     
@@ -105,30 +169,42 @@ class ScreenContext:
         """
         Returns the amount of columns, depending on the current text size
         """
-        if self.orientation == Screen.HORIZONTAL:
-            return Screen.WIDTH // (self.text_size * 6)
-        else:
-            return Screen.HEIGHT // (self.text_size * 6)
+        return self.get_width() // (self.text_size * Screen.CHAR_WIDTH)
     
     def get_rows(self):
         """
         Returns the amount of rows, depending on the current text size
         """
+        return self.get_height() // (self.text_size * Screen.CHAR_HEIGHT)
+    
+    def get_width(self):
+        """
+        Returns the width of the screen in pixels, depending on the orientation
+        """
+        if self.orientation == Screen.HORIZONTAL:
+            return Screen.WIDTH
+        else:
+            return Screen.HEIGHT
+    
+    def get_height(self):
+        """
+        Returns the height of the screen in pixels, depending on the orientation
+        """
         if self.orientation == Screen.HORIZONTAL:
-            return Screen.HEIGHT // (self.text_size * 8)
+            return Screen.HEIGHT
         else:
-            return Screen.WIDTH // (self.text_size * 8)
+            return Screen.WIDTH
         
     # WRITING FUNCTIONS HERE
+    #
+    # Text and the state used to draw it is only recorded into back_cells.
+    # Nothing is sent to the screen until present() is called.
     def fg_color(self, color):
         """
         Set foreground/text color to one of seven colors defined in Screen, eg. Screen.CYAN
         """
         self.current_fg_color = color
         
-        self.buffer += "\e[%s%sm" % (str(Screen.FOREGROUND), str(color))
-        self.sleep()
-        
         return self
     
     def bg_color(self, color):
@@ -137,21 +213,17 @@ class ScreenContext:
         """
         self.current_bg_color = color
         
-        self.buffer += "\e[%s%sm" % (str(Screen.BACKGROUND), str(color))
-        self.sleep()
-        
         return self
     
     def linebreak(self):
         """
         Moves cursor to the beginning of the next line
         """
-        self.buffer += f'\n\r'
+        self.cursor_x = 0
+        self.cursor_y += self.text_size * Screen.CHAR_HEIGHT
         
         self.characters_on_line = 0
         
-        self.sleep()
-        
         return self
     
     def write(self, text, split=True):
@@ -162,17 +234,26 @@ class ScreenContext:
         self.characters_on_line += len(text)
         if (self.characters_on_line >= self.get_columns()):
             self.characters_on_line = self.characters_on_line % self.get_columns()
-
-        # If the text sends more characters at once than the device can handle,
-        # artifacts appear. So, split the string into chunks to prevent this.
-        if split:
-            text_chunks = split_string_into_chunks(text, 10)
+        
+        size = self.text_size
+        char_width = size * Screen.CHAR_WIDTH
+        char_height = size * Screen.CHAR_HEIGHT
+        
+        width = self.get_width()
+        height = self.get_height()
+        
+        for glyph in text:
+            # Text that doesn't fit on the screen is never shown
+            if self.cursor_y + char_height <= height:
+                self.draw_cell((glyph, self.current_fg_color, self.current_bg_color,
+                                size, self.cursor_x, self.cursor_y))
             
-            for chunk in text_chunks:
-                self.buffer += chunk
-                self.sleep(len(chunk) * 0.006)
-        else:
-            self.sleep(len(chunk) * 0.006)
+            self.cursor_x += char_width
+            
+            # Move to the next line once the current one is full
+            if self.cursor_x + char_width > width:
+                self.cursor_x = 0
+                self.cursor_y += char_height
             
         return self
     
@@ -186,22 +267,390 @@ class ScreenContext:
         
         empty_line_count = self.get_columns() - ((len(text) + self.characters_on_line) % self.get_columns())
         
-        empty_line = ""
-        for i in range(0, empty_line_count):
-            empty_line += " "
-            
-        buffer_text += empty_line
+        buffer_text += " " * empty_line_count
         
         self.write(buffer_text)
         
         return self
     
+    def draw_cell(self, cell):
+        """
+        Record a (glyph, fg color, bg color, text size, x, y) cell
+        to be drawn on the next present()
+        """
+        # Empty cells are stored without a text color so that they compare
+        # equal regardless of the color that was active
+        if cell[0] == " ":
+            cell = (" ", None) + cell[2:]
+        
+        for unit in self.get_cell_units(cell):
+            self.back_cells[unit] = cell
+            
+        self.pending_cells.append(cell)
+        
+        return self
+    
+    def draw_cells(self, cells):
+        """
+        Record several cells built ahead of time to be drawn on the next present().
+        Unlike with draw_cell, empty cells must already be stored without a text color.
+        """
+        back_cells = self.back_cells
+        
+        for cell in cells:
+            if cell[3] == 1:
+                back_cells[(cell[4] // Screen.CHAR_WIDTH, cell[5] // Screen.CHAR_HEIGHT)] = cell
+            else:
+                for unit in self.get_cell_units(cell):
+                    back_cells[unit] = cell
+        
+        self.pending_cells.extend(cells)
+        
+        return self
+    
+    def get_cell_units(self, cell):
+        """
+        Returns the positions of the CHAR_WIDTH * CHAR_HEIGHT units covered by a cell
+        """
+        size = cell[3]
+        x = cell[4] // Screen.CHAR_WIDTH
+        y = cell[5] // Screen.CHAR_HEIGHT
+        
+        if size == 1:
+            return ((x, y),)
+        
+        return [(x + i, y + j) for j in range(0, size) for i in range(0, size)]
+    
+    def discard_frame(self):
+        """
+        Forgets everything drawn since the last present(), eg. a frame
+        that couldn't be finished, and moves the cursor home
+        """
+        self.back_cells = {}
+        self.pending_cells = []
+        
+        return self.home()
+    
+    def present(self, full=False, clear=False):
+        """
+        Uploads the cells that have changed since the last frame to the screen.
+        If full is True or the writer can't keep up, every cell on the screen
+        is uploaded instead so that any frames still waiting to be sent can be dropped.
+        If clear is True, anything on the screen that wasn't drawn during this frame
+        is erased, eg. what was left of the previous tab.
+        """
+        full = full or self.writer.is_backlogged()
+        
+        if clear:
+            self.clear_undrawn()
+        
+        if full:
+            self.front_cells.update(self.back_cells)
+            cells = self.get_screen_cells()
+            
+            # The frames that get dropped might have changed the screen's state
+            self.device_fg_color = None
+            self.device_bg_color = None
+            self.device_text_size = None
+            self.device_cursor = None
+        else:
+            cells = self.get_changed_cells()
+            self.front_cells.update(self.back_cells)
+        
+        # Text drawn over an image replaces that part of it
+        if self.image_regions:
+            for glyph, fg, bg, size, x, y in cells:
+                self.forget_image_regions(x, y, x + size * Screen.CHAR_WIDTH, y + size * Screen.CHAR_HEIGHT)
+        
+        self.send_cells(cells)
+        
+        self.back_cells = {}
+        self.pending_cells = []
+        
+        self.writer.flush(full)
+        
+        return self
+    
+    def draw_offscreen(self, draw):
+        """
+        Calls draw(ctx) and returns what it drew as a frame instead of keeping it
+        for the next present(), so that a frame can be prepared ahead of time.
+        The frame is shown with present_frame(). Images are uploaded as soon as
+        they're drawn, so draw shouldn't draw any.
+        """
+        state = (self.back_cells, self.pending_cells, self.current_fg_color, self.current_bg_color,
+                 self.text_size, self.cursor_x, self.cursor_y, self.characters_on_line, self.redraw_all)
+        
+        self.back_cells = {}
+        self.pending_cells = []
+        
+        # The frame is shown in place of another one
+        self.redraw_all = True
+        
+        try:
+            draw(self)
+            
+            return (self.back_cells, self.pending_cells, self.current_fg_color,
+                    self.current_bg_color, self.text_size)
+        finally:
+            (self.back_cells, self.pending_cells, self.current_fg_color, self.current_bg_color,
+             self.text_size, self.cursor_x, self.cursor_y, self.characters_on_line, self.redraw_all) = state
+    
+    def present_frame(self, frame, clear=False):
+        """
+        Uploads a frame returned by draw_offscreen() in place of anything
+        drawn since the last present(). See present() for clear.
+        """
+        back_cells, pending_cells, self.current_fg_color, self.current_bg_color, self.text_size = frame
+        
+        # Erasing adds cells to the frame, keep the original as it was
+        self.back_cells = dict(back_cells)
+        self.pending_cells = list(pending_cells)
+        
+        return self.present(clear=clear)
+    
+    def flush(self):
+        """
+        Uploads everything drawn so far and waits until it has been written to the port.
+        Nothing sent before this can be dropped by the writer.
+        """
+        self.present()
+        self.writer.barrier()
+        
+        return self
+    
+    def clear_undrawn(self):
+        """
+        Erases the parts of the screen that weren't drawn during this frame, using
+        the current background color. The screen is either erased cell by cell or
+        as a whole, depending on which the device profile says is faster.
+        """
+        bg = self.current_bg_color
+        
+        # Empty cells covering each CHAR_WIDTH * CHAR_HEIGHT unit that has
+        # something on it that wasn't drawn over
+        blanks = []
+        
+        for unit, cell in self.front_cells.items():
+            if unit in self.back_cells:
+                continue
+            
+            blank = (" ", None, bg, 1, unit[0] * Screen.CHAR_WIDTH, unit[1] * Screen.CHAR_HEIGHT)
+            
+            if not same_cell(cell, blank):
+                blanks.append(blank)
+        
+        if not blanks:
+            return self
+        
+        blanks.sort(key=lambda cell: (cell[5], cell[4]))
+        
+        # Compare clearing the cells with erasing the whole screen
+        # and drawing the frame on an empty screen
+        screen_blank = (" ", None, bg, 1, 0, 0)
+        
+        clear_cost = self.get_cost(self.get_changed_cells() + blanks)
+        
+        # Setting the background color and erasing
+        erase_cost = (2 * self.profile.escape_cost + self.profile.erase_cost +
+                      self.get_cost(self.get_changed_cells({}, screen_blank), erased=True))
+        
+        if erase_cost < clear_cost:
+            # Keep the frame that was drawn, it's uploaded once the screen is empty
+            back_cells = self.back_cells
+            pending_cells = self.pending_cells
+            
+            self.send(commands.BG_COLORS[bg])
+            self.send(commands.ERASE_SCREEN, self.profile.escape_cost + self.profile.erase_cost)
+            
+            # The frame is only drawn over what's left of the previous one, so the
+            # erase can't be dropped along with frames the writer couldn't keep up with
+            self.writer.flush(keep=True)
+            
+            self.forget_cells(screen_blank)
+            
+            self.back_cells = back_cells
+            self.pending_cells = pending_cells
+            
+            self.device_bg_color = bg
+            self.device_cursor = None
+        else:
+            for blank in blanks:
+                self.draw_cell(blank)
+        
+        return self
+    
+    def get_cost(self, cells, erased=False):
+        """
+        Returns how many seconds it would take the screen to process the given cells,
+        without sending anything. If erased is True, the screen is assumed to have
+        just been erased.
+        """
+        state = (self.writer, self.device_fg_color, self.device_bg_color,
+                 self.device_text_size, self.device_cursor)
+        
+        self.writer = CostCounter(self.profile)
+        
+        if erased:
+            self.device_bg_color = self.current_bg_color
+            self.device_cursor = None
+        
+        try:
+            self.send_cells(cells)
+            
+            return self.writer.cost
+        finally:
+            (self.writer, self.device_fg_color, self.device_bg_color,
+             self.device_text_size, self.device_cursor) = state
+    
+    def get_changed_cells(self, front=None, blank=None):
+        """
+        Returns the cells drawn during this frame that differ from what's on the screen.
+        front and blank can be provided to compare against another screen
+        instead of front_cells and blank_cell.
+        """
+        if front is None:
+            front = self.front_cells
+            blank = self.blank_cell
+        
+        back = self.back_cells
+        
+        cells = []
+        
+        for cell in self.pending_cells:
+            # Only the parts of the cell that weren't drawn over later in the frame
+            # need to match what's already on the screen
+            units = [unit for unit in self.get_cell_units(cell) if back[unit] is cell]
+            
+            if not units or all(same_cell(front.get(unit, blank), cell) for unit in units):
+                continue
+            
+            cells.append(cell)
+            
+        return cells
+    
+    def get_screen_cells(self):
+        """
+        Returns every cell known to be on the screen, larger text first so that
+        smaller text drawn over it stays visible
+        """
+        cells = {}
+        
+        for cell in self.front_cells.values():
+            if cell is not None:
+                cells[id(cell)] = cell
+        
+        return sorted(cells.values(), key=lambda cell: (-cell[3], cell[5], cell[4]))
+    
+    def send_cells(self, cells):
+        """
+        Queues the commands and text needed to draw the given cells
+        """
+        # Glyphs waiting to be sent as a single piece of text
+        text = []
+        
+        for glyph, fg, bg, size, x, y in cells:
+            if size != self.device_text_size:
+                text = self.send_text(text)
+                self.send(commands.get_text_size(size))
+                self.device_text_size = size
+            
+            if (x, y) != self.device_cursor:
+                text = self.send_text(text)
+                self.send(commands.get_cursor(x, y))
+            
+            if glyph != " " and fg != self.device_fg_color:
+                text = self.send_text(text)
+                self.send(commands.FG_COLORS[fg])
+                self.device_fg_color = fg
+                
+            if bg != self.device_bg_color:
+                text = self.send_text(text)
+                self.send(commands.BG_COLORS[bg])
+                self.device_bg_color = bg
+            
+            text.append(glyph)
+            
+            # The screen moves to the next line by itself once the line is full,
+            # don't rely on exactly where it ends up
+            x += size * Screen.CHAR_WIDTH
+            if x + size * Screen.CHAR_WIDTH > self.get_width():
+                self.device_cursor = None
+            else:
+                self.device_cursor = (x, y)
+        
+        self.send_text(text)
+        
+        return self
+    
+    def forget_cells(self, blank_cell=None):
+        """
+        Discard everything known about the screen's content. If blank_cell is provided,
+        the screen is assumed to be filled with it
+        """
+        self.front_cells = {}
+        self.back_cells = {}
+        self.pending_cells = []
+        
+        self.blank_cell = blank_cell
+        
+        self.image_regions = {}
+        
+        return self
+    
+    def forget_image_regions(self, x, y, x2, y2, keep=None):
+        """
+        Discard the image regions overlapping the given rectangle,
+        except the one at the position keep
+        """
+        for position, pixels in list(self.image_regions.items()):
+            if position == keep:
+                continue
+            
+            height, width = pixels.shape
+            
+            if position[0] < x2 and x < position[0] + width and position[1] < y2 and y < position[1] + height:
+                del self.image_regions[position]
+        
+        return self
+    
+    def send(self, command, cost=None):
+        """
+        Queues a command to be sent to the screen on the next push_to_serial().
+        The command is either bytes, eg. from the commands module, or a string
+        with \\e standing for the escape character. cost is the time in seconds
+        the screen needs to process the command, by default the escape cost
+        of the device profile.
+        """
+        self.writer.command(command, cost)
+        
+        return self
+    
+    def send_text(self, text):
+        """
+        Queues text, a string or a list of strings, to be sent to the screen
+        on the next push_to_serial(). Returns an empty list for convenience.
+        """
+        if text:
+            self.writer.text("".join(text))
+        
+        return []
+    
     def reset_lcd(self):
         """
         Reset the LCD screen
         """
-        self.buffer += "\ec"
-        self.sleep()
+        self.present()
+        
+        self.send(commands.RESET)
+        self.flush()
+        
+        self.device_fg_color = None
+        self.device_bg_color = None
+        self.device_text_size = None
+        self.device_cursor = None
+        
+        self.forget_cells()
         
         return self
     
@@ -209,21 +658,23 @@ class ScreenContext:
         """
         Move cursor to home, eg. 0x0
         """
-        self.buffer += "\e[H"
-        self.sleep(0.1)
+        self.cursor_x = 0
+        self.cursor_y = 0
         self.characters_on_line = 0
         
-        # Colors have to be set again after going home otherwise glitches occur
-        self.bg_color(self.current_bg_color).fg_color(self.current_fg_color)
-        
         return self
     
     def erase_screen(self):
         """
         Erase everything drawn on the screen
         """
-        self.buffer += "\e[2J"
-        self.sleep()
+        # Anything drawn during this frame would be erased anyway
+        self.forget_cells((" ", None, self.current_bg_color, 1, 0, 0))
+        
+        self.send(commands.BG_COLORS[self.current_bg_color])
+        self.send(commands.ERASE_SCREEN, self.profile.escape_cost + self.profile.erase_cost)
+        self.flush()
+        self.device_bg_color = self.current_bg_color
         
         return self
     
@@ -231,9 +682,7 @@ class ScreenContext:
         """
         Set text size. Font width is set to 6*size and font height to 8*size
         """
-        self.buffer += "\e[%ss" % str(size)
         self.text_size = size
-        self.sleep()
         
         return self
     
@@ -243,14 +692,19 @@ class ScreenContext:
         Accepts values between 0-3, where 1 stands for clockwise 90 degree rotation,
         2 for 180 degree rotation, etc.
         """
-        self.buffer += "\e[%sr" % str(rotation)
+        self.present()
+        
+        self.send(commands.ROTATIONS[rotation])
+        self.flush()
         
         if rotation % 2 == 0:
             self.orientation = Screen.VERTICAL
         else:
             self.orientation = Screen.HORIZONTAL
-            
-        self.sleep()
+        
+        # Cell positions no longer match what is on the screen
+        self.device_cursor = None
+        self.forget_cells()
         
         return self
     
@@ -258,9 +712,8 @@ class ScreenContext:
         """
         Set cursor position (in pixels)
         """
-        self.buffer += "\e[%s;%sH" % (str(x), str(y))
-        
-        self.sleep()
+        self.cursor_x = x
+        self.cursor_y = y
         
         return self
 
@@ -268,42 +721,58 @@ class ScreenContext:
         """
         Set cursor position (in text character coordinates)
         """
-        self.buffer += "\e[%s;%sH" % (str(column * self.text_size * 6), str(row * self.text_size * 8))
-        
-        self.sleep()
+        self.cursor_x = column * self.text_size * Screen.CHAR_WIDTH
+        self.cursor_y = row * self.text_size * Screen.CHAR_HEIGHT
         
         return self
 
-    def draw_image(self, img_path, x, y):
+    def draw_image(self, img_path, x, y, size=None):
         """
-        Draw image at the specified position
+        Draw image at the specified position. If size is provided,
+        the image is resized to the (width, height) tuple.
         THIS METHOD ISN'T RELIABLE
         """
-
-        _, raw_path = tempfile.mkstemp()
-
-        # Convert the image
-        subprocess.call([ "ffmpeg", "-y", "-loglevel", "8","-i", img_path, "-vcodec",
-                          "rawvideo", "-f", "rawvideo", "-pix_fmt", "rgb565", raw_path ])
+        # Converted images are cached, so redrawing the same image is cheap
+        return self.draw_pixels(load_rgb565(img_path, size), x, y)
+    
+    def draw_pixels(self, pixels, x, y):
+        """
+        Draw a 2-D array of RGB565 pixels at the specified position. If pixels of the same
+        size were drawn at the same position before, only the parts that changed are uploaded.
+        """
+        self.present()
         
-        image = Image.open(img_path)
+        height, width = pixels.shape
         
-        width = image.size[0]
-        height = image.size[1]
+        previous = self.image_regions.get((x, y))
         
-        self.write("\e[%d;%d,%d;%di" % (x, y, width+x, height+y))
+        if previous is not None and previous.shape == pixels.shape:
+            rects = get_dirty_rects(previous, pixels, self.profile.get_window_cost())
+        else:
+            rects = [(0, 0, width, height)]
+        
+        if not rects:
+            return self
         
-        self.sleep(0.05)
-        # Call a script to cat the image data to the serial port,
-        # perhaps we could handle this in Python somehow?
-        raw_file = open(raw_path, "rb")
-        raw_data = raw_file.read()
-        self.port.write(raw_data)
-        self.port.flush()
-        self.sleep(0.05)
+        for left, top, right, bottom in rects:
+            self.send(commands.get_image_window(x+left, y+top, x+right, y+bottom), self.profile.image_window_cost)
+            
+            self.writer.data(get_pixel_bytes(pixels[top:bottom, left:right]), self.profile.image_window_cost)
         
         # Add a linebreak to prevent glitches when printing text again
-        self.linebreak()
+        self.send(commands.LINEBREAK)
+        self.device_cursor = None
+        
+        self.flush()
+        
+        # Keep a copy in case the caller modifies the array afterwards
+        self.forget_image_regions(x, y, x + width, y + height, keep=(x, y))
+        self.image_regions[(x, y)] = pixels.copy()
+        
+        # The image replaced whatever text was below it
+        for unit_x in range(x // Screen.CHAR_WIDTH, (x + width - 1) // Screen.CHAR_WIDTH + 1):
+            for unit_y in range(y // Screen.CHAR_HEIGHT, (y + height - 1) // Screen.CHAR_HEIGHT + 1):
+                self.front_cells[(unit_x, unit_y)] = None
         
         return self
     
@@ -315,6 +784,7 @@ class ScreenContext:
         if push_to_serial:
             self.push_to_serial()
         
-        time.sleep(period)
+        # Emulated screens don't need to be waited for
+        self.port.clock.sleep(period)
         
         return self
@@ -0,0 +1,632 @@
+import threading
+import time
+
+from context import Screen, ScreenContext
+from loader import ErrorTab, TabLoader, get_tab_key
+from writer import PROFILES
+
+import metrics
+
+class Display:
+    # How many seconds to wait before drawing again after a frame failed
+    RETRY_INTERVAL = 1
+
+    def __init__(self, ctx, tabs, header, tab_change_interval=15, start_tab=0, max_fps=10,
+                 tab_change_offset=0, rotation=Screen.VERTICAL, loader=None, prepare_time=5):
+        """
+        Shows tabs on a screen, changing the tab every tab_change_interval seconds.
+        A frame is only drawn when something on the screen may have changed: the shown
+        tab's data was collected again, the minute on the clock rolled over, the tab
+        changed or the tab's redraw_interval passed. Between those the thread sleeps.
+
+        max_fps: how many frames can be drawn per second at most
+        tab_change_offset: how many seconds later than usual the first tab change happens,
+                           so that screens next to each other don't change tabs in sync
+        rotation: rotation of the screen, see ScreenContext.set_rotation
+        loader: TabLoader used to create the tabs, which are declared as in config.py.
+                Each tab is only created when it's about to be shown for the first time.
+        prepare_time: how many seconds before a tab change the next tab is created
+                      and drawn off-screen, so that it has data to show and the
+                      change only has to upload the frame
+        """
+        self.ctx = ctx
+        self.tabs = tabs
+        self.header = header
+
+        self.loader = loader or TabLoader()
+
+        self.tab_change_interval = tab_change_interval
+        self.tab_change_offset = tab_change_offset
+        self.min_frame_interval = 1.0 / max_fps
+        self.prepare_time = prepare_time
+
+        self.rotation = rotation
+
+        self.current_tab = start_tab % len(tabs)
+
+        # Tab being shown, created by the loader
+        self.shown_tab = None
+
+        # Next tab and the frame drawn for it ahead of time, see prepare_next_tab()
+        self.next_tab = None
+        self.next_tab_frame = None
+
+        # When the frame of the next tab was drawn and the minute its clock shows
+        self.next_tab_rendered = False
+        self.prepared_at = None
+        self.prepared_minute = None
+
+        # When the shown tab is changed next, using time.monotonic()
+        self.next_tab_change = None
+
+        # When the last frame was drawn and when the next one has to be drawn at the latest
+        self.last_frame = None
+        self.next_frame = None
+
+        # Minute shown by the header's clock
+        self.shown_minute = None
+
+        # True if a frame should be drawn as soon as allowed
+        self.dirty = True
+
+        # True if what's left of the previous tab has to be erased on the next frame
+        self.tab_changed = False
+
+        # Settings given to reconfigure() that haven't been applied yet
+        self.pending_config = None
+
+        # True if the screen has to be reset before the next frame, as a frame
+        # failed and what's on the screen isn't known, and when to try again
+        self.reset_needed = False
+        self.retry_at = None
+
+        self.condition = threading.Condition()
+        self.stopped = False
+
+        self.thread = None
+
+    def invalidate(self, tab=None):
+        """
+        Requests a new frame. If a tab is provided, a frame is only requested
+        if it's the shown tab. Can be called from any thread.
+        """
+        with self.condition:
+            if tab is None or tab is self.shown_tab:
+                self.dirty = True
+                self.condition.notify_all()
+
+            # The next tab is drawn again with the new data
+            if tab is not None and tab is self.next_tab:
+                self.next_tab_frame = None
+                self.condition.notify_all()
+
+    @staticmethod
+    def check_config(tabs, tab_change_interval, max_fps):
+        """
+        Raises a ValueError if the settings can't be used
+        """
+        if not tabs or tab_change_interval <= 0 or max_fps <= 0:
+            raise ValueError("at least one tab, a positive time and a positive max_fps are needed")
+
+    def reconfigure(self, tabs, tab_change_interval, max_fps, rotation, tab_change_offset=0):
+        """
+        Changes what is shown without setting up the screen again. The shown tab
+        stays on the screen if it's still listed. Can be called from any thread,
+        the settings are applied by the thread drawing the frames.
+        """
+        with self.condition:
+            self.pending_config = (tabs, tab_change_interval, max_fps, rotation, tab_change_offset)
+            self.dirty = True
+            self.condition.notify_all()
+
+    def start(self):
+        """
+        Sets up the screen and draws frames in a separate thread until stop() is called
+        """
+        self.thread = threading.Thread(target=self.run, name="display-%s" % self.ctx.port_name, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops drawing and waits until the frame being drawn is finished
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def setup(self):
+        """
+        Waits for the screen to boot up and resets it
+        """
+        # Don't upload anything before the screen has booted up
+        self.ctx.wait_until_ready()
+
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the screen, so that the next frame draws everything
+        """
+        self.ctx.reset_lcd().set_rotation(self.rotation)
+
+        # Nothing has been drawn on the screen yet
+        self.tab_changed = True
+        self.reset_needed = False
+
+    def run(self):
+        """
+        Sets up the screen and draws frames until stop() is called
+        """
+        self.setup()
+        self.load_tab()
+
+        self.next_tab_change = time.monotonic() + self.tab_change_interval + self.tab_change_offset
+
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    timeout = self.get_timeout(time.monotonic())
+
+                    if timeout <= 0:
+                        break
+
+                    self.condition.wait(timeout)
+
+                if self.stopped:
+                    return
+
+                dirty, self.dirty = self.dirty, False
+
+                pending_config, self.pending_config = self.pending_config, None
+
+            # Like collecting a tab, a frame that fails doesn't stop the screen
+            try:
+                self.run_once(dirty, pending_config)
+            except Exception as e:
+                print("Couldn't draw on %s: %s" % (self.ctx.port_name, e))
+
+                metrics.FRAME_FAILURES.inc(self.ctx.port_name)
+
+                self.ctx.discard_frame()
+                self.forget_next_tab()
+
+                with self.condition:
+                    self.reset_needed = True
+                    self.retry_at = time.monotonic() + self.RETRY_INTERVAL
+                    self.dirty = True
+
+    def run_once(self, dirty, pending_config):
+        """
+        Applies new settings and draws a frame and the next tab if they're due
+        """
+        now = time.monotonic()
+
+        if pending_config is not None:
+            try:
+                self.apply_config(now, *pending_config)
+            except ValueError as e:
+                # Keep showing the tabs with the previous settings
+                print("Couldn't apply the config to %s: %s" % (self.ctx.port_name, e))
+
+        if self.reset_needed:
+            self.reset()
+
+        if now >= self.next_tab_change and len(self.tabs) > 1:
+            tab_changed_at = time.perf_counter()
+
+            frame, rendered = self.change_tab(now)
+            self.draw_frame(frame, rendered)
+
+            metrics.TAB_SWITCH_SECONDS.observe(time.perf_counter() - tab_changed_at, self.ctx.port_name)
+        elif dirty or self.is_frame_due(now):
+            self.draw_frame()
+
+        if self.is_prepare_due(time.monotonic()):
+            self.prepare_next_tab()
+
+    def apply_config(self, now, tabs, tab_change_interval, max_fps, rotation, tab_change_offset):
+        """
+        Applies the settings given to reconfigure(). Raises a ValueError
+        without changing anything if they aren't valid.
+        """
+        self.check_config(tabs, tab_change_interval, max_fps)
+
+        self.min_frame_interval = 1.0 / max_fps
+
+        if tab_change_interval != self.tab_change_interval:
+            self.tab_change_interval = tab_change_interval
+            self.next_tab_change = now + tab_change_interval
+
+        # The tab changes move by as much as the offset changed
+        if tab_change_offset != self.tab_change_offset:
+            self.next_tab_change += tab_change_offset - self.tab_change_offset
+            self.tab_change_offset = tab_change_offset
+
+        # The next tab may have changed and the prepared frame may not fit the screen
+        self.forget_next_tab()
+
+        if rotation != self.rotation:
+            self.rotation = rotation
+
+            # Nothing on the screen is where it's supposed to be anymore
+            self.ctx.set_rotation(rotation).erase_screen()
+            self.tab_changed = True
+
+        keys = [get_tab_key(entry) for entry in tabs]
+
+        if keys == [get_tab_key(entry) for entry in self.tabs]:
+            return
+
+        shown_key = get_tab_key(self.tabs[self.current_tab])
+
+        # Keep showing the same tab even if it moved, otherwise show
+        # whatever took its place
+        if shown_key in keys:
+            self.current_tab = keys.index(shown_key)
+        else:
+            self.current_tab = min(self.current_tab, len(tabs) - 1)
+            self.tab_changed = True
+
+        self.tabs = tabs
+        self.load_tab()
+
+    def get_timeout(self, now):
+        """
+        Returns how many seconds to sleep until the next frame has to be drawn
+        """
+        deadline = self.next_tab_change if len(self.tabs) > 1 else None
+
+        if self.dirty or self.shown_minute != self.get_minute():
+            deadline = now
+        elif self.next_frame is not None and (deadline is None or self.next_frame < deadline):
+            deadline = self.next_frame
+
+        # The clock in the header has to change when the minute rolls over
+        seconds_to_minute = 60 - time.time() % 60
+
+        if deadline is None or now + seconds_to_minute < deadline:
+            deadline = now + seconds_to_minute
+
+        # Don't draw faster than max_fps allows
+        if self.last_frame is not None:
+            deadline = max(deadline, self.last_frame + self.min_frame_interval)
+
+        # Don't keep failing as fast as frames can be drawn
+        if self.retry_at is not None:
+            deadline = max(deadline, self.retry_at)
+
+        prepare_at = self.get_prepare_time()
+
+        if prepare_at is not None:
+            deadline = min(deadline, prepare_at)
+
+        return deadline - now
+
+    def is_frame_due(self, now):
+        """
+        Returns True if the shown frame is out of date even without new data
+        """
+        return (self.shown_minute != self.get_minute() or
+                (self.next_frame is not None and now >= self.next_frame))
+
+    def get_prepare_time(self):
+        """
+        Returns when the next tab should be drawn off-screen, using time.monotonic(),
+        or None if there's no need to
+        """
+        if len(self.tabs) < 2:
+            return None
+
+        prepare_at = self.next_tab_change - self.prepare_time
+
+        # Drawing off-screen is throttled like drawing on the screen, so that
+        # a frame that keeps being discarded isn't drawn again right away
+        if self.prepared_at is not None:
+            prepare_at = max(prepare_at, self.prepared_at + self.min_frame_interval)
+
+        if self.retry_at is not None:
+            prepare_at = max(prepare_at, self.retry_at)
+
+        if self.next_tab_frame is None or self.prepared_minute != self.get_minute():
+            return prepare_at
+
+        # A frame showing a timer is drawn again once it's out of date, so that
+        # it's still up to date when the tab is changed to
+        redraw_interval = self.next_tab.redraw_interval
+
+        if redraw_interval is None:
+            return None
+
+        return max(prepare_at, self.prepared_at + redraw_interval)
+
+    def is_prepare_due(self, now):
+        """
+        Returns True if the next tab should be drawn off-screen
+        """
+        prepare_at = self.get_prepare_time()
+
+        return prepare_at is not None and now >= prepare_at
+
+    def get_minute(self):
+        return int(time.time() // 60)
+
+    def change_tab(self, now):
+        """
+        Moves to the next tab. What's left of the previous tab is erased
+        when the next frame is presented. Returns the frame drawn ahead of time,
+        or None, and whether the tab could be drawn on it.
+        """
+        # Changing tabs on schedule doesn't drift even if frames are late
+        self.next_tab_change += self.tab_change_interval
+
+        if self.next_tab_change <= now:
+            self.next_tab_change = now + self.tab_change_interval
+
+        self.current_tab = (self.current_tab + 1) % len(self.tabs)
+        self.tab_changed = True
+
+        self.load_tab()
+
+        frame = self.next_tab_frame
+        rendered = self.next_tab_rendered
+
+        # A frame showing a timer is only up to date for redraw_interval seconds.
+        # It's drawn again while waiting for the tab change, see get_prepare_time().
+        if (self.next_tab is not self.shown_tab or self.prepared_minute != self.get_minute() or
+                (self.shown_tab.redraw_interval is not None and
+                 now - self.prepared_at > self.shown_tab.redraw_interval)):
+            frame = None
+
+        self.forget_next_tab()
+
+        return frame, rendered
+
+    def prepare_next_tab(self):
+        """
+        Creates the next tab if it hasn't been shown before, so that its data is
+        collected before it's shown, and draws it off-screen
+        """
+        index = (self.current_tab + 1) % len(self.tabs)
+        tab = self.loader.get(self.tabs[index])
+
+        with self.condition:
+            self.next_tab = tab
+
+        snapshot = tab.snapshot
+        start = time.perf_counter()
+
+        rendered = []
+
+        frame = self.ctx.draw_offscreen(lambda ctx: rendered.append(self.render(ctx, index, tab)))
+
+        metrics.RENDER_SECONDS.observe(time.perf_counter() - start, self.ctx.port_name, tab.title)
+
+        self.prepared_at = time.monotonic()
+        self.prepared_minute = self.get_minute()
+
+        # If the tab got new data while it was drawn, it's drawn again.
+        # Once the frame is kept, invalidate() discards it on new data.
+        # A frame showing the error of a tab that couldn't be drawn is kept
+        # as well, so that it isn't drawn again until there's a reason to.
+        with self.condition:
+            if tab.snapshot is snapshot:
+                self.next_tab_frame = frame
+                self.next_tab_rendered = rendered[0]
+
+    def forget_next_tab(self):
+        with self.condition:
+            self.next_tab = None
+            self.next_tab_frame = None
+
+    def load_tab(self):
+        """
+        Creates the current tab if it hasn't been shown before
+        """
+        tab = self.loader.get(self.tabs[self.current_tab])
+
+        with self.condition:
+            self.shown_tab = tab
+
+    def render(self, ctx, index, tab):
+        """
+        Draws the header and a tab. If the tab can't be drawn, the error is
+        shown in its place and False is returned.
+        """
+        self.header.render_header(ctx, index, tab.title, len(self.tabs))
+
+        try:
+            tab.render_tab(ctx)
+
+            return True
+        except Exception as e:
+            print("Couldn't draw %s: %s" % (tab.title, e))
+
+            metrics.RENDER_FAILURES.inc(self.ctx.port_name, tab.title)
+
+            error = e
+
+        # Leave out whatever the tab drew before failing
+        ctx.discard_frame()
+
+        self.header.render_header(ctx, index, tab.title, len(self.tabs))
+        ErrorTab(tab.title, error, "Couldn't draw tab").render_tab(ctx)
+
+        return False
+
+    def draw_frame(self, frame=None, rendered=True):
+        """
+        Draws the header and the current tab and uploads the changes to the screen.
+        If a frame drawn ahead of time is provided, it's uploaded instead, and
+        rendered tells whether the tab could be drawn on it.
+        """
+        frame_start = time.perf_counter()
+
+        tab = self.shown_tab
+
+        self.shown_minute = self.get_minute()
+
+        # Only upload the parts of the frame that changed
+        if frame is not None:
+            self.ctx.present_frame(frame, clear=self.tab_changed)
+        else:
+            # Parts of the tab that don't change only have to be drawn when it's changed to
+            self.ctx.redraw_all = self.tab_changed
+
+            rendered = self.render(self.ctx, self.current_tab, tab)
+
+            metrics.RENDER_SECONDS.observe(time.perf_counter() - frame_start, self.ctx.port_name, tab.title)
+
+            self.ctx.present(clear=self.tab_changed)
+
+        # The error took the place of the tab, so the next frame draws all of it
+        self.tab_changed = not rendered
+        self.retry_at = None
+
+        metrics.FRAMES.inc(self.ctx.port_name)
+        metrics.FRAME_SECONDS.observe(time.perf_counter() - frame_start, self.ctx.port_name)
+
+        self.last_frame = time.monotonic()
+
+        # Tabs showing timers have to be redrawn even if their data doesn't change
+        if tab.redraw_interval is not None:
+            self.next_frame = self.last_frame + tab.redraw_interval
+        else:
+            self.next_frame = None
+
+class DisplayManager:
+    def __init__(self, collector, loader, header, defaults):
+        """
+        Keeps the screens declared in the config running. When the config changes,
+        screens that are still declared are reconfigured without setting them up
+        again and only tabs whose declaration changed are created again, so that
+        the other tabs keep their connections and collected data.
+
+        defaults: settings used for the screens that don't set them, see config.py
+        """
+        self.collector = collector
+        self.loader = loader
+        self.header = header
+        self.defaults = defaults
+
+        # Displays and their settings, keyed by port
+        self.displays = {}
+        self.configs = {}
+
+        self.lock = threading.Lock()
+        self.stopped = False
+
+        # Redraw as soon as a shown tab has new data
+        self.collector.add_listener(self.invalidate)
+
+    def get_setting(self, display_config, name):
+        return display_config.get(name, self.defaults[name])
+
+    def apply(self, displays):
+        """
+        Shows the screens declared in the config, each a dict as in config.py
+        """
+        with self.lock:
+            if self.stopped:
+                return self
+
+            declared = dict((display_config["port"], display_config) for display_config in displays)
+
+            for port in list(self.displays):
+                display_config = declared.get(port)
+
+                # The port has to be opened again to change how it's written to
+                if display_config is None or (self.get_port_settings(display_config) !=
+                                               self.get_port_settings(self.configs[port])):
+                    self.close_display(port)
+
+            for port, display_config in declared.items():
+                try:
+                    Display.check_config(display_config["tabs"],
+                                         self.get_setting(display_config, "time"),
+                                         self.get_setting(display_config, "max_fps"))
+                except ValueError as e:
+                    # A screen that's already shown keeps its previous settings
+                    print("Couldn't apply the config to %s: %s" % (port, e))
+                    continue
+
+                if port in self.displays:
+                    if self.get_setting(display_config, "tab") != self.get_setting(self.configs[port], "tab"):
+                        print("The first tab shown on %s only changes when it's set up again" % port)
+
+                    self.displays[port].reconfigure(display_config["tabs"],
+                                                    self.get_setting(display_config, "time"),
+                                                    self.get_setting(display_config, "max_fps"),
+                                                    self.get_setting(display_config, "rotation"),
+                                                    self.get_setting(display_config, "offset"))
+                else:
+                    self.open_display(display_config)
+
+                # Only the settings that are in use are compared against on the next change
+                self.configs[port] = display_config
+
+            # Stop collecting the tabs that aren't shown anywhere anymore
+            removed = self.loader.retain([entry for display_config in declared.values()
+                                          for entry in display_config["tabs"]])
+
+        for tab in removed:
+            self.collector.remove_tab(tab)
+            tab.close()
+
+        return self
+
+    def get_port_settings(self, display_config):
+        return (self.get_setting(display_config, "profile"), self.get_setting(display_config, "threaded"),
+                self.get_setting(display_config, "boot_banner"))
+
+    def open_display(self, display_config):
+        boot_banner = self.get_setting(display_config, "boot_banner")
+
+        ctx = ScreenContext(display_config["port"],
+                            PROFILES[self.get_setting(display_config, "profile")],
+                            self.get_setting(display_config, "threaded"),
+                            boot_banner.encode("ascii") if boot_banner is not None else None)
+
+        display = Display(ctx, display_config["tabs"], self.header,
+                          tab_change_interval=self.get_setting(display_config, "time"),
+                          start_tab=self.get_setting(display_config, "tab") - 1,
+                          max_fps=self.get_setting(display_config, "max_fps"),
+                          tab_change_offset=self.get_setting(display_config, "offset"),
+                          rotation=self.get_setting(display_config, "rotation"),
+                          loader=self.loader)
+
+        self.displays[display_config["port"]] = display.start()
+
+    def close_display(self, port):
+        """
+        Stops drawing on a screen and cleans it up
+        """
+        display = self.displays.pop(port)
+        del self.configs[port]
+
+        display.stop()
+        display.ctx.cleanup()
+
+    def invalidate(self, tab):
+        for display in list(self.displays.values()):
+            display.invalidate(tab)
+
+    def is_alive(self):
+        """
+        Returns True if any screen is still being drawn
+        """
+        return any(display.thread.is_alive() for display in list(self.displays.values()))
+
+    def stop(self):
+        """
+        Stops drawing on every screen and cleans them up
+        """
+        with self.lock:
+            self.stopped = True
+
+            for port in list(self.displays):
+                self.close_display(port)
@@ -0,0 +1,293 @@
+import numpy
+
+from PIL import Image, ImageDraw, ImageFont
+
+from context import Screen
+from transport import Transport, SimulatedClock
+
+# RGB565 values of the colors in Screen
+COLORS = {
+    Screen.BLACK: 0x0000,
+    Screen.RED: 0xF800,
+    Screen.GREEN: 0x07E0,
+    Screen.YELLOW: 0xFFE0,
+    Screen.BLUE: 0x001F,
+    Screen.MAGENTA: 0xF81F,
+    Screen.CYAN: 0x07FF,
+    Screen.WHITE: 0xFFFF,
+}
+
+ESCAPE = 0x1B
+
+class Emulator(Transport):
+    def __init__(self, baudrate=500000, snapshot_path=None):
+        """
+        Emulates an ODROID-SHOW by interpreting the escape sequences sent to it
+        and drawing into a framebuffer. Time is simulated, so the pacing of the writer
+        doesn't slow anything down.
+
+        baudrate: used to calculate how long the bytes would take to transfer
+        snapshot_path: where to save a PNG of the screen when closed, if provided.
+                       As the screen is reset when closing, the last screen
+                       that wasn't blank is saved.
+        """
+        self.baudrate = baudrate
+        self.snapshot_path = snapshot_path
+
+        self.clock = SimulatedClock()
+
+        # Framebuffer in the native, vertical orientation of the screen
+        self.framebuffer = numpy.zeros((Screen.WIDTH, Screen.HEIGHT), dtype=numpy.uint16)
+
+        # Glyph masks keyed by (character, text size)
+        self.glyphs = {}
+        self.font = ImageFont.load_default()
+
+        # Bytes received but not interpreted yet, eg. an unfinished escape sequence
+        self.buffer = bytearray()
+
+        # Image window being filled, as (x, y, x2, y2), and the pixels still expected
+        self.window = None
+        self.window_pixels = 0
+        self.window_data = None
+
+        # Statistics
+        self.bytes_written = 0
+        self.writes = 0
+        self.escapes = 0
+        self.text_bytes = 0
+        self.image_bytes = 0
+
+        self.reset()
+
+    def reset(self):
+        """
+        Puts the screen into the state it has after being reset
+        """
+        if self.snapshot_path and self.framebuffer.any():
+            self.save_snapshot(self.snapshot_path)
+
+        self.fg = Screen.WHITE
+        self.bg = Screen.BLACK
+        self.text_size = 2
+        self.rotation = 1
+
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+        self.framebuffer[:] = COLORS[Screen.BLACK]
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        self.writes += 1
+
+        # Time it takes to transfer the bytes, with a start and a stop bit for each
+        self.clock.advance(len(data) * 10.0 / self.baudrate)
+
+        self.buffer += data
+        self.interpret()
+
+    def close(self):
+        if self.snapshot_path and self.framebuffer.any():
+            self.save_snapshot(self.snapshot_path)
+
+    def get_view(self):
+        """
+        Returns the framebuffer as seen in the current rotation. Drawing into it
+        draws into the framebuffer.
+        """
+        return numpy.rot90(self.framebuffer, -self.rotation)
+
+    def get_width(self):
+        return self.get_view().shape[1]
+
+    def get_height(self):
+        return self.get_view().shape[0]
+
+    def get_image(self):
+        """
+        Returns the screen as a PIL image, as seen in the current rotation
+        """
+        pixels = self.get_view().astype(numpy.uint32)
+
+        rgb = numpy.empty(pixels.shape + (3,), dtype=numpy.uint8)
+        rgb[:, :, 0] = (pixels >> 11) * 255 // 31
+        rgb[:, :, 1] = ((pixels >> 5) & 0x3F) * 255 // 63
+        rgb[:, :, 2] = (pixels & 0x1F) * 255 // 31
+
+        return Image.fromarray(rgb, "RGB")
+
+    def save_snapshot(self, path):
+        """
+        Saves the screen into a PNG file
+        """
+        self.get_image().save(path, "PNG")
+
+    def get_stats(self):
+        """
+        Returns a dict of what has been sent to the screen so far
+        """
+        return {"bytes": self.bytes_written,
+                "writes": self.writes,
+                "escapes": self.escapes,
+                "text_bytes": self.text_bytes,
+                "image_bytes": self.image_bytes,
+                "time": self.clock.now,
+                "sleep_time": self.clock.slept}
+
+    def interpret(self):
+        """
+        Interprets as much of the buffer as possible
+        """
+        buffer = self.buffer
+        position = 0
+
+        while position < len(buffer):
+            if self.window is not None:
+                position = self.fill_window(buffer, position)
+                continue
+
+            byte = buffer[position]
+
+            if byte == ESCAPE:
+                end = self.interpret_escape(buffer, position)
+
+                if end is None:
+                    break
+
+                self.escapes += 1
+                position = end
+            elif byte == ord("\n"):
+                self.cursor_y += self.text_size * Screen.CHAR_HEIGHT
+                position += 1
+            elif byte == ord("\r"):
+                self.cursor_x = 0
+                position += 1
+            else:
+                self.draw_glyph(chr(byte))
+                self.text_bytes += 1
+                position += 1
+
+        del buffer[:position]
+
+    def interpret_escape(self, buffer, position):
+        """
+        Interprets the escape sequence at position. Returns the position after it,
+        or None if the sequence hasn't been received completely.
+        """
+        if position + 1 >= len(buffer):
+            return None
+
+        if buffer[position+1] == ord("c"):
+            self.reset()
+            return position + 2
+
+        if buffer[position+1] != ord("["):
+            # Not something the screen understands, skip the escape character
+            return position + 1
+
+        end = position + 2
+
+        while end < len(buffer) and not chr(buffer[end]).isalpha():
+            end += 1
+
+        if end >= len(buffer):
+            return None
+
+        command = chr(buffer[end])
+        parameters = bytes(buffer[position+2:end]).decode("ascii")
+
+        values = [int(value or 0) for value in parameters.replace(",", ";").split(";")] if parameters else []
+
+        if command == "m":
+            for value in values or [0]:
+                if value == 0:
+                    self.fg = Screen.WHITE
+                    self.bg = Screen.BLACK
+                elif value // 10 == Screen.FOREGROUND:
+                    self.fg = value % 10
+                elif value // 10 == Screen.BACKGROUND:
+                    self.bg = value % 10
+        elif command == "s":
+            self.text_size = values[0] if values else 1
+        elif command == "r":
+            self.rotation = (values[0] if values else 0) % 4
+        elif command == "H":
+            self.cursor_x, self.cursor_y = (values + [0, 0])[:2]
+        elif command == "J":
+            self.framebuffer[:] = COLORS[self.bg]
+        elif command == "i" and len(values) == 4:
+            x, y, x2, y2 = values
+
+            if x2 > x and y2 > y:
+                self.window = (x, y, x2, y2)
+                self.window_pixels = (x2 - x) * (y2 - y)
+                self.window_data = bytearray()
+
+        return end + 1
+
+    def fill_window(self, buffer, position):
+        """
+        Takes pixel data for the image window from the buffer. Returns
+        the position after the data that was used.
+        """
+        needed = self.window_pixels * 2 - len(self.window_data)
+        data = buffer[position:position+needed]
+
+        self.window_data += data
+        self.image_bytes += len(data)
+
+        if len(self.window_data) == self.window_pixels * 2:
+            x, y, x2, y2 = self.window
+
+            pixels = numpy.frombuffer(bytes(self.window_data), dtype="<u2").reshape(y2 - y, x2 - x)
+
+            # Parts outside the screen are cut off
+            view = self.get_view()
+            target = view[y:y2, x:x2]
+            target[:] = pixels[:target.shape[0], :target.shape[1]]
+
+            self.window = None
+            self.window_data = None
+
+        return position + len(data)
+
+    def get_glyph(self, character, size):
+        """
+        Returns a boolean mask of the pixels drawn for a character
+        """
+        key = (character, size)
+
+        if key not in self.glyphs:
+            image = Image.new("1", self.font.getbbox("A")[2:])
+            ImageDraw.Draw(image).text((0, 0), character, font=self.font, fill=1)
+
+            image = image.resize((Screen.CHAR_WIDTH * size, Screen.CHAR_HEIGHT * size), Image.NEAREST)
+
+            self.glyphs[key] = numpy.asarray(image, dtype=bool)
+
+        return self.glyphs[key]
+
+    def draw_glyph(self, character):
+        """
+        Draws a character at the cursor and moves the cursor forward,
+        to the next line if the current one is full
+        """
+        char_width = self.text_size * Screen.CHAR_WIDTH
+        char_height = self.text_size * Screen.CHAR_HEIGHT
+
+        view = self.get_view()
+
+        x, y = self.cursor_x, self.cursor_y
+
+        if 0 <= x and 0 <= y and x + char_width <= view.shape[1] and y + char_height <= view.shape[0]:
+            cell = view[y:y+char_height, x:x+char_width]
+
+            cell[:] = COLORS[self.bg]
+            cell[self.get_glyph(character, self.text_size)] = COLORS[self.fg]
+
+        self.cursor_x += char_width
+
+        if self.cursor_x + char_width > view.shape[1]:
+            self.cursor_x = 0
+            self.cursor_y += char_height
@@ -0,0 +1,70 @@
+import threading
+
+from array import array
+
+# Time windows that history is aggregated over, as (seconds, name) tuples
+WINDOWS = ((60, "1m"), (15 * 60, "15m"), (60 * 60, "1h"))
+
+def get_sample_count(seconds, interval):
+    """
+    Returns how many samples taken every interval seconds cover the given
+    amount of seconds, at least one. The interval doesn't have to be a whole number.
+    """
+    return max(int(seconds // interval), 1)
+
+class RingBuffer:
+    def __init__(self, capacity):
+        """
+        Fixed-size buffer of float samples. Once the buffer is full, the oldest
+        sample is overwritten, so memory use never grows.
+        """
+        self.capacity = capacity
+        
+        self.values = array("f", bytes(capacity * array("f").itemsize))
+        
+        # Position of the next sample and the amount of samples stored
+        self.index = 0
+        self.count = 0
+        
+        self.lock = threading.Lock()
+        
+    def __len__(self):
+        return self.count
+        
+    def append(self, value):
+        """
+        Add a sample, overwriting the oldest one if the buffer is full
+        """
+        with self.lock:
+            self.values[self.index] = value
+            
+            self.index = (self.index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            
+    def get_values(self, count=None):
+        """
+        Returns the latest count samples, or every sample if count is None,
+        as an array in the order they were added
+        """
+        with self.lock:
+            if count is None or count > self.count:
+                count = self.count
+                
+            start = self.index - count
+            
+            if start >= 0:
+                return self.values[start:self.index]
+            
+            return self.values[start:] + self.values[:self.index]
+        
+    def get_stats(self, count=None):
+        """
+        Returns a (min, max, avg) tuple of the latest count samples,
+        or None if there aren't any samples
+        """
+        values = self.get_values(count)
+        
+        if not values:
+            return None
+        
+        return (min(values), max(values), sum(values) / len(values))
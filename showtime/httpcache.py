@@ -0,0 +1,121 @@
+import json
+import time
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+class CachedResource:
+    # Seconds to wait before trying again after the first failure.
+    # The wait doubles after every consecutive failure up to BACKOFF_MAX.
+    BACKOFF_BASE = 30
+    BACKOFF_MAX = 60 * 60
+    
+    def __init__(self, url, timeout=5):
+        """
+        JSON resource fetched over HTTP, which honours the ETag, Last-Modified and
+        Cache-Control headers of the server and backs off after repeated failures
+        """
+        self.url = url
+        self.timeout = timeout
+        
+        # Last successfully decoded response and when the server last confirmed it,
+        # None if there hasn't been any
+        self.content = None
+        self.updated = None
+        
+        # Validators for conditional requests
+        self.etag = None
+        self.last_modified = None
+        
+        # The cached content can be used without asking the server until this time,
+        # using time.monotonic()
+        self.fresh_until = 0.0
+        
+        # Consecutive failures and when the next attempt can be made
+        self.failures = 0
+        self.retry_at = 0.0
+        
+    def is_available(self):
+        """
+        Returns False if the resource is backing off after failures
+        """
+        return time.monotonic() >= self.retry_at
+        
+    def fetch(self):
+        """
+        Returns the decoded response, from the cache if it's still fresh.
+        Raises an exception if the resource couldn't be retrieved.
+        """
+        if self.content is not None and time.monotonic() < self.fresh_until:
+            return self.content
+        
+        request = Request(self.url, headers={"User-Agent": "SHOWtime"})
+        
+        if self.content is not None:
+            if self.etag:
+                request.add_header("If-None-Match", self.etag)
+            if self.last_modified:
+                request.add_header("If-Modified-Since", self.last_modified)
+        
+        try:
+            try:
+                response = urlopen(request, timeout=self.timeout)
+                content = json.loads(response.read().decode("utf-8"))
+                headers = response.headers
+            except HTTPError as e:
+                if e.code != 304 or self.content is None:
+                    raise
+                
+                # Not modified, keep using the cached content
+                content = self.content
+                headers = e.headers
+        except:
+            self.failed()
+            raise
+        
+        self.content = content
+        self.updated = time.time()
+        
+        self.etag = headers.get("ETag", self.etag)
+        self.last_modified = headers.get("Last-Modified", self.last_modified)
+        self.fresh_until = time.monotonic() + self.get_max_age(headers)
+        
+        self.failures = 0
+        self.retry_at = 0.0
+        
+        return content
+    
+    def failed(self):
+        """
+        Marks the resource as failed and delays the next attempt
+        """
+        self.failures += 1
+        
+        backoff = min(self.BACKOFF_BASE * 2 ** (self.failures - 1), self.BACKOFF_MAX)
+        self.retry_at = time.monotonic() + backoff
+    
+    def get_max_age(self, headers):
+        """
+        Returns how many seconds a response can be cached, according to its headers
+        """
+        max_age = 0
+        
+        for directive in headers.get("Cache-Control", "").split(","):
+            directive = directive.strip().lower()
+            
+            if directive in ("no-cache", "no-store"):
+                return 0
+            
+            if directive.startswith("max-age="):
+                try:
+                    max_age = int(directive[len("max-age="):])
+                except ValueError:
+                    return 0
+        
+        # The response may have already spent some time in a cache
+        try:
+            max_age -= int(headers.get("Age", 0))
+        except ValueError:
+            pass
+        
+        return max(max_age, 0)
@@ -0,0 +1,150 @@
+import os
+import threading
+
+from collections import OrderedDict
+
+import numpy
+
+from PIL import Image
+
+def convert_to_rgb565(image):
+    """
+    Converts a PIL image into a 2-D array of little-endian RGB565 pixels,
+    as expected by the screen
+    """
+    pixels = numpy.asarray(image.convert("RGB"), dtype=numpy.uint16)
+    
+    red = pixels[:, :, 0]
+    green = pixels[:, :, 1]
+    blue = pixels[:, :, 2]
+    
+    rgb565 = ((red & 0xF8) << 8) | ((green & 0xFC) << 3) | (blue >> 3)
+    
+    return rgb565.astype("<u2")
+
+def get_pixel_bytes(pixels):
+    """
+    Returns the pixel data of a 2-D RGB565 array as bytes, without copying it
+    if the array is contiguous
+    """
+    return numpy.ascontiguousarray(pixels, dtype="<u2").data.cast("B")
+
+def get_runs(mask):
+    """
+    Returns (start, end) tuples of consecutive True values in a 1-D boolean array
+    """
+    padded = numpy.concatenate(([False], mask, [False]))
+    edges = numpy.flatnonzero(padded[1:] != padded[:-1])
+    
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2])]
+
+def get_dirty_rects(old, new, window_cost):
+    """
+    Returns (x, y, x2, y2) rectangles, with x2 and y2 exclusive, covering every pixel
+    that differs between two RGB565 arrays of the same size. window_cost is the cost
+    of uploading an additional rectangle in bytes; rectangles are merged whenever
+    sending the unchanged pixels between them is cheaper.
+    """
+    changed = old != new
+    
+    # Group the changed rows into bands
+    bands = []
+    
+    for top, bottom in get_runs(changed.any(axis=1)):
+        columns = numpy.flatnonzero(changed[top:bottom].any(axis=0))
+        left, right = int(columns[0]), int(columns[-1]) + 1
+        
+        if bands:
+            last_top, last_bottom, last_left, last_right = bands[-1]
+            
+            merged_left = min(left, last_left)
+            merged_right = max(right, last_right)
+            merged_width = merged_right - merged_left
+            
+            # Unchanged pixels sent if the bands are merged
+            extra = (merged_width * (bottom - last_top)
+                     - (right - left) * (bottom - top)
+                     - (last_right - last_left) * (last_bottom - last_top))
+            
+            if extra * 2 <= window_cost:
+                bands[-1] = (last_top, bottom, merged_left, merged_right)
+                continue
+            
+        bands.append((top, bottom, left, right))
+        
+    rects = []
+    
+    # Split each band into the columns that changed
+    for top, bottom, left, right in bands:
+        band = changed[top:bottom, left:right]
+        height = bottom - top
+        
+        runs = []
+        
+        for start, end in get_runs(band.any(axis=0)):
+            if runs and (start - runs[-1][1]) * height * 2 <= window_cost:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+        
+        for start, end in runs:
+            # Leave out the unchanged rows at the top and bottom
+            rows = numpy.flatnonzero(band[:, start:end].any(axis=1))
+            
+            rects.append((left + start, top + int(rows[0]),
+                          left + end, top + int(rows[-1]) + 1))
+            
+    return rects
+
+class ImageCache:
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        """
+        Least recently used cache of images converted into RGB565 pixel data.
+        Images are keyed by their path, modification time and size, so an image
+        is converted again if the file changes.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        
+        # (path, mtime, size) -> RGB565 array
+        self.images = OrderedDict()
+        
+        self.lock = threading.Lock()
+        
+    def get(self, path, size=None):
+        """
+        Returns the image at path as a 2-D RGB565 array. If size is provided,
+        the image is resized to the (width, height) tuple. The array must not be modified.
+        """
+        key = (path, os.stat(path).st_mtime_ns, size)
+        
+        with self.lock:
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key]
+        
+        with Image.open(path) as image:
+            if size is not None and image.size != size:
+                image = image.resize(size)
+                
+            pixels = convert_to_rgb565(image)
+        
+        with self.lock:
+            if key not in self.images:
+                self.images[key] = pixels
+                self.size += pixels.nbytes
+                
+            while self.size > self.max_bytes and len(self.images) > 1:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= evicted.nbytes
+        
+        return pixels
+
+# Cache shared by every screen
+cache = ImageCache()
+
+def load_rgb565(path, size=None):
+    """
+    Returns the image at path as a 2-D RGB565 array using the shared cache
+    """
+    return cache.get(path, size)
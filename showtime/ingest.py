@@ -0,0 +1,299 @@
+"""
+Values pushed to SHOWtime by other programs, in a line protocol similar to StatsD:
+
+    name:value|type
+
+where type is one of
+
+    g   gauge, the latest value is shown. A value starting with + or - changes
+        the previous value instead.
+    c   counter, the values are added up. |@rate can follow if only a fraction
+        of the events are sent, eg. jobs.done:1|c|@0.1
+    ms  timing, each value is a sample, eg. the duration of a job
+    t   text, eg. an alert or a status. Not part of StatsD.
+
+Several lines can be sent at once, separated by newlines.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future
+
+from history import RingBuffer
+
+import metrics
+
+TYPES = ("g", "c", "ms", "t")
+
+# Latest state of a key. value is the latest gauge, text or timing, or the total
+# of a counter. history has the latest values, or the counted amounts of a counter,
+# oldest first. updated is the time.time() of the last update.
+Sample = namedtuple("Sample", ["type", "value", "history", "updated"])
+
+def parse_line(line):
+    """
+    Returns the (name, value, type, rate, relative) of a line, where relative
+    is True for gauges that change the previous value. Raises a ValueError
+    if the line isn't valid or has characters that can't be shown.
+    """
+    line = line.strip()
+
+    # The screen only has characters for printable ASCII, and control
+    # characters would be taken as commands
+    if not all(" " <= c <= "~" for c in line):
+        raise ValueError("only printable ASCII characters can be shown")
+
+    name, separator, rest = line.partition(":")
+
+    if not separator or not name:
+        raise ValueError("missing name")
+
+    fields = rest.split("|")
+
+    if len(fields) < 2 or fields[1] not in TYPES:
+        raise ValueError("missing or unknown type")
+
+    value, type = fields[0], fields[1]
+
+    rate = 1.0
+
+    if len(fields) > 2:
+        if not fields[2].startswith("@"):
+            raise ValueError("unknown field %s" % fields[2])
+
+        rate = float(fields[2][1:])
+
+        if not 0.0 < rate <= 1.0:
+            raise ValueError("rate should be between 0 and 1")
+
+    relative = type == "g" and value[:1] in ("+", "-")
+
+    if type != "t":
+        value = float(value)
+
+        if not math.isfinite(value):
+            raise ValueError("value should be a finite number")
+
+    return name, value, type, rate, relative
+
+class Series:
+    def __init__(self, type, history_length):
+        """
+        What's known about a single key
+        """
+        self.type = type
+        self.value = "" if type == "t" else 0.0
+        self.history = RingBuffer(history_length) if type != "t" else None
+        self.updated = None
+
+class MetricStore:
+    def __init__(self, max_keys=1000, history_length=60):
+        """
+        Keeps the latest values of at most max_keys keys and history_length samples
+        of each. Once there are too many keys, the one updated longest ago is forgotten.
+        """
+        self.max_keys = max_keys
+        self.history_length = history_length
+
+        # Series of each key, the one updated longest ago first
+        self.series = OrderedDict()
+
+        self.lock = threading.Lock()
+
+    def update(self, name, value, type, rate=1.0, relative=False):
+        """
+        Records a value, see parse_line()
+        """
+        with self.lock:
+            series = self.series.get(name)
+
+            # A key that is sent with another type starts over
+            if series is None or series.type != type:
+                series = self.series[name] = Series(type, self.history_length)
+
+                while len(self.series) > self.max_keys:
+                    self.series.popitem(last=False)
+            else:
+                self.series.move_to_end(name)
+
+            if type == "c":
+                value /= rate
+                series.value += value
+            elif relative:
+                value += series.value
+                series.value = value
+            else:
+                series.value = value
+
+            if series.history is not None:
+                series.history.append(value)
+
+            series.updated = time.time()
+
+    def update_lines(self, data):
+        """
+        Records every line of a datagram or of a piece of a stream.
+        Lines that aren't valid are skipped.
+        """
+        valid = 0
+        invalid = 0
+
+        for line in data.decode("utf-8", "replace").splitlines():
+            if not line:
+                continue
+
+            try:
+                self.update(*parse_line(line))
+            except ValueError:
+                invalid += 1
+            else:
+                valid += 1
+
+        metrics.PUSHED_VALUES.inc(amount=valid)
+
+        if invalid:
+            metrics.PUSH_ERRORS.inc(amount=invalid)
+
+    def get(self, name):
+        """
+        Returns the Sample of a key, or None if nothing has been pushed to it
+        """
+        with self.lock:
+            series = self.series.get(name)
+
+            if series is None:
+                return None
+
+            history = tuple(series.history.get_values()) if series.history is not None else ()
+
+            return Sample(type=series.type, value=series.value, history=history, updated=series.updated)
+
+    def get_names(self):
+        with self.lock:
+            return sorted(self.series)
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, store):
+        self.store = store
+
+    def datagram_received(self, data, address):
+        self.store.update_lines(data)
+
+class PushServer:
+    # Longest line accepted on the UNIX socket, longer lines are skipped
+    MAX_LINE_LENGTH = 4096
+
+    def __init__(self, store, port=None, socket_path=None, address="127.0.0.1"):
+        """
+        Receives values on a UDP port and/or a UNIX stream socket and records them
+        into the store. The sockets are served by an event loop in a separate thread,
+        so pushes never wait for a frame to be drawn and vice versa.
+        """
+        self.store = store
+        self.port = port
+        self.socket_path = socket_path
+        self.address = address
+
+        self.loop = None
+        self.thread = threading.Thread(target=self.run, name="push-server", daemon=True)
+
+        # Set once the sockets are open or couldn't be opened
+        self.started = Future()
+
+    def start(self):
+        """
+        Opens the sockets and starts serving them. Raises an OSError
+        if a socket couldn't be opened.
+        """
+        self.thread.start()
+        self.started.result()
+
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+        if self.socket_path is not None and self.started.done() and self.started.exception() is None:
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+
+        try:
+            self.loop.run_until_complete(self.open())
+        except Exception as e:
+            self.started.set_exception(e)
+            self.loop.close()
+            return
+
+        self.started.set_result(True)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            # Close the connections of clients that are still connected
+            tasks = asyncio.all_tasks(self.loop)
+
+            for task in tasks:
+                task.cancel()
+
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def open(self):
+        if self.port is not None:
+            await self.loop.create_datagram_endpoint(lambda: DatagramProtocol(self.store),
+                                                     local_addr=(self.address, self.port))
+
+        if self.socket_path is not None:
+            # A socket left behind by a previous run can't be bound again
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+            await asyncio.start_unix_server(self.handle_stream, self.socket_path,
+                                            limit=self.MAX_LINE_LENGTH)
+
+    async def handle_stream(self, reader, writer):
+        """
+        Records the lines sent by a client until it disconnects
+        """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The line is too long, what was read of it has been discarded
+                    metrics.PUSH_ERRORS.inc()
+                    continue
+
+                if not line:
+                    break
+
+                self.store.update_lines(line)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+def start_server(port=None, socket_path=None):
+    """
+    Starts receiving values into the shared store
+    """
+    global server
+
+    server = PushServer(store, port, socket_path).start()
+
+    return server
+
+# Values pushed by other programs, shared by every tab, and the server receiving them
+store = MetricStore()
+server = None
@@ -0,0 +1,133 @@
+import importlib
+import json
+import threading
+import traceback
+
+from context import Screen
+from tabs.tab import Tab
+
+class ErrorTab(Tab):
+    def __init__(self, path, error, message="Couldn't load tab"):
+        """
+        Shown in place of a tab that couldn't be loaded or drawn
+        """
+        self.title = path.rsplit(".", 1)[-1]
+        self.error = error
+        self.message = message
+
+    def render_tab(self, ctx):
+        ctx.fg_color(Screen.RED).write_line(self.message).write_line(str(self.error)).fg_color(Screen.WHITE)
+
+# Class attributes of a tab that can be overridden in the config
+TAB_OPTIONS = ("refresh_interval", "redraw_interval")
+
+def parse_tab_entry(entry):
+    """
+    Returns the (path, settings, options) of a tab declared in the config. A tab is
+    declared either by the dotted path of its class, a (path, settings) tuple or
+    a (path, settings, options) tuple, where options override TAB_OPTIONS.
+    """
+    if isinstance(entry, str):
+        return entry, {}, {}
+
+    if len(entry) == 2:
+        path, config = entry
+
+        return path, config, {}
+
+    return tuple(entry)
+
+def get_tab_key(entry):
+    """
+    Returns a key identifying a tab declared in the config.
+    Tab instances are accepted as well and identified by themselves.
+    """
+    if isinstance(entry, Tab):
+        return entry
+
+    path, config, options = parse_tab_entry(entry)
+
+    if not options:
+        return (path, json.dumps(config, sort_keys=True))
+
+    return (path, json.dumps(config, sort_keys=True), json.dumps(options, sort_keys=True))
+
+class TabLoader:
+    def __init__(self, on_load=None):
+        """
+        Imports and creates tabs declared in the config when they're first needed,
+        so that the modules of tabs that are never shown aren't imported at all.
+        Tabs declared with the same path and settings share a single instance.
+
+        on_load: function called with each tab once it has been created
+        """
+        self.on_load = on_load
+
+        # Created tabs, keyed by get_tab_key()
+        self.tabs = {}
+
+        self.lock = threading.Lock()
+
+    def get(self, entry):
+        """
+        Returns the tab declared by entry, creating it if needed
+        """
+        key = get_tab_key(entry)
+
+        with self.lock:
+            tab = self.tabs.get(key)
+
+            if tab is None:
+                tab = self.tabs[key] = self.load(entry)
+                created = True
+            else:
+                created = False
+
+        if created and self.on_load is not None:
+            self.on_load(tab)
+
+        return tab
+
+    def retain(self, entries):
+        """
+        Forgets the tabs that aren't declared by any of the entries, so that
+        they're created again if they're declared later on. Returns the forgotten tabs.
+        """
+        keys = set(get_tab_key(entry) for entry in entries)
+
+        with self.lock:
+            removed = [key for key in self.tabs if key not in keys]
+
+            return [self.tabs.pop(key) for key in removed]
+
+    def load(self, entry):
+        """
+        Creates the tab declared by entry
+        """
+        if isinstance(entry, Tab):
+            return entry
+
+        path, config, options = parse_tab_entry(entry)
+
+        try:
+            module_name, class_name = path.rsplit(".", 1)
+
+            tab_class = getattr(importlib.import_module(module_name), class_name)
+
+            # Some tabs size their history by refresh_interval when they're
+            # created, so the options are class attributes of a subclass
+            if options:
+                tab_class = type(tab_class.__name__, (tab_class,), dict(options, __module__=tab_class.__module__))
+
+            tab = tab_class(config) if config else tab_class()
+
+            # A tab may also set them when it's created
+            for name, value in options.items():
+                setattr(tab, name, value)
+
+            return tab
+        except Exception as e:
+            print("Couldn't load tab %s:" % path)
+            traceback.print_exc()
+
+            return ErrorTab(path, e)
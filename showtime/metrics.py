@@ -0,0 +1,252 @@
+import bisect
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets in seconds, from a fraction of a millisecond to several seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(names, values, extra=()):
+    """
+    Returns labels formatted as {name="value",...}, or an empty string if there are none
+    """
+    labels = ["%s=\"%s\"" % (name, escape_label_value(value))
+              for name, value in list(zip(names, values)) + list(extra)]
+
+    if not labels:
+        return ""
+
+    return "{%s}" % ",".join(labels)
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labels=()):
+        """
+        Base class of metrics. Values are kept separately for each
+        combination of label values.
+        """
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        """
+        Returns the metric in the Prometheus text format
+        """
+        lines = ["# HELP %s %s" % (self.name, self.help),
+                 "# TYPE %s %s" % (self.name, self.type)]
+
+        with self.lock:
+            values = sorted(self.values.items())
+
+        for label_values, value in values:
+            lines.extend(self.render_value(label_values, value))
+
+        return "\n".join(lines) + "\n"
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increases the counter. Does nothing if metrics are disabled.
+        """
+        if not self.registry.enabled:
+            return
+
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def render_value(self, label_values, value):
+        return ["%s%s %s" % (self.name, format_labels(self.labels, label_values), format_value(value))]
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, registry, name, help, labels)
+
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        """
+        Records a single value. Does nothing if metrics are disabled.
+        """
+        if not self.registry.enabled:
+            return
+
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            # Count of each bucket (not cumulative), then the sum of the values
+            state = self.values.get(label_values)
+
+            if state is None:
+                state = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+
+            state[index] += 1
+            state[-1] += value
+
+    def render_value(self, label_values, state):
+        lines = []
+        count = 0
+
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), state[:-1]):
+            count += bucket_count
+
+            lines.append("%s_bucket%s %d" % (self.name,
+                                             format_labels(self.labels, label_values, [("le", format_value(bound))]),
+                                             count))
+
+        labels = format_labels(self.labels, label_values)
+
+        lines.append("%s_sum%s %s" % (self.name, labels, format_value(state[-1])))
+        lines.append("%s_count%s %d" % (self.name, labels, count))
+
+        return lines
+
+class Registry:
+    def __init__(self):
+        """
+        Collection of metrics. Metrics don't record anything until enabled,
+        so that they cost next to nothing when they aren't exported.
+        """
+        self.enabled = False
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(self, name, help, labels)
+        self.metrics.append(metric)
+
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, help, labels, buckets)
+        self.metrics.append(metric)
+
+        return metric
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text format
+        """
+        return "".join(metric.render() for metric in self.metrics)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port, address="127.0.0.1", registry=None):
+    """
+    Serves the metrics at http://address:port/metrics from a background thread
+    and returns the server
+    """
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or default_registry
+
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+    return server
+
+class TextfileWriter:
+    def __init__(self, path, interval=15, registry=None):
+        """
+        Rewrites the metrics into a file every interval seconds, eg. for the textfile
+        collector of node_exporter. The file is replaced atomically so that it's never
+        read half-written.
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry or default_registry
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics-textfile", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops the thread and writes the metrics one last time
+        """
+        self.stopped.set()
+        self.write()
+
+    def write(self):
+        temp_path = "%s.%d.tmp" % (self.path, os.getpid())
+
+        try:
+            with open(temp_path, "w") as f:
+                f.write(self.registry.render())
+
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print("Couldn't write metrics to %s: %s" % (self.path, e))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+default_registry = Registry()
+
+# Metrics of a single screen have a display label, the port of the screen
+RENDER_SECONDS = default_registry.histogram("showtime_render_seconds",
+                                            "Time spent in render_tab", ["display", "tab"])
+COLLECT_SECONDS = default_registry.histogram("showtime_collect_seconds",
+                                             "Time spent collecting the data of a tab", ["tab"])
+COLLECT_FAILURES = default_registry.counter("showtime_collect_failures_total",
+                                            "Collections that raised an exception", ["tab"])
+RENDER_FAILURES = default_registry.counter("showtime_render_failures_total",
+                                           "Calls to render_tab that raised an exception", ["display", "tab"])
+FRAME_FAILURES = default_registry.counter("showtime_frame_failures_total",
+                                          "Frames that couldn't be drawn or presented", ["display"])
+FRAMES = default_registry.counter("showtime_frames_total",
+                                  "Frames presented", ["display"])
+FRAME_SECONDS = default_registry.histogram("showtime_frame_seconds",
+                                           "Time spent drawing and presenting a frame", ["display"])
+TAB_SWITCH_SECONDS = default_registry.histogram("showtime_tab_switch_seconds",
+                                                "Time from deciding to change the tab until the new tab is presented",
+                                                ["display"])
+WRITTEN_BYTES = default_registry.counter("showtime_serial_written_bytes_total",
+                                         "Bytes written to the screen", ["display"])
+COMMANDS = default_registry.counter("showtime_serial_commands_total",
+                                    "Escape sequences and other commands sent to the screen", ["display"])
+PACING_SECONDS = default_registry.counter("showtime_serial_pacing_seconds_total",
+                                          "Time spent waiting for the screen to process what was sent", ["display"])
+WRITE_SECONDS = default_registry.histogram("showtime_serial_write_seconds",
+                                           "Time spent writing a single chunk to the port", ["display"])
+PUSHED_VALUES = default_registry.counter("showtime_pushed_values_total",
+                                         "Values pushed by other programs")
+PUSH_ERRORS = default_registry.counter("showtime_push_errors_total",
+                                       "Pushed lines that weren't valid and values that didn't fit their format")
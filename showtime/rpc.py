@@ -0,0 +1,136 @@
+import base64
+import http.client
+import json
+
+from urllib.parse import urlsplit
+
+class JsonRpcError(Exception):
+    def __init__(self, error):
+        """
+        Error returned by the server in a JSON-RPC response
+        """
+        self.code = error.get("code")
+        self.message = error.get("message")
+        
+        Exception.__init__(self, "%s (code %s)" % (self.message, self.code))
+
+class JsonRpcClient:
+    def __init__(self, url, username=None, password=None, timeout=None):
+        """
+        JSON-RPC client which keeps its connection to the server open between calls
+        and can send several calls in a single batch request
+        """
+        url = urlsplit(url)
+        
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path or "/"
+        
+        self.timeout = timeout
+        
+        self.headers = {"Content-Type": "application/json"}
+        
+        if username is not None:
+            credentials = "%s:%s" % (username, password)
+            self.headers["Authorization"] = "Basic %s" % base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        
+        self.connection = None
+        self.next_id = 0
+        
+    def call(self, method, *params):
+        """
+        Calls a single method and returns its result
+        """
+        return self.batch([(method,) + params])[0]
+    
+    def batch(self, calls):
+        """
+        Calls several methods in a single request. Each call is a tuple of the method name
+        followed by its parameters. Returns the results in the same order as the calls.
+        """
+        requests = []
+        
+        for call in calls:
+            self.next_id += 1
+            requests.append({"jsonrpc": "1.0",
+                             "id": self.next_id,
+                             "method": call[0],
+                             "params": list(call[1:])})
+        
+        responses = self.post(requests)
+        
+        if not isinstance(responses, list):
+            # Servers respond to a batch with a single error if they can't handle it at all
+            raise JsonRpcError(responses.get("error") or {"message": "Invalid batch response"})
+        
+        responses = dict((response.get("id"), response) for response in responses)
+        
+        results = []
+        
+        for request in requests:
+            response = responses.get(request["id"])
+            
+            if response is None:
+                raise JsonRpcError({"message": "No response to %s" % request["method"]})
+            
+            if response.get("error"):
+                raise JsonRpcError(response["error"])
+            
+            results.append(response.get("result"))
+            
+        return results
+    
+    def post(self, body):
+        """
+        Posts the JSON-encoded body to the server and returns the decoded response
+        """
+        data = json.dumps(body).encode("utf-8")
+        
+        for attempt in range(0, 2):
+            connection = self.get_connection()
+            reused = connection.sock is not None
+            
+            try:
+                connection.request("POST", self.path, data, self.headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (ConnectionError, http.client.BadStatusLine) as e:
+                self.close()
+                
+                # The server may have closed a connection that was kept open,
+                # so try again with a new one
+                if reused and attempt == 0:
+                    continue
+                
+                raise
+            except:
+                self.close()
+                raise
+            
+            break
+        
+        try:
+            return json.loads(content.decode("utf-8"))
+        except ValueError:
+            raise JsonRpcError({"code": response.status, "message": response.reason})
+    
+    def get_connection(self):
+        """
+        Returns the open connection to the server, or a new one if there isn't any
+        """
+        if self.connection is None:
+            if self.https:
+                self.connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                
+        return self.connection
+    
+    def close(self):
+        """
+        Closes the connection to the server
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
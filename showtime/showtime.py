@@ -1,62 +1,163 @@
 #!/usr/bin/env python
 
-from context import Screen, ScreenContext
+from context import Screen
+from writer import PROFILES, DEFAULT_PROFILE
 from header import Header
-import config as config
+from collector import CollectorScheduler
+from display import DisplayManager
+from loader import TabLoader
+from configfile import ConfigError, ConfigWatcher, load_config, is_banner
+import metrics
+import ingest
 
 import atexit
-import time
 import sys
+import time
 import argparse
 
+def positive(type):
+    """
+    Returns an argument type accepting numbers of the given type that are larger than 0
+    """
+    def convert(value):
+        number = type(value)
+        
+        if number <= 0:
+            raise argparse.ArgumentTypeError("should be larger than 0, not %s" % value)
+        
+        return number
+    
+    return convert
+
+def banner(value):
+    if not is_banner(value):
+        raise argparse.ArgumentTypeError("should be printable ASCII characters")
+    
+    return value
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--tab", "-t", help="start from which tab (default=1)",
-                    type=int, default=1)
+                    type=positive(int), default=1)
 parser.add_argument("--time", "-T", 
                     help="for how many seconds should a tab be shown before changing it (default=15)",
-                    type=int, default=15)
+                    type=positive(int), default=15)
 parser.add_argument("--port", "-p",
-                    help="serial port to use as the output (default=/dev/ttyUSB0)",
-                    type=str, default="/dev/ttyUSB0")
+                    help="serial port to use as the output, or pty, file:PATH or emulator[:PATH] (default=/dev/ttyUSB0). "
+                         "Can be repeated to show the tabs on several screens.",
+                    type=str, action="append")
+parser.add_argument("--profile", "-P",
+                    help="device profile used to pace the output (default=%s)" % DEFAULT_PROFILE,
+                    choices=sorted(PROFILES.keys()), default=DEFAULT_PROFILE)
+parser.add_argument("--threaded",
+                    help="write to the serial port from a separate thread",
+                    action="store_true")
+parser.add_argument("--boot-banner",
+                    help="text the screen's firmware sends once it has booted up, so that drawing can start "
+                         "without waiting for the whole boot time of the device profile",
+                    type=banner, default=None)
+parser.add_argument("--max-fps", "-F",
+                    help="how many frames can be drawn per second at most (default=10)",
+                    type=positive(float), default=10)
+parser.add_argument("--metrics-port",
+                    help="serve metrics in the Prometheus format on this port of localhost",
+                    type=int, default=None)
+parser.add_argument("--metrics-file",
+                    help="write metrics in the Prometheus format into this file every 15 seconds",
+                    type=str, default=None)
+parser.add_argument("--config", "-c",
+                    help="TOML or JSON file listing the tabs and screens, reloaded whenever it changes "
+                         "(default=config.py, which isn't reloaded)",
+                    type=str, default=None)
+parser.add_argument("--push-port",
+                    help="receive values pushed by other programs on this UDP port of localhost, "
+                         "shown with tabs.push.PushTab",
+                    type=int, default=None)
+parser.add_argument("--push-socket",
+                    help="receive values pushed by other programs on a UNIX socket at this path",
+                    type=str, default=None)
 args = parser.parse_args()
 
-# Apply the arguments
-default_tab = args.tab - 1
-tab_change_interval = args.time
+# Metrics are only recorded if they are exported somewhere
+if args.metrics_port is not None or args.metrics_file is not None:
+    metrics.default_registry.enabled = True
 
-tabs = config.tabs
-current_tab = default_tab
+if args.metrics_port is not None:
+    metrics.start_http_server(args.metrics_port)
 
-ctx = ScreenContext(args.port)
+if args.metrics_file is not None:
+    textfile_writer = metrics.TextfileWriter(args.metrics_file).start()
+    
+    atexit.register(textfile_writer.stop)
 
-atexit.register(ctx.cleanup)
+# Values pushed by other programs are received in the background
+if args.push_port is not None or args.push_socket is not None:
+    try:
+        push_server = ingest.start_server(args.push_port, args.push_socket)
+    except OSError as e:
+        sys.exit("Couldn't receive pushed values: %s" % e)
+    
+    atexit.register(push_server.stop)
 
-# Wait 6 seconds for the screen to boot up before we start uploading anything
-ctx.sleep(6).reset_lcd().set_rotation(Screen.VERTICAL)
+def get_displays(config):
+    """
+    Returns the screens listed in the config. Several screens can be listed,
+    otherwise every port given as an argument shows the same tabs.
+    """
+    displays = getattr(config, "displays", None) or [{}]
+    
+    # Settings of the screens given as arguments can be set in the config as well
+    if len(displays) == 1 and "port" not in displays[0]:
+        displays = [dict(displays[0], port=port) for port in args.port or ["/dev/ttyUSB0"]]
+    else:
+        displays = [dict(display_config) for display_config in displays]
+    
+    for display_config in displays:
+        display_config.setdefault("tabs", config.tabs)
+        
+    return displays
 
-# Header
-header = Header()
+if args.config is not None:
+    try:
+        config = load_config(args.config)
+    except ConfigError as e:
+        sys.exit(str(e))
+else:
+    import config as config
 
-print("Started")
+# Collect the data shown on the tabs in the background. Tabs are added
+# once they're shown for the first time.
+collector = CollectorScheduler([]).start()
+
+atexit.register(collector.stop)
+
+# Tabs shared between screens are created and collected only once
+loader = TabLoader(on_load=collector.add_tab)
 
-time_since_tab_change = 0
-last_time = time.time()
+manager = DisplayManager(collector, loader, Header(),
+                         defaults={"time": args.time,
+                                   "tab": args.tab,
+                                   "max_fps": args.max_fps,
+                                   "offset": 0,
+                                   "rotation": Screen.VERTICAL,
+                                   "profile": args.profile,
+                                   "threaded": args.threaded,
+                                   "boot_banner": args.boot_banner})
 
-while True:
-    header.render_header(ctx, current_tab, tabs[current_tab].title, len(tabs))
-    tabs[current_tab].render_tab(ctx)
+# Stop drawing and clean up the screens before the program exits
+atexit.register(manager.stop)
 
-    time_since_tab_change += time.time() - last_time
-    last_time = time.time()
+manager.apply(get_displays(config))
+
+# Changes to the config file are applied without restarting, so that only
+# the tabs that changed have to be created again
+if args.config is not None:
+    watcher = ConfigWatcher(args.config, lambda config: manager.apply(get_displays(config))).start()
     
-    if time_since_tab_change >= tab_change_interval and len(tabs) > 1:
-        time_since_tab_change = 0
-        current_tab += 1
-        if current_tab > len(tabs)-1:
-            current_tab = 0
-            
-        # Make the erasing maneuver a bit faster by temporarily changing
-        # the font size to 4
-        ctx.set_text_size(4)
-        ctx.erase_rows(1, ctx.get_rows()-1)
-        ctx.set_text_size(2)
+    atexit.register(watcher.stop)
+
+print("Started")
+
+# Each screen is drawn in its own thread, wait until all of them have stopped
+# or the program is interrupted
+while manager.is_alive():
+    time.sleep(1)
@@ -0,0 +1,456 @@
+import os
+import queue
+import select
+import threading
+import time
+
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError
+
+import psutil
+
+# used and total are the last known values if the mount point is unresponsive,
+# or None if it has never responded or its usage couldn't be read. error is why
+# the usage couldn't be read, eg. "Permission denied", None otherwise.
+DiskPartitionUsage = namedtuple("DiskPartitionUsage", ["mountpoint", "fstype", "used", "total", "responsive",
+                                                       "error"])
+
+# cpu is the CPU time used since the previous time processes were listed, as
+# a fraction of a single core, so a process using two cores fully has 2.0
+ProcessUsage = namedtuple("ProcessUsage", ["pid", "name", "cpu", "rss"])
+
+# File systems that don't store anything on a disk
+PSEUDO_FSTYPES = frozenset(["autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs",
+                            "debugfs", "devpts", "devtmpfs", "efivarfs", "fusectl", "hugetlbfs",
+                            "mqueue", "nsfs", "overlay", "proc", "pstore", "ramfs", "rpc_pipefs",
+                            "securityfs", "squashfs", "sysfs", "tmpfs", "tracefs"])
+
+class WorkerPool:
+    def __init__(self, workers, name):
+        """
+        Runs functions in at most the given number of daemon threads, started
+        as they're needed. Daemon threads are used, unlike in ThreadPoolExecutor,
+        so that a call that never returns can't keep the process from exiting.
+        """
+        self.workers = workers
+        self.name = name
+        
+        self.queue = queue.SimpleQueue()
+        self.threads = []
+        
+        # How many threads are waiting for something to run
+        self.idle = 0
+        
+        self.lock = threading.Lock()
+        
+    def submit(self, function, *args):
+        """
+        Runs the function in one of the threads and returns a Future for its result
+        """
+        future = Future()
+        
+        with self.lock:
+            self.queue.put((future, function, args))
+            
+            if self.idle > 0:
+                self.idle -= 1
+            elif len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.run, name="%s-%d" % (self.name, len(self.threads)),
+                                          daemon=True)
+                thread.start()
+                
+                self.threads.append(thread)
+        
+        return future
+    
+    def run(self):
+        while True:
+            future, function, args = self.queue.get()
+            
+            if not future.set_running_or_notify_cancel():
+                with self.lock:
+                    self.idle += 1
+                
+                continue
+            
+            try:
+                result, exception = function(*args), None
+            except BaseException as e:
+                result, exception = None, e
+            
+            # The thread is idle before the result is seen, so that
+            # the next call submitted doesn't start another thread
+            with self.lock:
+                self.idle += 1
+            
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+class DiskMonitor:
+    # How often partitions are listed again if mount changes can't be watched
+    PARTITION_TTL = 60
+    
+    def __init__(self, timeout=2, exclude_fstypes=PSEUDO_FSTYPES, workers=4):
+        """
+        Gathers disk usage without ever blocking for longer than timeout seconds.
+        Partitions are only listed again when the mount table changes, and mount points
+        that don't respond in time, such as stale network mounts, are reported as
+        unresponsive instead. Partitions with a file system type in exclude_fstypes
+        aren't listed, see include_fstypes(). Usage is read by at most workers threads.
+        """
+        self.timeout = timeout
+        self.exclude_fstypes = frozenset(exclude_fstypes)
+        
+        self.pool = WorkerPool(workers, "disk-usage")
+        
+        # Partitions found the last time they were listed
+        self.partitions = None
+        self.partitions_listed = 0.0
+        
+        # The mount table is watched for changes if the system supports it
+        self.mountinfo = None
+        self.poller = None
+        
+        if os.path.exists("/proc/self/mountinfo") and hasattr(select, "poll"):
+            self.mountinfo = open("/proc/self/mountinfo")
+            self.poller = select.poll()
+            self.poller.register(self.mountinfo, select.POLLPRI | select.POLLERR)
+        
+        # Disk usage calls that haven't returned yet, keyed by mount point
+        self.pending = {}
+        
+        # Latest DiskPartitionUsage of each mount point
+        self.usage = {}
+        
+    def include_fstypes(self, fstypes):
+        """
+        Lists partitions with the given file system types from now on, even if
+        they were excluded, eg. tmpfs for a tab that wants to show it
+        """
+        if self.exclude_fstypes & set(fstypes):
+            self.exclude_fstypes = self.exclude_fstypes - set(fstypes)
+            
+            # List the partitions again on the next call
+            self.partitions = None
+    
+    def get_partitions(self):
+        """
+        Returns the partitions whose usage is shown, listing them again
+        only if the mount table has changed
+        """
+        if self.partitions is None or self.mounts_changed():
+            self.partitions = self.list_partitions()
+            self.partitions_listed = time.monotonic()
+            
+        return self.partitions
+    
+    def mounts_changed(self):
+        """
+        Returns True if the mount table may have changed since the partitions were listed
+        """
+        if self.poller is None:
+            return time.monotonic() - self.partitions_listed >= self.PARTITION_TTL
+        
+        if not self.poller.poll(0):
+            return False
+        
+        # Reading the file again resets the change notification
+        self.mountinfo.seek(0)
+        self.mountinfo.read()
+        
+        return True
+    
+    def list_partitions(self):
+        """
+        Lists mounted partitions, leaving out pseudo file systems and
+        devices that are mounted more than once
+        """
+        partitions = []
+        devices = set()
+        
+        for partition in psutil.disk_partitions(all=True):
+            if not partition.mountpoint or partition.fstype in self.exclude_fstypes:
+                continue
+            
+            # Bind mounts and subvolumes show the same device again
+            if partition.device in devices:
+                continue
+            
+            devices.add(partition.device)
+            partitions.append(partition)
+            
+        return partitions
+        
+    def get_usage(self):
+        """
+        Returns a DiskPartitionUsage for each partition
+        """
+        partitions = self.get_partitions()
+        
+        # Mount points that still haven't returned from the previous call
+        # aren't asked again, so a hung mount only ever ties up one thread.
+        # They're reported as unresponsive until the call returns.
+        for partition in partitions:
+            if partition.mountpoint not in self.pending:
+                self.pending[partition.mountpoint] = self.pool.submit(psutil.disk_usage, partition.mountpoint)
+        
+        deadline = time.monotonic() + self.timeout
+        
+        usage = {}
+        
+        for partition in partitions:
+            mountpoint = partition.mountpoint
+            future = self.pending[mountpoint]
+            
+            try:
+                result = future.result(max(deadline - time.monotonic(), 0))
+            except TimeoutError:
+                previous = self.usage.get(mountpoint)
+                
+                usage[mountpoint] = DiskPartitionUsage(mountpoint=mountpoint,
+                                                       fstype=partition.fstype,
+                                                       used=previous.used if previous else None,
+                                                       total=previous.total if previous else None,
+                                                       responsive=False,
+                                                       error=None)
+                continue
+            except OSError as e:
+                # Eg. no permission to access the mount point. It's still mounted,
+                # so it's reported rather than left out.
+                del self.pending[mountpoint]
+                
+                usage[mountpoint] = DiskPartitionUsage(mountpoint=mountpoint,
+                                                       fstype=partition.fstype,
+                                                       used=None,
+                                                       total=None,
+                                                       responsive=True,
+                                                       error=e.strerror or str(e))
+                continue
+            
+            del self.pending[mountpoint]
+            
+            if result.total == 0:
+                continue
+            
+            usage[mountpoint] = DiskPartitionUsage(mountpoint=mountpoint,
+                                                   fstype=partition.fstype,
+                                                   used=result.used,
+                                                   total=result.total,
+                                                   responsive=True,
+                                                   error=None)
+        
+        # Forget about calls to mount points that have been unmounted
+        # once they return
+        for mountpoint, future in list(self.pending.items()):
+            if future.done() and mountpoint not in usage:
+                del self.pending[mountpoint]
+        
+        self.usage = usage
+        
+        return tuple(usage.values())
+
+class ProcessMonitor:
+    def __init__(self):
+        """
+        Lists processes and how much CPU time each has used since the previous
+        listing. Instead of waiting for an interval, as Process.cpu_percent(interval)
+        does, the CPU times of the previous listing are kept and subtracted.
+        """
+        # psutil.Process of each PID from the previous listing. Creating one
+        # reads the process's create time, so they're kept between listings.
+        self.processes = {}
+        
+        # (name, user + system CPU time) of each PID from the previous listing
+        self.cpu_times = {}
+        
+        # time.monotonic() and time.time() of the previous listing
+        self.listed = None
+        self.listed_wall = None
+        
+    def get_usage(self):
+        """
+        Returns a ProcessUsage for each process that could be read. The first
+        listing has no previous CPU times, so every process is shown idle.
+        """
+        now = time.monotonic()
+        now_wall = time.time()
+        
+        interval = now - self.listed if self.listed is not None else 0.0
+        
+        processes = {}
+        cpu_times = {}
+        usage = []
+        
+        for pid in psutil.pids():
+            process = self.processes.get(pid)
+            
+            try:
+                if process is None:
+                    process = psutil.Process(pid)
+                
+                # Each process costs a couple of small reads from /proc
+                with process.oneshot():
+                    name = process.name()
+                    times = process.cpu_times()
+                    memory = process.memory_info()
+            except psutil.Error:
+                # Exited since it was listed, or belongs to another user and can't be read
+                continue
+            
+            total = times.user + times.system
+            previous = self.cpu_times.get(pid)
+            
+            # A PID that has been reused by a new process has another name or has
+            # used less CPU time. The create time isn't read again to tell them apart.
+            if previous is not None and (previous[0] != name or previous[1] > total):
+                process = psutil.Process(pid)
+                previous = None
+            
+            cpu = 0.0
+            
+            if interval > 0:
+                if previous is not None:
+                    cpu = (total - previous[1]) / interval
+                elif process.create_time() >= self.listed_wall:
+                    # Started since the previous listing, so all of its CPU time is new
+                    cpu = total / interval
+            
+            processes[pid] = process
+            cpu_times[pid] = (name, total)
+            
+            usage.append(ProcessUsage(pid=pid,
+                                      name=name or str(pid),
+                                      cpu=cpu,
+                                      rss=memory.rss))
+        
+        # Processes that have exited aren't listed, so they're forgotten here
+        self.processes = processes
+        self.cpu_times = cpu_times
+        self.listed = now
+        self.listed_wall = now_wall
+        
+        return tuple(usage)
+
+class SystemMonitor:
+    # How many seconds each metric is kept before it's gathered again,
+    # None to gather it only once
+    DEFAULT_TTLS = {"cpu": 1,
+                    "memory": 1,
+                    "swap": 1,
+                    "load": 1,
+                    "net": 1,
+                    "disk_usage": 5,
+                    "processes": 2,
+                    "sensors": 10,
+                    "boot_time": None}
+    
+    def __init__(self, ttls={}, disks=None, processes=None):
+        """
+        Gathers system metrics on demand and shares them between every tab. A metric
+        is gathered at most once per TTL no matter how many tabs ask for it, and
+        metrics that come from the same source are gathered together.
+        """
+        self.ttls = dict(self.DEFAULT_TTLS, **ttls)
+        
+        self.disks = disks or DiskMonitor()
+        self.processes = processes or ProcessMonitor()
+        
+        # Functions gathering each metric
+        self.probes = {"cpu": self.get_cpu_usages,
+                       "memory": self.get_memory,
+                       "swap": self.get_memory,
+                       "load": psutil.getloadavg,
+                       "net": psutil.net_io_counters,
+                       "disk_usage": self.disks.get_usage,
+                       "processes": self.processes.get_usage,
+                       "sensors": self.get_sensors,
+                       "boot_time": psutil.boot_time}
+        
+        # Functions that gather several metrics at once, returning them in a dict
+        self.group_probes = set([self.get_memory])
+        
+        # metric -> (value, time.monotonic() when gathered)
+        self.values = {}
+        
+        # One lock for each probe, so that the same probe never runs twice at once
+        self.locks = dict((probe, threading.Lock()) for probe in set(self.probes.values()))
+        
+        # CPU times from the previous time CPU usage was gathered
+        self.cpu_times = None
+        
+    def get(self, metric):
+        """
+        Returns the latest value of a metric, gathering it if it's older than its TTL.
+        The returned value must not be modified.
+        """
+        probe = self.probes[metric]
+        
+        with self.locks[probe]:
+            if not self.is_fresh(metric):
+                gathered_at = time.monotonic()
+                value = probe()
+                
+                if probe in self.group_probes:
+                    for name, metric_value in value.items():
+                        self.values[name] = (metric_value, gathered_at)
+                else:
+                    self.values[metric] = (value, gathered_at)
+                
+            return self.values[metric][0]
+    
+    def is_fresh(self, metric):
+        """
+        Returns True if the metric has been gathered within its TTL
+        """
+        if metric not in self.values:
+            return False
+        
+        ttl = self.ttls.get(metric)
+        
+        return ttl is None or time.monotonic() - self.values[metric][1] < ttl
+    
+    def get_cpu_usages(self):
+        """
+        Returns the usage of each CPU core as a fraction, calculated
+        from the CPU times since the last call
+        """
+        cpu_times = psutil.cpu_times(percpu=True)
+        previous_times = self.cpu_times
+        self.cpu_times = cpu_times
+        
+        if previous_times is None:
+            return (0.0,) * len(cpu_times)
+        
+        usages = []
+        
+        for old, new in zip(previous_times, cpu_times):
+            total = sum(new) - sum(old)
+            idle = (new.idle + getattr(new, "iowait", 0.0)) - (old.idle + getattr(old, "iowait", 0.0))
+            
+            if total > 0:
+                usages.append(max(0.0, min(1.0, 1.0 - idle / total)))
+            else:
+                usages.append(0.0)
+                
+        return tuple(usages)
+    
+    def get_memory(self):
+        """
+        Gathers memory and swap usage, which share the same source
+        """
+        return {"memory": psutil.virtual_memory(),
+                "swap": psutil.swap_memory()}
+    
+    def get_sensors(self):
+        """
+        Returns the temperature sensors, or an empty dict if they aren't supported
+        """
+        if not hasattr(psutil, "sensors_temperatures"):
+            return {}
+        
+        return psutil.sensors_temperatures()
+
+# Monitor shared by every tab
+monitor = SystemMonitor()
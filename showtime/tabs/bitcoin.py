@@ -2,17 +2,33 @@ from context import Screen, ScreenContext
 from tabs.tab import Tab
 
 from utils import format_timespan
+from widgets import Layout, Label, Field
+
+from rpc import JsonRpcClient, JsonRpcError
+from httpcache import CachedResource
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import sys
-import time
-import urllib2
-import httplib
+import http.client
 import json
 import random
-import pyjsonrpc
 import socket
 
+BitcoindSnapshot = namedtuple("BitcoindSnapshot", ["error", "connections", "inbound", "outbound",
+                                                   "block_count", "utx_count", "utx_count_on_block",
+                                                   "utx_start_time", "last_block_time"])
+
+# updated is the timestamp of when the price was last confirmed by the source
+PriceSnapshot = namedtuple("PriceSnapshot", ["source", "data", "updated"])
+
 class Bitcoind(Tab):
+    refresh_interval = 5
+    
+    # Shows how much time has passed
+    redraw_interval = 1
+    
     def __init__(self, config):
         self.title = "bitcoind stats"
         
@@ -37,121 +53,186 @@ class Bitcoind(Tab):
         self.difficulty = 1.0
         self.block_count = 0
         
-        self.last_block_time = int(time.time())
+        self.last_block_time = int(self.now())
         
         # Create the JSON-RPC client
-        self.client = pyjsonrpc.HttpClient(
-            url = config["host"],
-            username = config["username"],
-            password = config["password"],
-            
-            timeout = 4
-        )
+        self.client = JsonRpcClient(config["host"],
+                                    username=config["username"],
+                                    password=config["password"],
+                                    timeout=4)
+        
+        # Headers of the latest blocks, keyed by their hash
+        self.BLOCK_CACHE_SIZE = 4
+        self.block_headers = OrderedDict()
         
         self.error = None
         
+        self.snapshot = self.get_snapshot()
+        
+        self.layout = Layout(self.build_layout)
+        
+    def collect(self):
+        self.update_stats()
+        
+        return self.get_snapshot()
+        
+    def get_snapshot(self):
+        """
+        Returns the current stats as a BitcoindSnapshot
+        """
+        return BitcoindSnapshot(error=self.error,
+                                connections=self.connections,
+                                inbound=self.inbound,
+                                outbound=self.outbound,
+                                block_count=self.block_count,
+                                utx_count=self.utx_count,
+                                utx_count_on_block=self.utx_count_on_block,
+                                utx_start_time=self.utx_start_time,
+                                last_block_time=self.last_block_time)
+        
     def update_stats(self):
         self.error = None
         
         try:
-            blockcount = self.client.getblockcount()
-            peers = self.client.getpeerinfo()
-            utx = self.client.getrawmempool()
+            blockcount, network, mempool, bestblockhash = self.client.batch([("getblockcount",),
+                                                                             ("getnetworkinfo",),
+                                                                             ("getmempoolinfo",),
+                                                                             ("getbestblockhash",)])
             
-            bestblockhash = self.client.getbestblockhash()
+            # Nodes older than 0.21 don't count inbound and outbound connections
+            if "connections_in" in network:
+                peers = None
+            else:
+                peers = self.client.call("getpeerinfo")
             
-            latest_block = self.client.getblock(bestblockhash)
+            latest_block = self.get_block_header(bestblockhash)
         except socket.timeout:
-            print "Request timed out, bitcoind probably busy"
+            print("Request timed out, bitcoind probably busy")
             self.error = "Request timed out, bitcoind probably busy"
             return
-        except urllib2.URLError as e:
-            print "Couldn't connect to bitcoind, error: %s" % e
+        except JsonRpcError as e:
+            print("Error in response from bitcoind: %s" % e)
+            
+            # Wrong credentials get a 401 without a JSON-RPC error
+            self.error = "Authentication failed" if e.code == 401 else e.message or str(e)
+            return
+        except (OSError, http.client.HTTPException) as e:
+            print("Couldn't connect to bitcoind, error: %s" % e)
             self.error = e
             return
         
-        if 'error' in peers or \
-           'error' in utx or \
-           'error' in latest_block:
-            print "Error in response, skipping"
+        if self.block_count != blockcount:
+            self.utx_count_on_block = mempool["size"]
+            
+            if self.utx_start_time != -1:
+                self.utx_start_time = int(self.now())
+            
+        self.block_count = blockcount
+        
+        if peers is None:
+            self.connections = network["connections"]
+            self.inbound = network["connections_in"]
+            self.outbound = network["connections_out"]
         else:
-            if self.block_count != blockcount:
-                self.utx_count_on_block = len(utx)
-                
-                if self.utx_start_time != -1:
-                    self.utx_start_time = int(time.time())
-                
-            self.block_count = blockcount
+            self.connections = len(peers)
+            self.inbound = len([peer for peer in peers if peer["inbound"]])
+            self.outbound = self.connections - self.inbound
         
-            self.connections = 0
-            self.inbound = 0
-            self.outbound = 0
+        if network.get("localaddresses"):
+            self.addrlocal = network["localaddresses"][0]["address"]
             
-            for peer in peers:
-                if peer['inbound']:
-                    self.inbound += 1
-                else:
-                    self.outbound += 1
-                    
-                self.connections += 1
-                
-                if 'addrlocal' in peer:
-                    self.addrlocal = peer['addrlocal']
+        self.utx_count = mempool["size"]
+        
+        # Get the timestamp from the latest block if it's available            
+        if 'time' in latest_block:
+            self.last_block_time = latest_block['time']
+        else:
+            self.last_block_time = self.utx_start_time
                 
-            self.utx_count = len(utx)
+        # If this is the first time we ever fetched the transactions,
+        # set the current time as the starting point for calculating tx/s
+        if self.utx_start_time == -1:
+            self.utx_start_time = int(self.now())
+    
+    def get_block_header(self, block_hash):
+        """
+        Returns the header of a block, fetching it only if it isn't cached yet
+        """
+        if block_hash not in self.block_headers:
+            self.block_headers[block_hash] = self.client.call("getblockheader", block_hash)
             
-            # Get the timestamp from the latest block if it's available            
-            if 'time' in latest_block:
-                self.last_block_time = latest_block['time']
-            else:
-                self.last_block_time = self.utx_start_time
-                    
-            # If this is the first time we ever fetched the transactions,
-            # set the current time as the starting point for calculating tx/s
-            if self.utx_start_time == -1:
-                self.utx_start_time = int(time.time())
+            # The best block hash only changes when a new block is found,
+            # so there's no need to remember many blocks
+            while len(self.block_headers) > self.BLOCK_CACHE_SIZE:
+                self.block_headers.popitem(last=False)
+                
+        return self.block_headers[block_hash]
+    
+    def close(self):
+        self.client.close()
+    
+    def get_connections_color(self, connections):
+        if connections < self.CONNECTION_YELLOW_THRESHOLD:
+            return Screen.RED
+        elif connections <= self.CONNECTION_GREEN_THRESHOLD:
+            return Screen.YELLOW
+        
+        return Screen.GREEN
+    
+    def build_layout(self, layout, columns, structure):
+        layout.add(Label(self.host.replace("http://", ""), Screen.YELLOW))
+        layout.end_line().newline()
+        
+        layout.add(Label("Connections: "))
+        layout.add(Field("connections", color=self.get_connections_color))
+        layout.add(Label("    inbound: "))
+        layout.add(Field("inbound", color=Screen.YELLOW))
+        layout.add(Label("   outbound: "))
+        layout.add(Field("outbound", color=Screen.YELLOW))
+        layout.newline()
+        
+        layout.add(Label("Blocks: "))
+        layout.add(Field("block_count", color=Screen.YELLOW))
+        layout.add(Label("Unconf. tx: "))
+        layout.newline()
+        layout.add(Field("utx", format=lambda utx: "%d (%.2f tx/s)" % utx, color=Screen.YELLOW))
+        
+        layout.add(Label("Time since block: "))
+        layout.end_line()
+        layout.add(Field("time_since_block", format=format_timespan, color=Screen.YELLOW))
     
     def render_tab(self, ctx):
-        self.update_stats()
+        snapshot = self.snapshot
         
-        if self.error:
-            ctx.fg_color(Screen.RED).write_line(str(self.error)).fg_color(Screen.WHITE)
+        if snapshot.error:
+            # The whole layout has to be drawn again once the error is gone
+            self.layout.forget(ctx)
+            
+            ctx.fg_color(Screen.RED).write_line(str(snapshot.error)).fg_color(Screen.WHITE)
             return
         
-        ctx.bg_color(Screen.BLACK).fg_color(Screen.YELLOW).write_line(self.host.replace("http://", "")).linebreak()
-        
-        ctx.fg_color(Screen.WHITE).write("Connections: ")
-        
-        if self.connections < self.CONNECTION_YELLOW_THRESHOLD:
-            ctx.fg_color(Screen.RED)
-        elif self.connections >= self.CONNECTION_YELLOW_THRESHOLD and self.connections <= self.CONNECTION_GREEN_THRESHOLD:
-            ctx.fg_color(Screen.YELLOW)
-        else:
-            ctx.fg_color(Screen.GREEN)
-        
-        ctx.write_line(str(self.connections))
-        ctx.fg_color(Screen.WHITE).write("    inbound: ").fg_color(Screen.YELLOW).write_line(str(self.inbound))
-        ctx.fg_color(Screen.WHITE).write("   outbound: ").fg_color(Screen.YELLOW).write_line(str(self.outbound)).linebreak()
-        
-        ctx.fg_color(Screen.WHITE).write("Blocks: ").fg_color(Screen.YELLOW).write_line(str(self.block_count))
-        ctx.fg_color(Screen.WHITE).write("Unconf. tx: ").linebreak().fg_color(Screen.YELLOW).write(str(self.utx_count))
-        
-        current_time = int(time.time())
-        time_since_start = current_time - self.utx_start_time
+        current_time = int(self.now())
+        time_since_start = current_time - snapshot.utx_start_time
         
         if time_since_start != 0:
-            tx_per_second = float(self.utx_count - self.utx_count_on_block) / float(time_since_start)
+            tx_per_second = float(snapshot.utx_count - snapshot.utx_count_on_block) / float(time_since_start)
         else:
             tx_per_second = 0.0
             
-        time_since_block = current_time - self.last_block_time
-        
-        ctx.write_line(" (%.2f tx/s)" % tx_per_second).fg_color(Screen.WHITE)
-        
-        ctx.write_line("Time since block: ").fg_color(Screen.YELLOW).write_line(format_timespan(time_since_block))
+        self.layout.render(ctx, {"connections": snapshot.connections,
+                                 "inbound": snapshot.inbound,
+                                 "outbound": snapshot.outbound,
+                                 "block_count": snapshot.block_count,
+                                 "utx": (snapshot.utx_count, tx_per_second),
+                                 "time_since_block": current_time - snapshot.last_block_time})
         
 class BitcoinPrice(Tab):
-    def __init__(self):
+    refresh_interval = 60
+    
+    # Shows how much time has passed
+    redraw_interval = 1
+    
+    def __init__(self, config={}):
         self.title = "Bitcoin price"
         
         self.last = 0.0
@@ -159,11 +240,10 @@ class BitcoinPrice(Tab):
         self.high = 0.0
         self.low = 0.0
         
-        self.price_data = {"source": "Couldn't update price",
-                           "data": {}}
+        self.snapshot = PriceSnapshot(source="Couldn't update price", data=(), updated=None)
         
-        # The price sources are checked starting from the first one
-        # until a valid response is received
+        # The price sources are queried at the same time and the first valid
+        # response is used
         self.price_sources = [{"api_url": "https://api.bitcoinaverage.com/ticker/global/USD/",
                                "name": "BitcoinAverage",
                                "data": { "Last": "last",
@@ -178,46 +258,81 @@ class BitcoinPrice(Tab):
                                          "Low": "low",
                                          "24h avg": "vwap"}},]
         
-        self.UPDATE_INTERVAL = 120
-        self.last_update = 0
-        
-    def update_price(self):
-        current_time = time.time()
-        
-        if current_time >= self.last_update + 60:
-            # Go through all of the available price sources until we have one that works
-            for source in self.price_sources:
-                try:
-                    print "Updating %s" % source["name"]
-                    response = urllib2.urlopen(source["api_url"]).read()
-                    response = json.loads(response)
-                except:
-                    # Couldn't retrieve ticker data, proceed to next source in the list
-                    print "Couldn't retrieve ticker data from %s, skipping..." % source["name"]
+        # CachedResource for each price source, keyed by name
+        self.resources = {}
+        
+        for source in self.price_sources:
+            self.resources[source["name"]] = CachedResource(source["api_url"],
+                                                            timeout=source.get("timeout", 5))
+        
+        self.executor = ThreadPoolExecutor(max_workers=len(self.price_sources),
+                                           thread_name_prefix="price")
+        
+        # Latest query made to each source, keyed by name
+        self.queries = {}
+        
+    def collect(self):
+        futures = {}
+        
+        # Query every source that isn't backing off after failures. Queries that
+        # are still running since the last update take part again.
+        for source in self.price_sources:
+            future = self.queries.get(source["name"])
+            
+            if future is None or future.done():
+                if not self.resources[source["name"]].is_available():
                     continue
                 
-                self.price_data["source"] = source["name"]
-                self.price_data["data"] = {}
-                
-                for name, key in source["data"].iteritems():
-                    self.price_data["data"][name] = float(response[key])
-                    
+                future = self.executor.submit(self.fetch_price, source)
+                self.queries[source["name"]] = future
+            
+            futures[future] = source
+        
+        for future in as_completed(futures):
+            try:
                 # Stop updating after the first working result
-                break
-                
-            self.last_update = current_time
+                return future.result()
+            except Exception as e:
+                # Couldn't retrieve ticker data, wait for the other sources
+                print("Couldn't retrieve ticker data from %s, skipping... (%s)" % (futures[future]["name"], e))
+        
+        # Keep showing the last price
+        return self.snapshot
+    
+    def fetch_price(self, source):
+        """
+        Returns a PriceSnapshot from a single price source
+        """
+        resource = self.resources[source["name"]]
+        response = resource.fetch()
+        
+        try:
+            data = tuple((name, float(response[key])) for name, key in source["data"].items())
+        except (KeyError, TypeError, ValueError):
+            # A response that doesn't contain the price counts as a failure
+            resource.failed()
+            raise
+        
+        return PriceSnapshot(source=source["name"], data=data, updated=resource.updated)
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
         
     def render_tab(self, ctx):
-        # Update price if it hasn't been updated in the last 10 minutes
-        self.update_price()
+        snapshot = self.snapshot
+        
+        # Write the source and how old the price is
+        ctx.write_line(snapshot.source)
+        
+        if snapshot.updated is not None:
+            ctx.write_line("%s ago" % format_timespan(self.now() - snapshot.updated))
         
-        # Write the source
-        ctx.write_line(self.price_data["source"]).linebreak()
+        ctx.linebreak()
         
         ctx.set_text_size(3)
         
         # Write the data
-        for entry, value in self.price_data["data"].iteritems():
+        for entry, value in snapshot.data:
             ctx.write_line(entry).fg_color(Screen.YELLOW).write_line("$%.2f" % value).fg_color(Screen.WHITE).linebreak()
         
         #ctx.set_text_size(3).bg_color(Screen.BLACK).write("Last ").fg_color(Screen.YELLOW).linebreak().write_line("$%.2f" % self.last).linebreak()
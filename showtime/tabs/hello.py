@@ -4,7 +4,7 @@ from tabs.tab import Tab
 import time
 
 class HelloTab(Tab):
-    def __init__(self):
+    def __init__(self, config={}):
         self.title = "Hello World Tab"
         
     def render_tab(self, ctx):
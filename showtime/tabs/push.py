@@ -0,0 +1,143 @@
+from context import Screen, ScreenContext
+from tabs.tab import Tab
+from widgets import Layout, Label, Field, ProgressBar, Sparkline
+
+import ingest
+import metrics
+
+class PushTab(Tab):
+    # Only copies the values out of the store, which is cheap
+    refresh_interval = 1
+    
+    # How many keys are shown at most if values isn't given
+    MAX_KEYS = 16
+    
+    def __init__(self, config={}):
+        """
+        Shows values pushed by other programs, see ingest.py. The settings are
+        
+        title: title of the tab
+        values: values shown on the tab, each a dict with
+            
+            key: name the value is pushed with
+            label: shown before the value (default: the key)
+            show: "value", "bar" to also show a bar filled up to max, or "sparkline"
+                  to also show the latest values (default: "value")
+            format: format of the value, eg. "%.1f ms" (default: "%g", or "%s" for text)
+            max: value of a full bar, or the top of the sparkline (default: 1 for bars,
+                 the highest value for sparklines)
+            stale_after: the value is shown in red if it hasn't been pushed for
+                         this many seconds (optional)
+        
+        If values isn't given, every pushed key is shown.
+        """
+        self.title = config.get("title", "Pushed values")
+        
+        self.values = [dict(value) for value in config.get("values", [])]
+        
+        for value in self.values:
+            value.setdefault("label", value["key"])
+            value.setdefault("show", "value")
+            
+            if value["show"] not in ("value", "bar", "sparkline"):
+                raise ValueError("show should be value, bar or sparkline, not %s" % value["show"])
+            
+            if value.get("max", 1) <= 0:
+                raise ValueError("max should be larger than 0")
+        
+        # Stale values turn red even if nothing else changes
+        if any("stale_after" in value for value in self.values):
+            self.redraw_interval = 1
+        
+        self.snapshot = ()
+        
+        # Update time of the samples of each key that couldn't be formatted,
+        # so that each of them is only counted once in metrics.PUSH_ERRORS
+        self.format_errors = {}
+        
+        self.layout = Layout(self.build_layout)
+    
+    def collect(self):
+        keys = [value["key"] for value in self.values] or ingest.store.get_names()[:self.MAX_KEYS]
+        
+        return tuple((key, ingest.store.get(key)) for key in keys)
+    
+    def get_settings(self, key):
+        """
+        Returns the settings of a key, the defaults if it isn't listed in values
+        """
+        for value in self.values:
+            if value["key"] == key:
+                return value
+        
+        return {"key": key, "label": key, "show": "value"}
+    
+    def format_value(self, key, format, sample):
+        """
+        Returns the value of a sample formatted as the key's settings say. A value that
+        doesn't fit the format, eg. text pushed to a key formatted as a number, is
+        shown as it is instead, as anyone can push to any key.
+        """
+        try:
+            return format % sample.value
+        except (TypeError, ValueError):
+            if self.format_errors.get(key) != sample.updated:
+                self.format_errors[key] = sample.updated
+                metrics.PUSH_ERRORS.inc()
+            
+            return "%s" % sample.value
+    
+    def build_layout(self, layout, columns, structure):
+        for i, key in enumerate(structure):
+            settings = self.get_settings(key)
+            
+            layout.add(Label(settings["label"]))
+            layout.add(Field("value%d" % i, format=lambda text: " " + text,
+                             color=lambda stale: Screen.RED if stale else Screen.YELLOW,
+                             color_by="stale%d" % i))
+            
+            if settings["show"] == "bar":
+                layout.add(Label("["))
+                layout.add(ProgressBar("bar%d" % i, columns-2))
+                layout.add(Label("]"))
+            elif settings["show"] == "sparkline":
+                layout.add(Label("["))
+                layout.add(Sparkline("history%d" % i, columns-2, high=settings.get("max")))
+                layout.add(Label("]"))
+    
+    def render_tab(self, ctx):
+        if not self.snapshot:
+            # The whole layout has to be drawn once there are values
+            self.layout.forget(ctx)
+            
+            ctx.write_line("Nothing has been pushed yet")
+            
+            if ingest.server is None:
+                ctx.linebreak().write_line("Start with --push-port or --push-socket to receive values")
+                
+            return
+        
+        now = self.now()
+        values = {}
+        
+        for i, (key, sample) in enumerate(self.snapshot):
+            settings = self.get_settings(key)
+            
+            if sample is None:
+                values["value%d" % i] = "-"
+                values["stale%d" % i] = False
+                values["bar%d" % i] = 0.0
+                values["history%d" % i] = ()
+                continue
+            
+            if sample.type == "t":
+                values["value%d" % i] = self.format_value(key, settings.get("format", "%s"), sample)
+                values["bar%d" % i] = 0.0
+            else:
+                values["value%d" % i] = self.format_value(key, settings.get("format", "%g"), sample)
+                values["bar%d" % i] = min(max(sample.value / settings.get("max", 1.0), 0.0), 1.0)
+            
+            values["stale%d" % i] = "stale_after" in settings and now - sample.updated > settings["stale_after"]
+            values["history%d" % i] = sample.history
+        
+        self.layout.render(ctx, values, tuple(key for key, sample in self.snapshot))
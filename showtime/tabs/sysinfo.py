@@ -1,117 +1,288 @@
 from context import Screen, ScreenContext
 from tabs.tab import Tab
-from utils import format_timespan, get_progress_bar
+from utils import format_timespan, format_size_short
+from widgets import Layout, Label, Field, ProgressBar, Sparkline, get_threshold_color
+from history import RingBuffer, WINDOWS, get_sample_count
+from system import monitor, PSEUDO_FSTYPES
 
-import psutil
-import time
+from collections import namedtuple
+
+import heapq
 import humanfriendly
 
+SystemSnapshot = namedtuple("SystemSnapshot", ["cpu_usages", "used_ram", "total_ram", "boot_time", "load"])
+
+# DiskPartitionUsage of each mounted partition, and the usage history of each.
+# The history is part of the snapshot so that new samples are shown even
+# when the usage stays the same.
+DiskSnapshot = namedtuple("DiskSnapshot", ["usages", "histories"])
+
 class SystemStats(Tab):
-    def __init__(self):
+    refresh_interval = 1
+    
+    # Shows how much time has passed
+    redraw_interval = 1
+    
+    def __init__(self, config={}):
         self.title = "System stats"
         
-        self.cpu_usages = [0.0] * len(psutil.cpu_percent(percpu=True))
+        cpu_count = len(monitor.get("cpu"))
         
-        self.used_ram = 12505903
-        self.total_ram = 20189390
+        self.snapshot = SystemSnapshot(cpu_usages=(0.0,) * cpu_count,
+                                       used_ram=12505903,
+                                       total_ram=20189390,
+                                       boot_time=self.now(),
+                                       load=0.0)
         
         self.YELLOW_THRESHOLD = 0.33
         self.RED_THRESHOLD = 0.66
         
-        self.uptime = 0
+        # History of the samples, long enough for the longest window
+        history_length = get_sample_count(WINDOWS[-1][0], self.refresh_interval)
         
-    def render_tab(self, ctx):
-        # Update system info
-        self.update_sysinfo()
-
-        # Print CPU usage
-        for i in range(0, len(self.cpu_usages)):
-            cpu_usage = self.cpu_usages[i]
-            
-            ctx.fg_color(Screen.WHITE)
+        self.cpu_history = [RingBuffer(history_length) for i in range(0, cpu_count)]
+        self.ram_history = RingBuffer(history_length)
+        self.load_history = RingBuffer(history_length)
+        
+        # The shortest window is shown in the sparklines
+        self.SPARKLINE_SAMPLES = get_sample_count(WINDOWS[0][0], self.refresh_interval)
+        
+        self.layout = Layout(self.build_layout)
+        
+    def build_layout(self, layout, columns, structure):
+        for i in range(0, len(self.cpu_history)):
+            # CPU usage and the usage during the last minute
+            layout.add(Label("CPU %d:" % i))
+            layout.add(Field("cpu%d" % i, format=lambda usage: " %.2f %%" % (usage*100), color=Screen.YELLOW))
             
-            ctx.write("CPU %d:" % i).fg_color(Screen.YELLOW).write_line(" %.2f %%" % (cpu_usage*100)).fg_color(Screen.WHITE).write("[")
+            layout.add(Label("["))
+            layout.add(Sparkline("cpu_history%d" % i, columns-2, color_by="cpu%d" % i,
+                                 color=lambda usage: get_threshold_color(usage, self.YELLOW_THRESHOLD, self.RED_THRESHOLD)))
+            layout.add(Label("]"))
             
-            if cpu_usage < self.YELLOW_THRESHOLD:
-                ctx.fg_color(Screen.GREEN)
-            elif cpu_usage >= self.YELLOW_THRESHOLD and cpu_usage <= self.RED_THRESHOLD:
-                ctx.fg_color(Screen.YELLOW)
-            else:
-                ctx.fg_color(Screen.RED)
-                
-            ctx.write(get_progress_bar(ctx.get_columns()-2, cpu_usage)).fg_color(Screen.WHITE).write("]")
-            
-        # Print RAM
-        used = humanfriendly.format_size(self.used_ram)
-        total = humanfriendly.format_size(self.total_ram)
-        ctx.linebreak().write_line("RAM").fg_color(Screen.YELLOW).write_line("%s / %s" % (used, total)).fg_color(Screen.WHITE)
+        # RAM and the highest usage during the longest window
+        layout.newline().add(Label("RAM"))
+        layout.add(Field("ram_stats", format=lambda stats: " %s max %d%%" % (WINDOWS[-1][1], stats[1] * 100) if stats else ""))
+        layout.add(Field("ram", color=Screen.YELLOW))
+        
+        layout.add(Label("["))
+        layout.add(ProgressBar("ram_usage", columns-2, self.YELLOW_THRESHOLD, self.RED_THRESHOLD))
+        layout.add(Label("]"))
+        
+        # Average load over each window
+        layout.newline().add(Label("Load"))
+        layout.add(Field("load", format=lambda loads: "".join(" %.2f" % load for load in loads), color=Screen.YELLOW))
         
-        ram_usage = float(self.used_ram) / float(self.total_ram)
+        layout.add(Label("["))
+        layout.add(Sparkline("load_history", columns-2, high=None))
+        layout.add(Label("]"))
+        
+        layout.newline().add(Label("Uptime:"))
+        layout.end_line()
+        layout.add(Field("uptime", format=format_timespan, color=Screen.YELLOW))
+        
+    def render_tab(self, ctx):
+        snapshot = self.snapshot
+        
+        values = {"ram": "%s / %s" % (humanfriendly.format_size(snapshot.used_ram),
+                                      humanfriendly.format_size(snapshot.total_ram)),
+                  "ram_stats": self.ram_history.get_stats(),
+                  "ram_usage": float(snapshot.used_ram) / float(snapshot.total_ram),
+                  "load_history": self.load_history.get_values(self.SPARKLINE_SAMPLES),
+                  "uptime": self.now() - snapshot.boot_time}
+        
+        for i, cpu_usage in enumerate(snapshot.cpu_usages):
+            values["cpu%d" % i] = cpu_usage
+            values["cpu_history%d" % i] = self.cpu_history[i].get_values(self.SPARKLINE_SAMPLES)
             
-        ctx.write("[")
+        loads = []
         
-        if ram_usage < 0.33:
-            ctx.fg_color(Screen.GREEN)
-        elif ram_usage >= 0.33 and ram_usage <= 0.66:
-            ctx.fg_color(Screen.YELLOW)
-        else:
-            ctx.fg_color(Screen.RED)
+        for seconds, name in WINDOWS:
+            load_stats = self.load_history.get_stats(get_sample_count(seconds, self.refresh_interval))
+            loads.append(load_stats[2] if load_stats else snapshot.load)
             
-        ctx.write(get_progress_bar(ctx.get_columns()-2, ram_usage)).fg_color(Screen.WHITE).write("]")
+        values["load"] = loads
         
-        # Print uptime
-        ctx.linebreak().write_line("Uptime:").fg_color(Screen.YELLOW).write_line("%s" % format_timespan(self.uptime)).fg_color(Screen.WHITE)
+        self.layout.render(ctx, values)
     
-    def update_sysinfo(self):
-        cpu_times = psutil.cpu_percent(percpu=True)
+    def collect(self):
+        memory = monitor.get("memory")
+        
+        snapshot = SystemSnapshot(cpu_usages=monitor.get("cpu"),
+                                  used_ram=memory.total - memory.available,
+                                  total_ram=memory.total,
+                                  boot_time=monitor.get("boot_time"),
+                                  load=monitor.get("load")[0])
         
-        for i, cpu_time in enumerate(cpu_times):
-            self.cpu_usages[i] = float(cpu_time / 100)
+        for cpu_history, cpu_usage in zip(self.cpu_history, snapshot.cpu_usages):
+            cpu_history.append(cpu_usage)
             
-        self.total_ram = psutil.virtual_memory().total
-        self.used_ram = psutil.virtual_memory().total - psutil.virtual_memory().available
+        self.ram_history.append(float(snapshot.used_ram) / float(snapshot.total_ram))
+        self.load_history.append(snapshot.load)
         
-        self.uptime = time.time() - psutil.boot_time()
+        return snapshot
         
 class DiskUsage(Tab):
-    def __init__(self):
+    refresh_interval = 5
+    
+    def __init__(self, config={}):
         self.title = "Disk usage"
         
-        self.disk_usage = {}
+        # File system types and mount points that aren't shown
+        self.exclude_fstypes = config.get("exclude_fstypes", [])
+        self.exclude_mountpoints = config.get("exclude_mountpoints", [])
+        
+        # File systems that don't store anything on a disk, such as tmpfs, are
+        # only shown if their type is listed here
+        self.include_fstypes = config.get("include_fstypes", [])
+        
+        monitor.disks.include_fstypes(self.include_fstypes)
+        
+        self.snapshot = DiskSnapshot(usages=(), histories=())
         
         self.YELLOW_THRESHOLD = 0.33
         self.RED_THRESHOLD = 0.66
         
+        # RingBuffer of usage for each mount point, covering the longest window
+        self.history = {}
+        self.HISTORY_LENGTH = get_sample_count(WINDOWS[-1][0], self.refresh_interval)
+        
+        self.layout = Layout(self.build_layout)
+        
+    def build_layout(self, layout, columns, structure):
+        for i, (mountpoint, state, error) in enumerate(structure):
+            layout.add(Label(mountpoint))
+            layout.end_line()
+            
+            if state == "unavailable":
+                layout.add(Label(error, Screen.RED))
+                layout.end_line().newline()
+                continue
+            
+            if state == "unknown":
+                layout.add(Label("Unresponsive", Screen.RED))
+                layout.end_line().newline()
+                continue
+            
+            if state == "stale":
+                # Show the last known usage, but make it obvious that it's out of date
+                layout.add(Label("Unresponsive", Screen.RED))
+                layout.end_line()
+                
+            layout.add(Field("used%d" % i, color=Screen.YELLOW))
+            
+            layout.add(Label("["))
+            layout.add(ProgressBar("usage%d" % i, columns-2, self.YELLOW_THRESHOLD, self.RED_THRESHOLD))
+            layout.add(Label("]"))
+            
+            # Show how the usage changed during the longest window
+            layout.add(Label("["))
+            layout.add(Sparkline("history%d" % i, columns-2))
+            layout.add(Label("]"))
+            
+            layout.newline()
+        
     def render_tab(self, ctx):
-        self.update_disk_usage()
+        structure = []
+        values = {}
         
-        for device_name, usage in self.disk_usage.items():
-            ctx.write_line("%s" % device_name)
+        for i, (usage, history) in enumerate(zip(self.snapshot.usages, self.snapshot.histories)):
+            if usage.error is not None:
+                structure.append((usage.mountpoint, "unavailable", usage.error))
+                continue
             
-            ctx.fg_color(Screen.YELLOW).write_line("%s / %s" % (humanfriendly.format_size(usage["used"]),
-                                                                humanfriendly.format_size(usage["total"])))
+            if usage.total is None:
+                structure.append((usage.mountpoint, "unknown", None))
+                continue
             
-            ctx.fg_color(Screen.WHITE).write("[")
+            structure.append((usage.mountpoint, "ok" if usage.responsive else "stale", None))
             
-            usage_percent = float(usage["used"]) / float(usage["total"])
+            values["used%d" % i] = "%s / %s" % (humanfriendly.format_size(usage.used),
+                                                humanfriendly.format_size(usage.total))
+            values["usage%d" % i] = float(usage.used) / float(usage.total)
+            values["history%d" % i] = history
             
-            if usage_percent < self.YELLOW_THRESHOLD:
-                ctx.fg_color(Screen.GREEN)
-            elif usage_percent >= self.YELLOW_THRESHOLD and usage_percent <= self.RED_THRESHOLD:
-                ctx.fg_color(Screen.YELLOW)
-            else:
-                ctx.fg_color(Screen.RED)
-                
-            ctx.write(get_progress_bar(ctx.get_columns()-2, usage_percent)).fg_color(Screen.WHITE).write("]").linebreak()
+        # The layout only changes when partitions are mounted or become unresponsive
+        self.layout.render(ctx, values, tuple(structure))
         
-    def update_disk_usage(self):
-        disk_partitions = psutil.disk_partitions()
+    def collect(self):
+        # Another tab may have asked for file system types this one doesn't show
+        disk_usage = [usage for usage in monitor.get("disk_usage")
+                      if usage.fstype not in self.exclude_fstypes and
+                      usage.mountpoint not in self.exclude_mountpoints and
+                      (usage.fstype not in PSEUDO_FSTYPES or usage.fstype in self.include_fstypes)]
         
-        for disk_partition in disk_partitions:
-            if disk_partition.mountpoint:
-                disk_usage = psutil.disk_usage(disk_partition.mountpoint)
-                
-                self.disk_usage[disk_partition.mountpoint] = {"total": disk_usage.total,
-                                                              "used": disk_usage.used}
-                
+        history = {}
+        
+        # Partitions that are no longer mounted are forgotten
+        for usage in disk_usage:
+            history[usage.mountpoint] = self.history.get(usage.mountpoint) or RingBuffer(self.HISTORY_LENGTH)
+            
+            if usage.responsive and usage.total is not None:
+                history[usage.mountpoint].append(float(usage.used) / float(usage.total))
+            
+        self.history = history
                 
+        return DiskSnapshot(usages=tuple(disk_usage),
+                            histories=tuple(tuple(history[usage.mountpoint].get_values())
+                                            for usage in disk_usage))
+        
+class TopProcesses(Tab):
+    # The process list is gathered at most this often, see SystemMonitor
+    refresh_interval = 2
+    
+    def __init__(self, config={}):
+        """
+        Shows the processes using the most CPU or memory. The settings are
+        
+        sort: "cpu" or "rss" to show the processes using the most memory (default: "cpu")
+        count: how many processes are shown (default: 10)
+        """
+        self.sort = config.get("sort", "cpu")
+        self.count = config.get("count", 10)
+        
+        if self.sort not in ("cpu", "rss"):
+            raise ValueError("sort should be cpu or rss, not %s" % self.sort)
+        
+        self.title = "Top CPU" if self.sort == "cpu" else "Top memory"
+        
+        # ProcessUsage of the processes shown, the heaviest first
+        self.snapshot = ()
+        
+        # Usage of a single core
+        self.YELLOW_THRESHOLD = 0.33
+        self.RED_THRESHOLD = 0.66
+        
+        self.layout = Layout(self.build_layout)
+        
+    def get_sort_key(self, usage):
+        if self.sort == "cpu":
+            return (usage.cpu, usage.rss)
+        
+        return (usage.rss, usage.cpu)
+        
+    def build_layout(self, layout, columns, structure):
+        layout.add(Label("Process", width=columns-12))
+        layout.add(Label("   CPU"))
+        layout.add(Label("   RSS"))
+        
+        for i in range(0, structure):
+            layout.add(Field("name%d" % i, columns-12))
+            layout.add(Field("cpu%d" % i, 6, format=lambda cpu: "%5.0f%%" % (cpu*100),
+                             color=lambda cpu: get_threshold_color(cpu, self.YELLOW_THRESHOLD, self.RED_THRESHOLD)))
+            layout.add(Field("rss%d" % i, 6, format=lambda rss: " %5s" % format_size_short(rss), color=Screen.YELLOW))
+        
+    def render_tab(self, ctx):
+        values = {}
+        
+        for i, usage in enumerate(self.snapshot):
+            values["name%d" % i] = usage.name
+            values["cpu%d" % i] = usage.cpu
+            values["rss%d" % i] = usage.rss
+            
+        # The layout only changes when there are fewer processes than count
+        self.layout.render(ctx, values, len(self.snapshot))
+        
+    def collect(self):
+        # Only the heaviest processes are kept in order, instead of sorting all of them
+        return tuple(heapq.nlargest(self.count, monitor.get("processes"), key=self.get_sort_key))
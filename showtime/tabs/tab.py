@@ -1,9 +1,44 @@
+import time
+
 class Tab:
+    # How often collect() should be run, in seconds. None if the tab
+    # doesn't collect any data.
+    refresh_interval = None
+    
+    # Latest result of collect()
+    snapshot = None
+    
+    # How often the tab has to be redrawn even if snapshot doesn't change, in seconds,
+    # eg. if it shows how much time has passed. None if it only changes with snapshot.
+    redraw_interval = None
+    
     def __init__(self, config={}):
         """
         Do something with the provided settings here
         """
         self.title = "DEFAULT TITLE"
     
+    def collect(self):
+        """
+        Collect the data shown on the tab. This is run in a background thread
+        every refresh_interval seconds and should return an immutable snapshot
+        of the data, which is published as self.snapshot for render_tab to use.
+        """
+        return None
+    
+    def now(self):
+        """
+        Returns the current time as time.time() does. Tabs get the time from here,
+        so that they can be given another clock, eg. by benchmark.py.
+        """
+        return time.time()
+    
     def render_tab(self, ctx):
-        raise NotImplementedError("render_tab not implemented on %s!" % self.__class__.__name__)
\ No newline at end of file
+        raise NotImplementedError("render_tab not implemented on %s!" % self.__class__.__name__)
+    
+    def close(self):
+        """
+        Release anything the tab keeps open. Called when the tab is removed
+        from the config while the program is running.
+        """
+        pass
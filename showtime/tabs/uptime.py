@@ -1,63 +1,201 @@
 from context import Screen, ScreenContext
 from tabs.tab import Tab
 
-from urllib.request import urlopen
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import http.client
+import threading
 import time
 
 from utils import format_timespan
 
+# down_since is the timestamp of when the website went down, -1 if it's up.
+# latency is the response time in seconds, None if the website is down.
+WebsiteStatus = namedtuple("WebsiteStatus", ["name", "up", "down_since", "latency"])
+
 class WebsiteUptime(Tab):
+    refresh_interval = 60
+    
+    # Shows how much time has passed
+    redraw_interval = 1
+    
+    # How many idle connections are kept open to each host
+    MAX_IDLE_CONNECTIONS = 2
+    
     def __init__(self, config):
         self.title = "Website uptime"
         
         self.websites = config["websites"]
         
-        # Websites' uptime status as a bool
-        self.website_status = {}
+        for website in self.websites:
+            url = urlsplit(website["url"])
+            
+            if url.scheme not in ("http", "https") or not url.hostname:
+                raise ValueError("%s should be a URL starting with http:// or https://" % website["url"])
+            
+            # Raises a ValueError if the port isn't a number
+            url.port
+        
+        # How many seconds to wait for a response
+        self.timeout = config.get("timeout", 5)
+        
+        # How many websites are checked at the same time
+        self.executor = ThreadPoolExecutor(max_workers=config.get("concurrency", 8),
+                                           thread_name_prefix="uptime")
+        
+        # Idle connections kept open between checks, keyed by (scheme, host, port)
+        self.connections = {}
+        self.lock = threading.Lock()
+        
+        # WebsiteStatus for each website that has been checked
+        self.snapshot = ()
         
         # Timestamps of when websites went down
         self.downtime = {}
-            
-        # Timestamp of the last update
-        self.last_update = 0
         
         for website in self.websites:
             self.downtime[website["name"]] = -1
         
-    def update_uptime(self):
-        current_time = time.time()
+    def collect(self):
+        # Every website is checked on its own, so a refresh takes about as long
+        # as the slowest check as long as there are enough workers
+        futures = [self.executor.submit(self.check_website, website["url"])
+                   for website in self.websites]
+        
+        latencies = {}
         
-        if current_time >= self.last_update + 60:
-            for website in self.websites:
-                # Is the website down?
-                down = False
+        for website, future in zip(self.websites, futures):
+            latencies[website["name"]] = future.result()
+        
+        website_status = []
+        
+        for website in self.websites:
+            latency = latencies[website["name"]]
+            down = latency is None
                 
-                # Try to get a response
-                # If we get an exception assume the site is down
-                try:
-                    response = urlopen(website["url"], timeout=5)
-                except:
-                    down = True
-                    
-                if not down:
-                    self.website_status[website["name"]] = True
-                    
-                    self.downtime[website["name"]] = -1
-                else:
-                    self.website_status[website["name"]] = False
+            if not down:
+                self.downtime[website["name"]] = -1
+            elif self.downtime[website["name"]] == -1:
+                self.downtime[website["name"]] = int(self.now())
+                
+            website_status.append(WebsiteStatus(name=website["name"],
+                                                up=not down,
+                                                down_since=self.downtime[website["name"]],
+                                                latency=latency))
                     
-                    if self.downtime[website["name"]] == -1:
-                        self.downtime[website["name"]] = int(time.time())
-                        
-            self.last_update = current_time
+        return tuple(website_status)
+    
+    def check_website(self, url):
+        """
+        Returns the time in seconds it took to get a response from the website,
+        or None if the website is down
+        """
+        url = urlsplit(url)
+        host = (url.scheme, url.hostname, url.port)
+        path = url.path or "/"
+        
+        if url.query:
+            path += "?" + url.query
+        
+        for attempt in range(0, 2):
+            connection = self.get_connection(host)
+            reused = connection.sock is not None
+            
+            start_time = time.monotonic()
+            
+            try:
+                status = self.request(connection, "HEAD", path)
+                
+                # Not every server supports HEAD, so ask for a single byte instead
+                if status in (405, 501):
+                    status = self.request(connection, "GET", path, {"Range": "bytes=0-0"})
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                
+                # The server may have closed a connection that was kept open,
+                # so try again with a new one. A server that doesn't answer in
+                # time isn't asked again, so a check never takes much longer
+                # than the timeout.
+                if reused and not isinstance(e, TimeoutError):
+                    continue
+                
+                return None
+            
+            latency = time.monotonic() - start_time
+            
+            self.put_connection(host, connection)
+            
+            # Redirects mean the server is responding
+            if status >= 400:
+                return None
+            
+            return latency
+        
+        return None
+    
+    def get_connection(self, host):
+        """
+        Returns an idle connection to the host, or a new one if there isn't any
+        """
+        with self.lock:
+            idle = self.connections.get(host)
+            
+            if idle:
+                return idle.pop()
+        
+        scheme, hostname, port = host
+        
+        if scheme == "https":
+            return http.client.HTTPSConnection(hostname, port, timeout=self.timeout)
+        
+        return http.client.HTTPConnection(hostname, port, timeout=self.timeout)
+    
+    def put_connection(self, host, connection):
+        """
+        Keeps a connection open for the next check of the host, unless
+        enough connections to the host are kept already
+        """
+        with self.lock:
+            idle = self.connections.setdefault(host, [])
+            
+            if connection.sock is not None and len(idle) < self.MAX_IDLE_CONNECTIONS:
+                idle.append(connection)
+                return
+        
+        connection.close()
+    
+    def request(self, connection, method, path, headers={}):
+        """
+        Makes a request and returns the status code of the response
+        """
+        connection.request(method, path, headers=dict(headers, **{"User-Agent": "SHOWtime"}))
+        response = connection.getresponse()
+        
+        if method == "GET" and response.status != 206:
+            # The server ignored the range, don't download the whole response
+            connection.close()
+        else:
+            # The response has to be read before the connection can be reused
+            response.read()
+        
+        return response.status
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+        
+        with self.lock:
+            for idle in self.connections.values():
+                for connection in idle:
+                    connection.close()
+                
+            self.connections.clear()
                     
     def render_tab(self, ctx):
-        self.update_uptime()
-        
-        for website, status in self.website_status.items():
-            ctx.fg_color(Screen.WHITE).write_line(website)
+        for status in self.snapshot:
+            ctx.fg_color(Screen.WHITE).write_line(status.name)
             
-            if status:
-                ctx.fg_color(Screen.GREEN).write_line("UP").linebreak()
+            if status.up:
+                ctx.fg_color(Screen.GREEN).write_line("UP (%d ms)" % (status.latency * 1000)).linebreak()
             else:
-                ctx.fg_color(Screen.RED).write_line("DOWN for %s" % format_timespan(int(time.time() - self.downtime[website]))).linebreak()
+                ctx.fg_color(Screen.RED).write_line("DOWN for %s" % format_timespan(int(self.now() - status.down_since))).linebreak()
@@ -0,0 +1,149 @@
+"""
+The clients the tabs use to talk to servers, checked against the stub server
+of benchmark.py, including how they handle servers that close connections,
+return errors or don't answer
+"""
+
+import time
+import unittest
+
+from benchmark import start_stub_server, get_price_tab, SLOW_RESPONSE
+from httpcache import CachedResource
+from rpc import JsonRpcClient, JsonRpcError
+from tabs.bitcoin import Bitcoind
+
+class StubServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.requests = []
+        self.server.not_modified = 0
+
+        self.url = self.server.url
+
+class JsonRpcClientTest(StubServerTest):
+    def test_batch(self):
+        client = JsonRpcClient(self.url + "/", "user", "password", timeout=2)
+
+        self.assertEqual(client.batch([("getblockcount",), ("getmempoolinfo",)]), [800000, {"size": 1234}])
+
+        client.call("getbestblockhash")
+
+        # Calls are batched into a single request and the connection is kept open
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reconnect(self):
+        # A kept-open connection that the server has closed is replaced without failing the call
+        client = JsonRpcClient(self.url + "/close", timeout=2)
+
+        for i in range(0, 3):
+            self.assertEqual(client.call("getblockcount"), 800000)
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_error(self):
+        client = JsonRpcClient(self.url + "/", timeout=2)
+
+        with self.assertRaises(JsonRpcError) as raised:
+            client.batch([("getblockcount",), ("nosuchmethod",)])
+
+        self.assertEqual(raised.exception.code, -32601)
+
+        # The connection can still be used
+        self.assertEqual(client.call("getblockcount"), 800000)
+
+    def test_bitcoind_error(self):
+        # Errors returned by bitcoind are shown on the tab
+        bitcoind = Bitcoind({"host": self.url + "/denied", "username": "user", "password": "wrong"})
+
+        self.assertEqual(bitcoind.collect().error, "Authentication failed")
+
+        bitcoind.client = JsonRpcClient(self.url + "/", timeout=2)
+
+        snapshot = bitcoind.collect()
+
+        self.assertIsNone(snapshot.error)
+        self.assertEqual(snapshot.block_count, 800000)
+
+class CachedResourceTest(StubServerTest):
+    def test_revalidate(self):
+        # A cached response is revalidated with its ETag and kept on 304 Not Modified
+        resource = CachedResource(self.url + "/cached/ticker", timeout=2)
+
+        self.assertEqual(resource.fetch(), resource.fetch())
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.not_modified, 1)
+        self.assertEqual(resource.failures, 0)
+
+    def test_fresh(self):
+        # A response that can still be cached isn't requested again
+        resource = CachedResource(self.url + "/fresh/ticker", timeout=2)
+
+        resource.fetch()
+        resource.fetch()
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_backoff(self):
+        # A resource that times out or fails backs off for longer after each
+        # failure and starts over once it works again
+        resource = CachedResource(self.url + "/slow/ticker", timeout=SLOW_RESPONSE / 5)
+
+        for failures, path in ((1, "/slow/ticker"), (2, "/broken/ticker")):
+            resource.url = self.url + path
+
+            self.assertRaises(Exception, resource.fetch)
+
+            backoff = resource.retry_at - time.monotonic()
+            expected = CachedResource.BACKOFF_BASE * 2 ** (failures - 1)
+
+            self.assertEqual(resource.failures, failures)
+            self.assertFalse(resource.is_available())
+            self.assertTrue(expected - 1 < backoff <= expected, "backed off for %.1fs" % backoff)
+
+        resource.url = self.url + "/ticker"
+        resource.fetch()
+
+        self.assertEqual(resource.failures, 0)
+        self.assertTrue(resource.is_available())
+
+class BitcoinPriceTest(StubServerTest):
+    def test_failing_source(self):
+        # A price source that fails doesn't keep the price from being updated
+        # and isn't queried again while it's backing off
+        price = get_price_tab([self.url + "/broken/ticker", self.url + "/ticker"], timeout=2)
+        self.addCleanup(price.close)
+
+        for i in range(0, 2):
+            snapshot = price.collect()
+
+            self.assertEqual(snapshot.source, price.price_sources[1]["name"])
+            self.assertTrue(snapshot.data)
+
+        broken = [request for request in self.server.requests if request[1].startswith("/broken")]
+
+        self.assertEqual(len(broken), 1)
+
+    def test_race(self):
+        # The first source to answer is used, without waiting for a slower one
+        price = get_price_tab([self.url + "/slow/ticker", self.url + "/ticker"], timeout=2)
+        self.addCleanup(price.close)
+
+        start = time.monotonic()
+        snapshot = price.collect()
+
+        self.assertLess(time.monotonic() - start, SLOW_RESPONSE)
+        self.assertEqual(snapshot.source, price.price_sources[1]["name"])
+
+if __name__ == "__main__":
+    unittest.main()
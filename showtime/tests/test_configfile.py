@@ -0,0 +1,133 @@
+import json
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+
+from configfile import Config, ConfigError, ConfigWatcher, load_config
+
+class LoadConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, data, name="config.json"):
+        path = os.path.join(self.directory, name)
+
+        with open(path, "w") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+
+        return path
+
+    def test_example(self):
+        example = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.example.toml")
+
+        config = load_config(example)
+
+        self.assertEqual(config.tabs[0], ("tabs.hello.HelloTab", {}))
+        self.assertIsNone(config.displays)
+
+    def test_tabs(self):
+        path = self.write({"tabs": [{"class": "tabs.hello.HelloTab"},
+                                    {"class": "tabs.sysinfo.DiskUsage", "settings": {"include_fstypes": ["tmpfs"]},
+                                     "refresh_interval": 30}]})
+
+        self.assertEqual(load_config(path),
+                         Config(tabs=[("tabs.hello.HelloTab", {}),
+                                      ("tabs.sysinfo.DiskUsage", {"include_fstypes": ["tmpfs"]},
+                                       {"refresh_interval": 30})],
+                                displays=None))
+
+    def test_settings_for_every_screen(self):
+        path = self.write({"time": 10, "tabs": [{"class": "tabs.hello.HelloTab"}]})
+
+        self.assertEqual(load_config(path).displays, [{"time": 10}])
+
+    def test_displays(self):
+        path = self.write('''
+            max_fps = 5
+
+            [[tabs]]
+            name = "hello"
+            class = "tabs.hello.HelloTab"
+
+            [[tabs]]
+            class = "tabs.sysinfo.SystemStats"
+
+            [[displays]]
+            port = "/dev/ttyUSB0"
+
+            [[displays]]
+            port = "/dev/ttyUSB1"
+            tabs = ["hello"]
+            offset = 5
+            boot_banner = "Ready"
+        ''', "config.toml")
+
+        config = load_config(path)
+
+        self.assertEqual(config.displays, [{"port": "/dev/ttyUSB0", "max_fps": 5},
+                                           {"port": "/dev/ttyUSB1", "max_fps": 5, "offset": 5,
+                                            "boot_banner": "Ready",
+                                            "tabs": [("tabs.hello.HelloTab", {})]}])
+
+    def test_invalid(self):
+        tabs = [{"class": "tabs.hello.HelloTab"}]
+
+        for data in ("{", [], {}, {"tabs": []}, {"tabs": [{"settings": {}}]},
+                     {"tabs": tabs, "colour": 1},
+                     {"tabs": [{"class": "tabs.hello.HelloTab", "refresh_interval": 0}]},
+                     {"tabs": tabs, "time": 0},
+                     {"tabs": tabs, "time": 1.5},
+                     {"tabs": tabs, "tab": True},
+                     {"tabs": tabs, "offset": -1},
+                     {"tabs": tabs, "rotation": 4},
+                     {"tabs": tabs, "max_fps": 0},
+                     {"tabs": tabs, "profile": "show3"},
+                     {"tabs": tabs, "boot_banner": "Valmisä"},
+                     {"tabs": tabs, "displays": []},
+                     {"tabs": tabs, "displays": [{"tabs": ["hello"]}]},
+                     {"tabs": tabs, "displays": [{"port": "a", "tabs": ["hello"]}]},
+                     {"tabs": tabs, "displays": [{"port": "a"}, {"port": "a"}]}):
+            with self.subTest(data=data):
+                self.assertRaises(ConfigError, load_config, self.write(data))
+
+    def test_missing_file(self):
+        self.assertRaises(ConfigError, load_config, os.path.join(self.directory, "missing.json"))
+
+class ConfigWatcherTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        self.path = os.path.join(directory, "config.json")
+        self.write(1)
+
+        self.changes = queue.Queue()
+
+        self.watcher = ConfigWatcher(self.path, self.changes.put, interval=0.01).start()
+        self.addCleanup(self.watcher.stop)
+
+    def write(self, time, valid=True):
+        data = {"time": time, "tabs": [{"class": "tabs.hello.HelloTab"}] if valid else []}
+
+        # Write the file under another name and move it in place, like editors do
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f)
+
+        os.replace(self.path + ".tmp", self.path)
+
+    def test_reload(self):
+        self.write(20)
+        self.assertEqual(self.changes.get(timeout=2).displays, [{"time": 20}])
+
+        # A file that isn't valid is ignored until it's fixed
+        self.write(30, valid=False)
+        self.assertRaises(queue.Empty, self.changes.get, timeout=0.1)
+
+        self.write(40)
+        self.assertEqual(self.changes.get(timeout=2).displays, [{"time": 40}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import numpy
+
+from context import Screen, ScreenContext
+from writer import PROFILES
+
+def draw(ctx, lines, clear=False):
+    ctx.home()
+
+    for line in lines:
+        ctx.write_line(line)
+
+    ctx.present(clear=clear)
+    ctx.flush()
+
+def get_screen(lines):
+    """
+    Returns the pixels of an emulated screen on which the lines were drawn once
+    """
+    ctx = ScreenContext("emulator", PROFILES["show2"])
+    ctx.reset_lcd().set_rotation(Screen.VERTICAL)
+
+    draw(ctx, lines)
+
+    return ctx.port.get_view().copy()
+
+class PresentTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = ScreenContext("emulator", PROFILES["show2"])
+        self.ctx.reset_lcd().set_rotation(Screen.VERTICAL)
+
+        self.emulator = self.ctx.port
+
+    def get_sent(self, lines, clear=False):
+        """
+        Draws the lines and returns how many bytes of text were sent
+        """
+        before = self.emulator.get_stats()["text_bytes"]
+
+        draw(self.ctx, lines, clear)
+
+        return self.emulator.get_stats()["text_bytes"] - before
+
+    def assertScreen(self, lines):
+        self.assertTrue(numpy.array_equal(self.emulator.get_view(), get_screen(lines)))
+
+    def test_unchanged_frame(self):
+        self.assertGreater(self.get_sent(["Hello", "World"]), 0)
+
+        # Nothing changed, so nothing is sent
+        self.assertEqual(self.get_sent(["Hello", "World"]), 0)
+        self.assertScreen(["Hello", "World"])
+
+    def test_changed_cells(self):
+        self.get_sent(["Hello", "World"])
+
+        # Only the cell that changed is sent
+        self.assertEqual(self.get_sent(["Hello", "Word!"]), 2)
+        self.assertScreen(["Hello", "Word!"])
+
+    def test_clear(self):
+        self.get_sent(["Hello", "World"])
+
+        # Lines that aren't drawn are only erased when asked to
+        self.get_sent(["Hello"])
+        self.assertScreen(["Hello", "World"])
+
+        self.get_sent(["Hi"], clear=True)
+        self.assertScreen(["Hi"])
+
+    def test_offscreen_frame(self):
+        self.get_sent(["Hello"])
+
+        frame = self.ctx.draw_offscreen(lambda ctx: ctx.home().write_line("Frame"))
+
+        # Drawing off-screen doesn't touch the screen or the next frame
+        self.assertEqual(self.get_sent(["Hello"]), 0)
+
+        self.ctx.present_frame(frame)
+        self.ctx.flush()
+
+        self.assertScreen(["Frame"])
+
+    def test_discard_frame(self):
+        self.get_sent(["Hello"])
+
+        self.ctx.home().write_line("Broken")
+        self.ctx.discard_frame()
+
+        self.assertEqual(self.get_sent(["Hello"]), 0)
+        self.assertScreen(["Hello"])
+
+if __name__ == "__main__":
+    unittest.main()
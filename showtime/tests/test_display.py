@@ -0,0 +1,99 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from collector import CollectorScheduler
+from context import Screen
+from display import DisplayManager
+from header import Header
+from loader import TabLoader
+
+import metrics
+
+class DisplayManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.collector = CollectorScheduler([]).start()
+        self.addCleanup(self.collector.stop)
+
+        self.manager = DisplayManager(self.collector, TabLoader(on_load=self.collector.add_tab), Header(),
+                                      defaults={"time": 15, "tab": 1, "max_fps": 10, "offset": 0,
+                                                "rotation": Screen.VERTICAL, "profile": "unpaced",
+                                                "threaded": False, "boot_banner": None})
+        self.addCleanup(self.manager.stop)
+
+        self.display_config = {"port": "emulator", "tabs": ["tabs.hello.HelloTab", "tabs.hello.HelloTab"]}
+
+    def apply(self, **settings):
+        """
+        Applies the config with the settings changed and returns what was printed
+        """
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            self.manager.apply([dict(self.display_config, **settings)])
+
+        return output.getvalue()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 2
+
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.01)
+
+    def test_invalid_config_not_kept(self):
+        self.apply(time=5)
+
+        self.assertIn("Couldn't apply the config", self.apply(time=0))
+        self.assertEqual(self.manager.configs["emulator"]["time"], 5)
+
+        # A screen that isn't shown yet isn't opened with it either
+        self.assertIn("Couldn't apply the config", self.apply(port="emulator:other", time=0))
+        self.assertNotIn("emulator:other", self.manager.displays)
+
+    def test_offset_applied(self):
+        self.apply()
+
+        display = self.manager.displays["emulator"]
+        self.wait_for(lambda: display.next_tab_change is not None)
+
+        tab_change = display.next_tab_change
+
+        self.assertEqual(self.apply(offset=3), "")
+        self.wait_for(lambda: display.tab_change_offset == 3)
+
+        self.assertEqual(display.next_tab_change, tab_change + 3)
+
+    def test_first_tab_needs_setup(self):
+        self.apply()
+
+        self.assertIn("only changes when it's set up again", self.apply(tab=2))
+
+    def test_metrics_per_display(self):
+        metrics.default_registry.enabled = True
+        self.addCleanup(setattr, metrics.default_registry, "enabled", False)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # The screens are saved into the directory when they're closed
+        ports = ["emulator:%s" % os.path.join(directory, name) for name in ("one.png", "two.png")]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.manager.apply([dict(self.display_config, port=port) for port in ports])
+
+        for port in ports:
+            self.wait_for(lambda: metrics.FRAMES.values.get((port,), 0) > 0)
+            self.wait_for(lambda: metrics.WRITTEN_BYTES.values.get((port,), 0) > 0)
+
+            self.assertIn((port, "Hello World Tab"), metrics.RENDER_SECONDS.values)
+
+        # Before the directory is removed
+        self.manager.stop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import numpy
+
+from imaging import get_dirty_rects, get_runs
+
+class GetRunsTest(unittest.TestCase):
+    def test_runs(self):
+        self.assertEqual(get_runs(numpy.array([True, True, False, True, False, False, True])),
+                         [(0, 2), (3, 4), (6, 7)])
+        self.assertEqual(get_runs(numpy.zeros(4, dtype=bool)), [])
+
+class GetDirtyRectsTest(unittest.TestCase):
+    def setUp(self):
+        self.old = numpy.zeros((20, 30), dtype=numpy.uint16)
+        self.new = self.old.copy()
+
+    def test_unchanged(self):
+        self.assertEqual(get_dirty_rects(self.old, self.new, 100), [])
+
+    def test_single_pixel(self):
+        self.new[5, 3] = 0xFFFF
+
+        self.assertEqual(get_dirty_rects(self.old, self.new, 100), [(3, 5, 4, 6)])
+
+    def test_merging(self):
+        self.new[0, 0] = 0xFFFF
+        self.new[19, 29] = 0xFFFF
+
+        # Separate windows are cheaper than sending the pixels in between
+        self.assertEqual(get_dirty_rects(self.old, self.new, 10), [(0, 0, 1, 1), (29, 19, 30, 20)])
+
+        # An additional window costs more than the whole screen
+        self.assertEqual(get_dirty_rects(self.old, self.new, 10000), [(0, 0, 30, 20)])
+
+    def test_side_by_side(self):
+        # Two changes on the same rows are split into columns
+        self.new[2:6, 1:3] = 0xFFFF
+        self.new[3:5, 20:25] = 0xFFFF
+
+        self.assertEqual(get_dirty_rects(self.old, self.new, 10), [(1, 2, 3, 6), (20, 3, 25, 5)])
+
+    def test_every_change_covered(self):
+        random = numpy.random.RandomState(1)
+
+        for window_cost in (0, 10, 100, 1000):
+            with self.subTest(window_cost=window_cost):
+                new = self.old.copy()
+                new[random.rand(*new.shape) < 0.02] = 0xFFFF
+
+                covered = numpy.zeros(new.shape, dtype=bool)
+
+                for x, y, x2, y2 in get_dirty_rects(self.old, new, window_cost):
+                    self.assertTrue(0 <= x < x2 <= new.shape[1] and 0 <= y < y2 <= new.shape[0])
+
+                    covered[y:y2, x:x2] = True
+
+                self.assertTrue(covered[self.old != new].all())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import ingest
+import metrics
+
+class ParseLineTest(unittest.TestCase):
+    def test_types(self):
+        self.assertEqual(ingest.parse_line("load:1.5|g"), ("load", 1.5, "g", 1.0, False))
+        self.assertEqual(ingest.parse_line("jobs:1|c|@0.5"), ("jobs", 1.0, "c", 0.5, False))
+        self.assertEqual(ingest.parse_line("job:250|ms"), ("job", 250.0, "ms", 1.0, False))
+        self.assertEqual(ingest.parse_line("alert:disk full|t\n"), ("alert", "disk full", "t", 1.0, False))
+
+    def test_relative_gauge(self):
+        self.assertEqual(ingest.parse_line("queue:-2|g"), ("queue", -2.0, "g", 1.0, True))
+        self.assertEqual(ingest.parse_line("queue:+2|g")[4], True)
+        # Only gauges are relative
+        self.assertEqual(ingest.parse_line("jobs:-1|c")[4], False)
+
+    def test_invalid(self):
+        for line in ("load", ":1|g", "load:1", "load:1|x", "load:1|c|0.5", "load:1|c|@2",
+                     "load:abc|g", "load:nan|g", "load:inf|ms"):
+            with self.subTest(line=line):
+                self.assertRaises(ValueError, ingest.parse_line, line)
+
+    def test_characters_that_cant_be_shown(self):
+        for line in ("alert:Temp 70°C|t", "alert:\x1b[2J|t", "café:1|g", "alert:a\tb|t"):
+            with self.subTest(line=line):
+                self.assertRaises(ValueError, ingest.parse_line, line)
+
+class MetricStoreTest(unittest.TestCase):
+    def setUp(self):
+        metrics.default_registry.enabled = True
+
+    def tearDown(self):
+        metrics.default_registry.enabled = False
+
+    def test_update_lines(self):
+        store = ingest.MetricStore()
+
+        errors = metrics.PUSH_ERRORS.values.get((), 0)
+        pushed = metrics.PUSHED_VALUES.values.get((), 0)
+
+        store.update_lines("jobs:1|c\njobs:2|c|@0.5\n\nalert:Temp 70°C|t\nqueue:5|g\nqueue:-2|g\n".encode("utf-8"))
+
+        self.assertEqual(store.get("jobs").value, 5.0)
+        self.assertEqual(store.get("jobs").history, (1.0, 4.0))
+        self.assertEqual(store.get("queue").value, 3.0)
+        self.assertIsNone(store.get("alert"))
+
+        self.assertEqual(metrics.PUSHED_VALUES.values[()] - pushed, 4)
+        self.assertEqual(metrics.PUSH_ERRORS.values[()] - errors, 1)
+
+    def test_oldest_key_forgotten(self):
+        store = ingest.MetricStore(max_keys=2)
+
+        store.update("a", 1.0, "g")
+        store.update("b", 1.0, "g")
+        store.update("a", 2.0, "g")
+        store.update("c", 1.0, "g")
+
+        self.assertEqual(store.get_names(), ["a", "c"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import contextlib
+import io
+import unittest
+
+from loader import ErrorTab, TabLoader, get_tab_key
+from tabs.sysinfo import SystemStats
+from tabs.tab import Tab
+
+class SlottedTab(Tab):
+    __slots__ = ("title", "interval")
+
+    def __init__(self, config={}):
+        self.title = config.get("title", "Slotted")
+
+        # Known when the tab is created
+        self.interval = self.refresh_interval
+
+# The module's name depends on how the tests are run
+SLOTTED_TAB = SlottedTab.__module__ + ".SlottedTab"
+
+class TabLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.loaded = []
+        self.loader = TabLoader(on_load=self.loaded.append)
+
+    def test_shared(self):
+        tab = self.loader.get(("tabs.hello.HelloTab", {}))
+
+        self.assertIs(self.loader.get("tabs.hello.HelloTab"), tab)
+        self.assertEqual(self.loaded, [tab])
+
+    def test_options(self):
+        entry = (SLOTTED_TAB, {"title": "Test"}, {"refresh_interval": 7})
+        tab = self.loader.get(entry)
+
+        self.assertIsInstance(tab, SlottedTab)
+        self.assertEqual((tab.title, tab.interval, tab.refresh_interval), ("Test", 7, 7))
+
+        # Other tabs of the class keep their own options
+        self.assertIsNone(self.loader.get(SLOTTED_TAB).refresh_interval)
+        self.assertIsNone(SlottedTab.refresh_interval)
+
+    def test_options_override_tab(self):
+        tab = self.loader.get(("tabs.sysinfo.SystemStats", {}, {"refresh_interval": 2, "redraw_interval": 5}))
+
+        self.assertIsInstance(tab, SystemStats)
+        self.assertEqual((tab.refresh_interval, tab.redraw_interval), (2, 5))
+
+    def test_error(self):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            tab = self.loader.get("tabs.nosuchmodule.Tab")
+
+        self.assertIsInstance(tab, ErrorTab)
+
+    def test_retain(self):
+        kept = self.loader.get("tabs.hello.HelloTab")
+        removed = self.loader.get(("tabs.hello.HelloTab", {}, {"redraw_interval": 1}))
+
+        self.assertEqual(self.loader.retain(["tabs.hello.HelloTab"]), [removed])
+        self.assertEqual(list(self.loader.tabs), [get_tab_key("tabs.hello.HelloTab")])
+        self.assertIs(self.loader.get("tabs.hello.HelloTab"), kept)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import threading
+import unittest
+
+from collections import namedtuple
+from unittest import mock
+
+import system
+
+Partition = namedtuple("Partition", ["device", "mountpoint", "fstype"])
+Usage = namedtuple("Usage", ["used", "total"])
+
+class FakeDiskMonitor(system.DiskMonitor):
+    def __init__(self, partitions, **kwargs):
+        super().__init__(**kwargs)
+
+        self.listed = partitions
+
+    def list_partitions(self):
+        return self.listed
+
+class DiskMonitorTest(unittest.TestCase):
+    def setUp(self):
+        # Stands in for a stale network mount
+        self.hung = threading.Event()
+        self.addCleanup(self.hung.set)
+
+        self.calls = []
+
+        def disk_usage(mountpoint):
+            self.calls.append(mountpoint)
+
+            if mountpoint == "/mnt/nfs":
+                self.hung.wait()
+            elif mountpoint == "/secret":
+                raise PermissionError(13, "Permission denied")
+
+            return Usage(used=1, total=2)
+
+        patcher = mock.patch("psutil.disk_usage", disk_usage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.monitor = FakeDiskMonitor([Partition("/dev/sda1", "/", "ext4"),
+                                        Partition("server:/", "/mnt/nfs", "nfs"),
+                                        Partition("/dev/sdb1", "/secret", "ext4")],
+                                       timeout=0.1, workers=2)
+
+    def get_usage(self):
+        return dict((usage.mountpoint, usage) for usage in self.monitor.get_usage())
+
+    def test_hung_mount(self):
+        for i in range(5):
+            usage = self.get_usage()
+
+            self.assertEqual(usage["/"], system.DiskPartitionUsage("/", "ext4", 1, 2, True, None))
+            self.assertFalse(usage["/mnt/nfs"].responsive)
+            self.assertIsNone(usage["/mnt/nfs"].total)
+            self.assertEqual(usage["/secret"].error, "Permission denied")
+
+        # The hung mount isn't asked again, and the threads don't pile up
+        self.assertEqual(self.calls.count("/mnt/nfs"), 1)
+        self.assertEqual(self.calls.count("/"), 5)
+        self.assertLessEqual(len(self.monitor.pool.threads), 2)
+
+        self.hung.set()
+
+        self.monitor.pending["/mnt/nfs"].result(1)
+        self.assertTrue(self.get_usage()["/mnt/nfs"].responsive)
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_threads_reused(self):
+        pool = system.WorkerPool(3, "test")
+
+        for i in range(10):
+            self.assertEqual(pool.submit(pow, 2, i).result(1), 2 ** i)
+
+        self.assertEqual(len(pool.threads), 1)
+
+        self.assertRaises(ZeroDivisionError, pool.submit(divmod, 1, 0).result, 1)
+
+if __name__ == "__main__":
+    unittest.main()
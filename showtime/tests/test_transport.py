@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+import unittest
+
+from transport import SerialTransport
+
+class WaitUntilReadyTest(unittest.TestCase):
+    def setUp(self):
+        # The screen is played by the other end of a pseudo terminal
+        self.master, slave = os.openpty()
+        self.slave_name = os.ttyname(slave)
+
+        os.close(slave)
+
+        self.transport = SerialTransport(self.slave_name)
+
+    def tearDown(self):
+        self.transport.close()
+        os.close(self.master)
+
+    def send_later(self, delay, data):
+        timer = threading.Timer(delay, os.write, (self.master, data))
+        timer.start()
+
+        self.addCleanup(timer.cancel)
+
+    def test_banner_ends_wait(self):
+        self.send_later(0.2, b"boot\r\nRea")
+        self.send_later(0.3, b"dy\r\n")
+
+        start = time.monotonic()
+        self.transport.wait_until_ready(5, b"Ready")
+
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_boot_time_without_banner(self):
+        self.send_later(0.1, b"noise")
+
+        start = time.monotonic()
+        self.transport.wait_until_ready(0.5, b"Ready")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+
+        start = time.monotonic()
+        self.transport.wait_until_ready(0.5)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import threading
+import unittest
+
+from transport import Transport
+from writer import SerialWriter, ThreadedSerialWriter, PROFILES
+
+class GatedTransport(Transport):
+    """
+    Keeps what's written to it, and blocks writes until opened
+    """
+    def __init__(self):
+        self.written = bytearray()
+        self.gate = threading.Event()
+        self.error = None
+
+    def write(self, data):
+        self.gate.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        self.written += data
+
+class SerialWriterTest(unittest.TestCase):
+    def test_frame(self):
+        port = GatedTransport()
+        port.gate.set()
+
+        writer = SerialWriter(port, PROFILES["show2"])
+        writer.command(b"\x1b[H").text("Hi").data(b"\x00" * 5)
+
+        # Nothing is written before the frame is flushed
+        self.assertEqual(port.written, b"")
+
+        writer.flush()
+        self.assertEqual(port.written, b"\x1b[HHi" + b"\x00" * 5)
+
+class ThreadedSerialWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.port = GatedTransport()
+        self.writer = ThreadedSerialWriter(self.port, PROFILES["unpaced"], max_frames=3)
+
+        self.addCleanup(self.close)
+
+    def close(self):
+        self.port.gate.set()
+        self.writer.close()
+
+    def send(self, text, full=False, keep=False):
+        self.writer.text(text).flush(full=full, keep=keep)
+
+    def wait_until_writing(self):
+        with self.writer.condition:
+            while not self.writer.writing:
+                self.writer.condition.wait()
+
+    def test_full_frame_drops_queued_frames(self):
+        # The thread is stuck writing the first frame while more are queued
+        self.send("A")
+        self.wait_until_writing()
+
+        self.send("B")
+        self.send("C")
+        self.assertFalse(self.writer.is_backlogged())
+
+        self.send("D")
+        self.assertTrue(self.writer.is_backlogged())
+
+        # B, C and D are out of date once a frame redraws the whole screen
+        self.send("E", full=True)
+
+        self.port.gate.set()
+        self.writer.barrier()
+
+        self.assertEqual(self.port.written, b"AE")
+
+    def test_kept_data_not_dropped(self):
+        self.send("A")
+        self.wait_until_writing()
+
+        # Eg. erasing the screen has to happen even if the next frame is full
+        self.send("B")
+        self.send("K", keep=True)
+        self.send("C")
+        self.send("E", full=True)
+
+        self.port.gate.set()
+        self.writer.barrier()
+
+        self.assertEqual(self.port.written, b"ABKE")
+
+    def test_error_raised_on_caller(self):
+        self.port.error = OSError("port gone")
+        self.port.gate.set()
+
+        self.send("A")
+
+        self.assertRaises(OSError, self.writer.barrier)
+
+        # The error is only raised once
+        self.port.error = None
+        self.send("B")
+        self.writer.barrier()
+
+        self.assertEqual(self.port.written, b"B")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import time
+
+import serial
+
+class Clock:
+    """
+    Real time, used to pace writes to an actual screen
+    """
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, period):
+        if period > 0:
+            time.sleep(period)
+
+class SimulatedClock(Clock):
+    def __init__(self):
+        """
+        Clock that only moves forward when told to, so that pacing doesn't
+        actually have to be waited for
+        """
+        self.now = 0.0
+
+        # Total seconds spent sleeping
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, period):
+        if period > 0:
+            self.now += period
+            self.slept += period
+
+    def advance(self, period):
+        """
+        Moves the clock forward without counting it as sleep
+        """
+        self.now += period
+
+class Transport:
+    """
+    Somewhere the bytes meant for the screen are written to
+    """
+    clock = Clock()
+
+    def write(self, data):
+        raise NotImplementedError("write not implemented")
+
+    def wait_until_ready(self, boot_time, banner=None):
+        """
+        Waits until the screen has booted up, at most boot_time seconds.
+        Anything other than a real screen is always ready.
+        """
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class SerialTransport(Transport):
+    def __init__(self, port_name, baudrate=500000):
+        """
+        The screen connected to a serial port. Opening the port raises DTR,
+        which resets the board, so it's booting up again afterwards,
+        see wait_until_ready().
+        """
+        self.port_name = port_name
+
+        self.port = serial.Serial(port_name, baudrate)
+
+    def write(self, data):
+        self.port.write(data)
+
+    def flush(self):
+        self.port.flush()
+
+    def close(self):
+        self.port.close()
+
+    def wait_until_ready(self, boot_time, banner=None):
+        """
+        Waits until the board has booted up. The board doesn't send anything while
+        it's booting, so without a banner the whole boot_time is waited for. If the
+        firmware sends a banner once it has booted, the port is read with a short
+        timeout until the banner is received, or for boot_time at most.
+        """
+        deadline = time.monotonic() + boot_time
+
+        if banner is None:
+            self.clock.sleep(deadline - time.monotonic())
+            return
+
+        received = b""
+
+        while time.monotonic() < deadline:
+            self.port.timeout = min(deadline - time.monotonic(), 0.1)
+
+            # Only keep enough to find a banner split over several reads
+            received = (received + self.port.read(256))[-2 * len(banner):]
+
+            if banner in received:
+                break
+
+        self.port.timeout = None
+
+class FileTransport(Transport):
+    def __init__(self, path):
+        """
+        Writes everything sent to the screen into a file, without pacing
+        """
+        self.file = open(path, "wb")
+        self.clock = SimulatedClock()
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class PtyTransport(Transport):
+    def __init__(self):
+        """
+        Writes to a pseudo terminal, so that another program can pretend to be the screen
+        """
+        self.master, self.slave = os.openpty()
+        self.name = os.ttyname(self.slave)
+
+        print("Writing to %s" % self.name)
+
+    def write(self, data):
+        data = memoryview(data)
+
+        while data:
+            data = data[os.write(self.master, data):]
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+def open_transport(name):
+    """
+    Opens a transport by name:
+
+    /dev/ttyUSB0 or serial:/dev/ttyUSB0 - serial port
+    pty - a new pseudo terminal
+    file:output.bin - a file
+    emulator or emulator:snapshot.png - emulated screen, saved as a PNG when closed
+    """
+    kind, _, argument = name.partition(":")
+
+    if kind == "serial":
+        return SerialTransport(argument)
+    elif kind == "pty":
+        return PtyTransport()
+    elif kind == "file":
+        return FileTransport(argument)
+    elif kind == "emulator":
+        # Imported here as it isn't needed with a real screen
+        from emulator import Emulator
+
+        return Emulator(snapshot_path=argument or None)
+
+    return SerialTransport(name)
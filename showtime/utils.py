@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 def format_timespan(seconds):
     seconds = int(seconds)
     
@@ -21,17 +23,67 @@ def format_timespan(seconds):
             
     return time_str
 
+def format_size_short(size):
+    """
+    Returns a size in bytes in at most 5 characters, eg. 512K, 23M or 1.2G
+    """
+    for unit in "BKMGT":
+        if size < 1024 or unit == "T":
+            break
+        
+        size /= 1024.0
+    
+    if unit != "B" and size < 10:
+        return "%.1f%s" % (size, unit)
+    
+    return "%d%s" % (size, unit)
+
 def get_progress_bar(length, percent):
-    bar = ""
-    count = int(percent * (length))
-    
-    for i in range(0, length):
-        if float(float(i) / float(length)) <= percent:
-            bar += "|"
-        else:
-            bar += " "
-            
-    return bar
+    """
+    Returns a bar of length characters, filled with | according to percent
+    """
+    # Cell i is filled if i / length <= percent, find the first one that isn't
+    filled = min(max(int(percent * length), 0), length)
+    
+    while filled < length and float(filled) / float(length) <= percent:
+        filled += 1
+        
+    while filled > 0 and float(filled - 1) / float(length) > percent:
+        filled -= 1
+    
+    return get_bar(length, filled)
+
+@lru_cache(maxsize=1024)
+def get_bar(length, filled):
+    return "|" * filled + " " * (length - filled)
+
+# Characters used to draw sparklines, from the lowest value to the highest
+SPARKLINE_CHARS = " _.-=+*#"
+
+def get_sparkline(values, length, low=0.0, high=1.0):
+    """
+    Returns a string of length characters showing the values as a sparkline,
+    with the latest value on the right. If there are more values than characters,
+    the values are averaged.
+    """
+    count = len(values)
+    
+    if count > length:
+        samples = []
+        
+        for i in range(0, length):
+            bucket = values[i * count // length:(i + 1) * count // length]
+            samples.append(sum(bucket) / len(bucket))
+    else:
+        samples = values
+        
+    levels = len(SPARKLINE_CHARS) - 1
+    scale = float(levels) / (high - low) if high > low else 0.0
+    
+    line = "".join(SPARKLINE_CHARS[max(0, min(levels, int((value - low) * scale + 0.5)))]
+                   for value in samples)
+    
+    return line.rjust(length)
 
 def split_string_into_chunks(string, length=25):
     """
@@ -0,0 +1,311 @@
+"""
+Widgets that lay out a tab once and afterwards only update the values shown on it.
+The cells of the static parts, such as labels, are built once and only drawn
+when the screen doesn't have them already, eg. when the tab is changed to.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from context import Screen
+from utils import get_progress_bar, get_sparkline
+
+def get_text_cells(text, index, columns, origin, color):
+    """
+    Returns the cells showing text that starts index characters after the origin
+    and wraps every columns characters. origin is the (y, text size, screen height)
+    of the first line.
+    """
+    y, size, height = origin
+
+    char_width = size * Screen.CHAR_WIDTH
+    char_height = size * Screen.CHAR_HEIGHT
+
+    cells = []
+
+    for i, glyph in enumerate(text):
+        row, column = divmod(index + i, columns)
+
+        # Text that doesn't fit on the screen is never shown
+        if y + (row + 1) * char_height > height:
+            break
+
+        # Empty cells are stored without a text color, as in ScreenContext.draw_cell
+        cells.append((glyph, None if glyph == " " else color, Screen.BLACK, size,
+                      column * char_width, y + row * char_height))
+
+    return cells
+
+def get_threshold_color(value, yellow, red):
+    """
+    Returns green below yellow, yellow up to red and red above it
+    """
+    if value < yellow:
+        return Screen.GREEN
+    elif value <= red:
+        return Screen.YELLOW
+
+    return Screen.RED
+
+class Widget:
+    # Name of the value the widget shows, None if the widget never changes
+    name = None
+
+    def __init__(self, width):
+        """
+        Part of a layout, width characters wide. The position is set by Layout.add().
+        """
+        self.width = width
+
+        # Position in characters, relative to the start of the layout
+        self.index = None
+
+    def get_text(self, value):
+        raise NotImplementedError("get_text not implemented on %s!" % self.__class__.__name__)
+
+    def get_color(self, value, values):
+        raise NotImplementedError("get_color not implemented on %s!" % self.__class__.__name__)
+
+class Label(Widget):
+    def __init__(self, text, color=Screen.WHITE, width=None):
+        """
+        Text that never changes. If width is larger than the text, the rest is blank.
+        """
+        Widget.__init__(self, len(text) if width is None else width)
+
+        self.text = text
+        self.color = color
+
+    def get_text(self, value):
+        return self.text
+
+    def get_color(self, value, values):
+        return self.color
+
+class Field(Widget):
+    def __init__(self, name, width=None, format=str, color=Screen.WHITE, color_by=None):
+        """
+        Shows the value called name, converted into text by format and cut or padded
+        to width characters. If width is None, the field fills the rest of the line.
+
+        color: color of the text, or a function returning it for the value
+        color_by: name of another value given to the color function instead
+        """
+        Widget.__init__(self, width)
+
+        self.name = name
+        self.format = format
+        self.color = color
+        self.color_by = color_by
+
+    def get_text(self, value):
+        return self.format(value)
+
+    def get_color(self, value, values):
+        if not callable(self.color):
+            return self.color
+
+        return self.color(values[self.color_by] if self.color_by is not None else value)
+
+class ProgressBar(Field):
+    def __init__(self, name, width, yellow=0.33, red=0.66):
+        """
+        Bar filled according to a value between 0 and 1, colored green, yellow
+        or red depending on how full it is
+        """
+        Field.__init__(self, name, width,
+                       format=lambda value: get_progress_bar(width, value),
+                       color=lambda value: get_threshold_color(value, yellow, red))
+
+class Sparkline(Field):
+    def __init__(self, name, width, color=Screen.CYAN, color_by=None, low=0.0, high=1.0):
+        """
+        Shows a sequence of values as a sparkline. If high is None, the sparkline
+        is scaled to the highest value, or 1 if every value is lower.
+        """
+        Field.__init__(self, name, width, format=self.get_sparkline, color=color, color_by=color_by)
+
+        self.low = low
+        self.high = high
+
+    def get_sparkline(self, values):
+        high = self.high
+
+        if high is None:
+            high = max(max(values) if len(values) else 0.0, 1.0)
+
+        return get_sparkline(values, self.width, self.low, high)
+
+class LayoutVariant:
+    def __init__(self, columns):
+        """
+        Widgets of a layout placed on a screen with the given amount of columns
+        """
+        self.columns = columns
+        self.widgets = []
+
+        # Position of the next widget, in characters
+        self.index = 0
+
+        # Cells of each widget drawn at a certain position, and the text and color they show
+        self.cells = {}
+
+    def get_rows(self):
+        return (self.index + self.columns - 1) // self.columns
+
+class Layout:
+    # How many variants are kept, eg. for screens with a different orientation
+    MAX_VARIANTS = 8
+
+    def __init__(self, build):
+        """
+        Widgets drawn in order, flowing from one line to the next like text.
+        build(layout, columns, structure) adds the widgets with add(), newline() and
+        end_line(). It's called again whenever the layout is drawn on a screen with
+        a different number of columns or with a different structure.
+        """
+        self.build = build
+
+        # LayoutVariant for each (columns, structure)
+        self.variants = OrderedDict()
+
+        # Variant currently shown on each screen
+        self.shown = {}
+
+        # Variant being built
+        self.variant = None
+
+        # Screens sharing the tab may draw it at the same time
+        self.lock = threading.Lock()
+
+    def add(self, widget):
+        """
+        Adds a widget after the previous one
+        """
+        variant = self.variant
+
+        if widget.width is None:
+            # Fill the rest of the line
+            widget.width = variant.columns - variant.index % variant.columns
+
+        widget.index = variant.index
+        variant.index += widget.width
+        variant.widgets.append(widget)
+
+        return widget
+
+    def newline(self):
+        """
+        Moves to the beginning of the next line, leaving the rest of the current one
+        as it is. Like ScreenContext.linebreak(), a whole line is skipped if the
+        previous widget filled the line.
+        """
+        variant = self.variant
+
+        variant.index = (variant.index // variant.columns + 1) * variant.columns
+
+        return self
+
+    def end_line(self):
+        """
+        Blanks the rest of the line and moves to the beginning of the next one.
+        A line that is empty so far is blanked entirely.
+        """
+        self.add(Label("", width=self.variant.columns - self.variant.index % self.variant.columns))
+
+        return self
+
+    def get_variant(self, columns, structure):
+        key = (columns, structure)
+
+        with self.lock:
+            return self.variants.get(key) or self.build_variant(key)
+
+    def build_variant(self, key):
+        columns, structure = key
+
+        variant = self.variant = LayoutVariant(columns)
+
+        try:
+            self.build(self, columns, structure)
+        finally:
+            self.variant = None
+
+        self.variants[key] = variant
+
+        while len(self.variants) > self.MAX_VARIANTS:
+            self.variants.popitem(last=False)
+
+        return variant
+
+    def forget(self, ctx=None):
+        """
+        Makes the next frame draw the whole layout, eg. after the tab drew something
+        else in its place. If ctx is None, this applies to every screen.
+        """
+        if ctx is None:
+            self.shown.clear()
+        else:
+            self.shown.pop(ctx, None)
+
+        return self
+
+    def render(self, ctx, values, structure=None):
+        """
+        Draws the layout at the beginning of the line the cursor is on.
+        values is a dict with the value of each field. The static parts
+        are only drawn if they aren't already on the screen.
+        """
+        if ctx.cursor_x != 0:
+            ctx.linebreak()
+
+        variant = self.get_variant(ctx.get_columns(), structure)
+        previous = self.shown.get(ctx)
+
+        redraw_all = ctx.redraw_all or previous is not variant
+
+        self.shown[ctx] = variant
+
+        origin = (ctx.cursor_y, ctx.text_size, ctx.get_height())
+
+        for widget in variant.widgets:
+            if widget.name is None and not redraw_all:
+                continue
+
+            value = values[widget.name] if widget.name is not None else None
+
+            ctx.draw_cells(self.get_cells(variant, widget, origin,
+                                          widget.get_text(value), widget.get_color(value, values)))
+
+        rows = variant.get_rows()
+
+        # Blank the lines the previous variant used but this one doesn't
+        if previous is not None and previous is not variant and not ctx.redraw_all:
+            blank_rows = max(previous.get_rows() - rows, 0)
+
+            ctx.draw_cells(get_text_cells(" " * (blank_rows * variant.columns), rows * variant.columns,
+                                          variant.columns, origin, Screen.WHITE))
+
+        ctx.cursor_x = 0
+        ctx.cursor_y += rows * ctx.text_size * Screen.CHAR_HEIGHT
+        ctx.characters_on_line = 0
+
+        return self
+
+    def get_cells(self, variant, widget, origin, text, color):
+        """
+        Returns the cells showing the text of a widget, built again only if the text,
+        color or position has changed
+        """
+        cached = variant.cells.get(widget)
+
+        if cached is not None and cached[0] == (text, color, origin):
+            return cached[1]
+
+        cells = get_text_cells(text[:widget.width].ljust(widget.width), widget.index,
+                               variant.columns, origin, color)
+
+        variant.cells[widget] = ((text, color, origin), cells)
+
+        return cells
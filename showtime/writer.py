@@ -0,0 +1,415 @@
+import collections
+import threading
+import time
+
+import commands
+import metrics
+
+class DeviceProfile:
+    def __init__(self, bytes_per_second=None, escape_cost=0.0, chunk_size=None,
+                 image_chunk_size=None, image_bytes_per_second=None, image_window_cost=0.0,
+                 erase_cost=0.0, boot_time=0.0, boot_banner=None):
+        """
+        Describes how fast a screen can process what is sent to it
+
+        bytes_per_second: how many bytes of text the screen can draw per second,
+                          None if there is no limit
+        escape_cost: how many seconds it takes for the screen to process
+                     a single escape sequence
+        chunk_size: how many bytes can be sent at once without the screen
+                    dropping any of them, None if there is no limit
+        image_chunk_size: how many bytes of image data are written to the port
+                          at once, None to write it all at once
+        image_bytes_per_second: how many bytes of image data the screen can receive
+                                per second, None if there is no limit
+        image_window_cost: how many seconds the screen needs before and after
+                           receiving the data of an image window
+        erase_cost: how many seconds it takes for the screen to erase itself,
+                    on top of escape_cost
+        boot_time: how many seconds the screen needs to boot up after being plugged in or reset
+        boot_banner: bytes the screen sends once it has booted up, None if it doesn't
+        """
+        self.bytes_per_second = bytes_per_second
+        self.escape_cost = escape_cost
+        self.chunk_size = chunk_size
+        self.image_chunk_size = image_chunk_size
+        self.image_bytes_per_second = image_bytes_per_second
+        self.image_window_cost = image_window_cost
+        self.erase_cost = erase_cost
+        self.boot_time = boot_time
+        self.boot_banner = boot_banner
+
+    def get_text_cost(self, length):
+        """
+        Returns how many seconds it takes for the screen to draw the given amount of text
+        """
+        if self.bytes_per_second is None:
+            return 0.0
+
+        return float(length) / self.bytes_per_second
+
+    def get_window_cost(self):
+        """
+        Returns the cost of uploading an additional image window, in bytes of image data
+        """
+        # Length of a typical window command
+        cost = len("\x1B[100;100,200;200i")
+
+        if self.image_bytes_per_second is not None:
+            cost += 2 * self.image_window_cost * self.image_bytes_per_second
+
+        return cost
+
+PROFILES = {
+    # ODROID-SHOW2 with the stock firmware. Sending more than 10 characters
+    # at once or sending them too fast causes artifacts.
+    "show2": DeviceProfile(bytes_per_second=1 / 0.006, escape_cost=0.001, chunk_size=10,
+                           image_chunk_size=4096, image_bytes_per_second=500000 / 10,
+                           image_window_cost=0.05, erase_cost=0.05, boot_time=6.0),
+
+    # No pacing at all
+    "unpaced": DeviceProfile(),
+}
+
+DEFAULT_PROFILE = "show2"
+
+class CostCounter:
+    def __init__(self, profile):
+        """
+        Stands in for a SerialWriter to find out how long the screen would take
+        to process commands and text, without sending anything
+        """
+        self.profile = profile
+        self.cost = 0.0
+
+    def command(self, command, cost=None):
+        self.cost += self.profile.escape_cost if cost is None else cost
+
+        return self
+
+    def text(self, text):
+        self.cost += self.profile.get_text_cost(len(text))
+
+        return self
+
+class SerialWriter:
+    def __init__(self, port, profile, name=""):
+        """
+        Collects the commands and text of a frame and sends them to the port
+        in a single pass, paced according to the device profile.
+        The port is a Transport, whose clock is used for pacing.
+        name is the display label of the writer's metrics.
+        """
+        self.port = port
+        self.profile = profile
+        self.clock = port.clock
+        self.name = name
+
+        # (data, cost in seconds, whether data can be split over several chunks)
+        self.pieces = []
+
+        # When the screen is expected to have processed everything sent to it
+        self.ready_at = 0.0
+
+    def command(self, command, cost=None):
+        """
+        Queue an escape sequence or other command that must not be split.
+        Commands from the commands module are already bytes; strings are encoded,
+        with \\e standing for the escape character.
+        """
+        if cost is None:
+            cost = self.profile.escape_cost
+
+        if isinstance(command, str):
+            command = commands.encode(command)
+
+        self.pieces.append((command, cost, False))
+
+        metrics.COMMANDS.inc(self.name)
+
+        return self
+
+    def text(self, text):
+        """
+        Queue text to be drawn on the screen
+        """
+        data = text.encode("ascii")
+
+        self.pieces.append((data, self.profile.get_text_cost(len(data)), True))
+
+        return self
+
+    def data(self, data, cost=0.0):
+        """
+        Queue raw bytes, eg. image data. cost is the time the screen needs
+        after receiving all of the data.
+        """
+        chunk_size = self.profile.image_chunk_size
+
+        if chunk_size is None or len(data) <= chunk_size:
+            self.pieces.append((data, cost, False))
+            return self
+
+        # Write the data in pieces without copying it
+        data = memoryview(data)
+
+        for start in range(0, len(data), chunk_size):
+            end = start + chunk_size
+            self.pieces.append((data[start:end], cost if end >= len(data) else 0.0, False))
+
+        return self
+
+    def flush(self, full=False, keep=False):
+        """
+        Sends everything queued so far to the port. full tells whether
+        the queued data redraws the whole screen. If keep is True, the data
+        has to reach the screen even if frames flushed after it redraw
+        the whole screen, eg. because it erases the screen.
+        """
+        if not self.pieces:
+            return self
+
+        self.write_chunks(self.get_chunks())
+
+        return self
+
+    def barrier(self):
+        """
+        Sends everything queued so far and waits until it has been written to the port
+        """
+        return self.flush()
+
+    def is_backlogged(self):
+        """
+        Returns True if previously flushed data is still waiting to be written
+        """
+        return False
+
+    def close(self):
+        """
+        Sends everything queued so far and stops accepting new data
+        """
+        self.barrier()
+
+    def get_chunks(self):
+        """
+        Splits everything queued so far into (chunk, cost in seconds) tuples
+        and empties the queue
+        """
+        chunk_size = self.profile.chunk_size
+
+        chunks = []
+
+        # Chunks are built in place instead of concatenating bytes
+        chunk = bytearray()
+        chunk_cost = 0.0
+
+        for data, cost, split in self.pieces:
+            if chunk_size is None:
+                chunk += data
+                chunk_cost += cost
+                continue
+
+            if not split:
+                if chunk and len(chunk) + len(data) > chunk_size:
+                    chunks.append((chunk, chunk_cost))
+                    chunk = bytearray()
+                    chunk_cost = 0.0
+
+                chunk += data
+                chunk_cost += cost
+                continue
+
+            # Split text so that it fills the remaining room in the chunks
+            byte_cost = cost / len(data)
+            start = 0
+
+            while start < len(data):
+                room = chunk_size - len(chunk)
+
+                if room <= 0:
+                    chunks.append((chunk, chunk_cost))
+                    chunk = bytearray()
+                    chunk_cost = 0.0
+                    continue
+
+                end = min(start + room, len(data))
+
+                chunk += data[start:end]
+                chunk_cost += (end - start) * byte_cost
+                start = end
+
+        if chunk:
+            chunks.append((chunk, chunk_cost))
+
+        self.pieces = []
+
+        return chunks
+
+    def write_chunks(self, chunks):
+        """
+        Writes the chunks to the port, pausing between them so that
+        the screen has time to process each chunk
+        """
+        for chunk, cost in chunks:
+            now = self.clock.monotonic()
+
+            if self.ready_at > now:
+                metrics.PACING_SECONDS.inc(self.name, amount=self.ready_at - now)
+
+                self.clock.sleep(self.ready_at - now)
+                now = self.ready_at
+
+            start = time.perf_counter()
+
+            self.port.write(chunk)
+
+            metrics.WRITE_SECONDS.observe(time.perf_counter() - start, self.name)
+            metrics.WRITTEN_BYTES.inc(self.name, amount=len(chunk))
+
+            self.ready_at = now + cost
+
+        self.port.flush()
+
+class ThreadedSerialWriter(SerialWriter):
+    # Kinds of queued blocks
+    FRAME = 0
+    FULL_FRAME = 1
+    BARRIER = 2
+
+    def __init__(self, port, profile, name="", max_frames=2):
+        """
+        SerialWriter that writes to the port from a separate thread, so that
+        the next frame can be prepared while the previous one is being sent.
+
+        max_frames: how many flushed frames can be waiting to be written
+                    before is_backlogged() returns True
+        """
+        SerialWriter.__init__(self, port, profile, name)
+
+        self.max_frames = max_frames
+
+        # (chunks, kind) tuples waiting to be written, where kind is one of
+        # FRAME, FULL_FRAME or BARRIER
+        self.blocks = collections.deque()
+        self.condition = threading.Condition()
+
+        # True while the thread is writing a block that was taken off the queue
+        self.writing = False
+        self.closed = False
+
+        # Exception raised in the thread, re-raised on the caller's thread
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, name="serial-writer", daemon=True)
+        self.thread.start()
+
+    def flush(self, full=False, keep=False):
+        """
+        Queues everything queued so far to be written by the thread. If full is True,
+        frames that haven't been written yet are dropped as they are out of date.
+        If keep is True, the data is never dropped, like with barrier(), but this
+        doesn't wait for it to be written.
+        """
+        if not self.pieces:
+            return self
+
+        if keep:
+            kind = self.BARRIER
+        else:
+            kind = self.FULL_FRAME if full else self.FRAME
+
+        self.put(self.get_chunks(), kind)
+
+        return self
+
+    def barrier(self):
+        """
+        Queues everything queued so far and waits until the thread has written
+        it and everything before it to the port
+        """
+        if self.pieces:
+            self.put(self.get_chunks(), self.BARRIER)
+
+        with self.condition:
+            while (self.blocks or self.writing) and self.error is None:
+                self.condition.wait()
+
+            self.raise_error()
+
+        return self
+
+    def is_backlogged(self):
+        """
+        Returns True if the thread has too many frames left to write
+        """
+        with self.condition:
+            return len(self.blocks) >= self.max_frames
+
+    def close(self):
+        """
+        Writes everything queued so far and stops the thread
+        """
+        self.barrier()
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        self.thread.join()
+
+    def put(self, chunks, kind):
+        """
+        Adds a block of chunks to the queue
+        """
+        with self.condition:
+            self.raise_error()
+
+            if kind == self.FULL_FRAME:
+                # Frames queued after the last barrier are replaced by this one.
+                # Anything before the barrier has to be written in order.
+                while self.blocks and self.blocks[-1][1] != self.BARRIER:
+                    self.blocks.pop()
+
+            # Never let the queue grow without limit, even if the caller
+            # doesn't check is_backlogged()
+            while len(self.blocks) >= self.max_frames and self.error is None:
+                self.condition.wait()
+
+            self.raise_error()
+
+            self.blocks.append((chunks, kind))
+            self.condition.notify_all()
+
+    def raise_error(self):
+        """
+        Re-raises an exception that happened in the thread. The condition
+        has to be held when calling this.
+        """
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.blocks and not self.closed:
+                    self.condition.wait()
+
+                if not self.blocks:
+                    return
+
+                chunks, kind = self.blocks.popleft()
+                self.writing = True
+                self.condition.notify_all()
+
+            try:
+                self.write_chunks(chunks)
+            except Exception as e:
+                with self.condition:
+                    self.error = e
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()